@@ -221,6 +221,19 @@ SELECT
 FROM produtos_top10
 ORDER BY mes_referencia DESC;
 
+-- Exemplo 5: Top 10 por ESTADO direto do mart (sem tabela de geografia)
+-- refined.mais_vendidos_mensal_estado guarda só o top REFINED_TOP_N (padrão 10)
+-- e a busca usa o índice idx_mais_vendidos_posicao (mes_ano, sgl_uf_entrega, posicao)
+SELECT 
+    posicao,
+    nome_produto,
+    total_qtd
+FROM refined.mais_vendidos_mensal_estado
+WHERE mes_ano = '2024-01-01'
+  AND sgl_uf_entrega = 'SP'
+  AND posicao <= 10
+ORDER BY posicao;
+
 
 -- =====================================================
 -- FUNÇÃO: Refresh automático
@@ -271,7 +271,8 @@ CSV Files → Trusted (validação) → Refined (agregação) → Consumo (BI)
 -- Tabela: refined.mais_vendidos_mensal_estado
 -- -----------------------------------------------------
 -- Descrição: Ranking de produtos mais vendidos por estado/mês
--- Granularidade: Uma linha por produto/estado/mês
+-- Granularidade: Uma linha por produto/estado/mês, só nas REFINED_TOP_N
+--                primeiras posições (padrão 10; 0 = todas)
 -- Atualização: Recriada a cada execução do pipeline
 -- Consumo: Dashboards de Top Produtos, Análise Regional
 -- -----------------------------------------------------
@@ -289,6 +290,8 @@ CSV Files → Trusted (validação) → Refined (agregação) → Consumo (BI)
 --   - Considera apenas itens NÃO cancelados (flg_cancelado = 'N')
 --   - Ranking usando RANK() (pode haver empates)
 --   - Ordenação por quantidade (DESC)
+--   - Corte posicao <= REFINED_TOP_N aplicado na carga (empates mantidos)
+--   - Índice idx_mais_vendidos_posicao (mes_ano, sgl_uf_entrega, posicao)
 -- -----------------------------------------------------
 -- Casos de Uso:
 --   1. Identificar produtos mais populares por região
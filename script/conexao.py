@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+from sqlalchemy import create_engine
+from dotenv import load_dotenv
+
+# =====================================================
+# 🔗 Conexão compartilhada com o PostgreSQL (RDS)
+# =====================================================
+# Um único engine por processo, criado no primeiro uso (importar um
+# script não abre conexão). Pool, timeout e application_name vêm do .env:
+#
+#   DB_POOL_SIZE             conexões mantidas no pool (padrão 5)
+#   DB_MAX_OVERFLOW          conexões extras sob demanda (padrão 10)
+#   DB_POOL_PRE_PING         testa a conexão antes de usar (padrão true)
+#   DB_STATEMENT_TIMEOUT_MS  statement_timeout da sessão, 0 = sem limite
+#   DB_APPLICATION_NAME      nome exibido em pg_stat_activity
+# =====================================================
+load_dotenv()
+
+DB_USER = os.getenv("DB_USER")
+DB_PASS = os.getenv("DB_PASS")
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = os.getenv("DB_PORT")
+DB_NAME = os.getenv("DB_NAME")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "sim")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+DB_APPLICATION_NAME = os.getenv(
+    "DB_APPLICATION_NAME",
+    f"sbf_pipeline:{os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]}"
+)
+
+_engine = None
+_engine_lock = threading.Lock()
+_local = threading.local()
+
+def get_engine():
+    """Engine compartilhado do processo, criado sob demanda"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                connect_args = {'application_name': DB_APPLICATION_NAME}
+                if DB_STATEMENT_TIMEOUT_MS > 0:
+                    connect_args['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
+
+                _engine = create_engine(
+                    f'postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}',
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_pre_ping=DB_POOL_PRE_PING,
+                    connect_args=connect_args,
+                )
+    return _engine
+
+def obter_conexao():
+    """
+    Conexão de leitura reutilizada pela thread atual (autocommit).
+
+    Evita checkout/checkin a cada consulta curta, como nas validações,
+    que executam dezenas de queries em sequência.
+    """
+    conn = getattr(_local, 'conexao', None)
+    if conn is None or conn.closed:
+        conn = get_engine().connect().execution_options(isolation_level="AUTOCOMMIT")
+        _local.conexao = conn
+    return conn
+
+def fechar_conexao():
+    """Devolve ao pool a conexão reutilizada pela thread atual"""
+    conn = getattr(_local, 'conexao', None)
+    if conn is not None and not conn.closed:
+        conn.close()
+    _local.conexao = None
@@ -2,6 +2,7 @@
 -- 1️⃣ Criação dos schemas
 CREATE SCHEMA IF NOT EXISTS trusted;
 CREATE SCHEMA IF NOT EXISTS refined;
+CREATE SCHEMA IF NOT EXISTS staging;
 
 -- =====================================================
 -- 2️⃣ Tabelas TRUSTED (baseadas no modelo original + melhorias LGPD)
@@ -73,9 +74,9 @@ CREATE TABLE IF NOT EXISTS trusted.data (
     descricao VARCHAR(50)
 );
 
--- trusted.pedido
+-- trusted.pedido (particionada por mês de data; partições criadas por script/particoes.py)
 CREATE TABLE IF NOT EXISTS trusted.pedido (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     data DATE NOT NULL,
     status VARCHAR(50) DEFAULT 'FINALIZADO',
     sgl_uf_entrega CHAR(2),
@@ -83,24 +84,32 @@ CREATE TABLE IF NOT EXISTS trusted.pedido (
     cliente_id_hash CHAR(64),
     criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_pedido PRIMARY KEY (id, data),
     CONSTRAINT fk_pedido_cliente FOREIGN KEY (cliente_id_hash) REFERENCES trusted.cliente_pseudo (cliente_id_hash),
     CONSTRAINT fk_pedido_data FOREIGN KEY (data) REFERENCES trusted.data (data),
     CONSTRAINT chk_pedido_sgl_uf_entrega CHECK (sgl_uf_entrega IS NULL OR sgl_uf_entrega ~ '^[A-Z]{2}$')
-);
-
-
+) PARTITION BY RANGE (data);
 
--- trusted.pedido_item
+-- trusted.pedido_item (particionada pela data do pedido; data_pedido é preenchida na carga)
 CREATE TABLE IF NOT EXISTS trusted.pedido_item (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     id_pedido INTEGER NOT NULL,
     id_produto INTEGER NOT NULL,
     flg_cancelado CHAR(1) DEFAULT 'N',
     qtd_produto INTEGER,
     vlr_unitario NUMERIC(10,2),
-    CONSTRAINT fk_pedidoitem_pedido FOREIGN KEY (id_pedido) REFERENCES trusted.pedido (id),
+    data_pedido DATE NOT NULL,
+    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_pedido_item PRIMARY KEY (id, data_pedido),
+    CONSTRAINT fk_pedidoitem_pedido FOREIGN KEY (id_pedido, data_pedido)
+        REFERENCES trusted.pedido (id, data) ON UPDATE CASCADE,
     CONSTRAINT fk_pedidoitem_produto FOREIGN KEY (id_produto) REFERENCES trusted.produto (id)
-);
+) PARTITION BY RANGE (data_pedido);
+
+-- Bancos criados antes das colunas de auditoria de pedido_item
+ALTER TABLE trusted.pedido_item ADD COLUMN IF NOT EXISTS criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE trusted.pedido_item ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
 
 -- trusted.meta
 CREATE TABLE IF NOT EXISTS trusted.meta (
@@ -122,11 +131,45 @@ CREATE INDEX IF NOT EXISTS idx_pedido_data_uf ON trusted.pedido (data, sgl_uf_en
 CREATE INDEX IF NOT EXISTS idx_pedido_item_produto ON trusted.pedido_item (id_produto);
 CREATE INDEX IF NOT EXISTS idx_produto_marca ON trusted.produto (id_marca);
 CREATE INDEX IF NOT EXISTS idx_produto_categoria ON trusted.produto (id_categoria);
+-- Detecção de meses alterados no refresh incremental da refined
+CREATE INDEX IF NOT EXISTS idx_pedido_alterado_em ON trusted.pedido (GREATEST(criado_em, atualizado_em));
+-- Itens de um lote de ingestão (validação por lote)
+CREATE INDEX IF NOT EXISTS idx_pedido_item_alterado_em ON trusted.pedido_item (GREATEST(criado_em, atualizado_em));
+-- pedido_item ainda não particionada (banco legado, sem data_pedido): o índice
+-- é criado por script/particoes.py --migrar junto com a tabela nova
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'trusted.pedido_item'::regclass) = 'p' THEN
+        CREATE INDEX IF NOT EXISTS idx_pedido_item_pedido ON trusted.pedido_item (id_pedido, data_pedido);
+    END IF;
+END $$;
 
 -- =====================================================
 -- 4️⃣ Tabelas REFINED (para consumo analítico)
 -- =====================================================
 
+-- Base diária compartilhada pelos marts (dia × UF × produto × marca)
+CREATE TABLE IF NOT EXISTS refined.base_vendas_diaria (
+    data DATE NOT NULL,
+    sgl_uf_entrega CHAR(2),
+    id_produto INTEGER,
+    id_marca INTEGER,
+    qtd_pedidos INTEGER,
+    qtd_pedidos_cancelamento INTEGER,
+    qtd_itens INTEGER,
+    qtd_produto BIGINT,
+    vlr_pedidos_itens NUMERIC(16,2),
+    qtd_itens_validos INTEGER,
+    qtd_produto_valido BIGINT,
+    vlr_itens_validos NUMERIC(16,2),
+    vlr_pedidos_validos NUMERIC(16,2),
+    qtd_vlr_pedidos_validos INTEGER,
+    qtd_itens_cancelamento INTEGER,
+    vlr_pedidos_cancelamento NUMERIC(16,2),
+    qtd_vlr_pedidos_cancelamento INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_base_vendas_diaria_data ON refined.base_vendas_diaria (data);
+
 CREATE TABLE IF NOT EXISTS refined.mais_vendidos_mensal_estado (
     mes_ano DATE,
     sgl_uf_entrega CHAR(2),
@@ -138,25 +181,99 @@ CREATE TABLE IF NOT EXISTS refined.mais_vendidos_mensal_estado (
     atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     CONSTRAINT pk_mais_vendidos PRIMARY KEY (mes_ano, sgl_uf_entrega, id_produto)
 );
+CREATE INDEX IF NOT EXISTS idx_mais_vendidos_produto ON refined.mais_vendidos_mensal_estado (id_produto);
+-- Top N por mês × UF (WHERE mes_ano = ... AND sgl_uf_entrega = ... AND posicao <= N ORDER BY posicao)
+CREATE INDEX IF NOT EXISTS idx_mais_vendidos_posicao ON refined.mais_vendidos_mensal_estado (mes_ano, sgl_uf_entrega, posicao);
 
-CREATE TABLE IF NOT EXISTS refined.vendas_categoria_variacao (
-    categoria VARCHAR(100),
-    mes_ano DATE,
-    total_qtd INTEGER,
-    pct_variacao NUMERIC(6,2),
+CREATE TABLE IF NOT EXISTS refined.performance_mensal_marca (
+    ano INTEGER,
+    mes INTEGER,
+    id INTEGER,
+    nome_marca VARCHAR(100),
+    vlr_total_vendido NUMERIC(16,2),
+    vlr_meta NUMERIC(12,2),
+    perc_atingimento_meta NUMERIC(12,2),
     criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_performance_mensal_marca PRIMARY KEY (ano, mes, id)
 );
+CREATE INDEX IF NOT EXISTS idx_performance_mensal_marca_id ON refined.performance_mensal_marca (id);
 
 CREATE TABLE IF NOT EXISTS refined.kpis_vendas (
     mes_ano DATE,
+    qtd_pedidos INTEGER,
     receita_bruta NUMERIC(14,2),
     ticket_medio NUMERIC(10,2),
+    qtd_cancelamentos INTEGER,
     pct_cancelamento NUMERIC(5,2),
+    qtd_produtos_distintos INTEGER,
+    qtd_itens_vendidos BIGINT,
     criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_kpis_vendas PRIMARY KEY (mes_ano)
+);
+
+CREATE TABLE IF NOT EXISTS refined.analise_cancelamentos (
+    mes_ano DATE,
+    sgl_uf_entrega CHAR(2),
+    marca VARCHAR(100),
+    qtd_pedidos_cancelados INTEGER,
+    vlr_total_cancelado NUMERIC(16,2),
+    qtd_itens_cancelados INTEGER,
+    ticket_medio_cancelado NUMERIC(12,2),
+    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_analise_cancelamentos UNIQUE (mes_ano, sgl_uf_entrega, marca)
+);
+
+CREATE TABLE IF NOT EXISTS refined.vendas_categoria_variacao (
+    mes_ano DATE,
+    categoria VARCHAR(100),
+    total_qtd INTEGER,
+    total_valor NUMERIC(16,2),
+    pct_variacao_qtd NUMERIC(12,2),
+    pct_variacao_valor NUMERIC(12,2),
+    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_vendas_categoria_variacao PRIMARY KEY (mes_ano, categoria)
+);
+
+CREATE TABLE IF NOT EXISTS refined.analise_regional (
+    mes_ano DATE,
+    sgl_uf_entrega CHAR(2),
+    qtd_pedidos INTEGER,
+    receita_total NUMERIC(16,2),
+    ticket_medio NUMERIC(12,2),
+    qtd_itens BIGINT,
+    qtd_produtos_distintos INTEGER,
+    qtd_marcas_distintas INTEGER,
+    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_analise_regional PRIMARY KEY (mes_ano, sgl_uf_entrega)
+);
+
+-- Watermark do refresh incremental de cada mart (transform_refined.py)
+CREATE TABLE IF NOT EXISTS refined.controle_incremental (
+    tabela VARCHAR(100) PRIMARY KEY,
+    watermark TIMESTAMP,
+    modo VARCHAR(20),
+    meses_recalculados INTEGER,
     atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Fatias (mart × mês) do backfill histórico da refined (backfill_refined.py)
+CREATE TABLE IF NOT EXISTS refined.controle_backfill (
+    nome VARCHAR(100) NOT NULL,
+    tabela VARCHAR(100) NOT NULL,
+    mes_ano DATE NOT NULL,
+    versao CHAR(16),
+    status VARCHAR(20),
+    duracao_s NUMERIC(10,2),
+    erro TEXT,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_controle_backfill PRIMARY KEY (nome, tabela, mes_ano)
+);
+
 -- =====================================================
 -- 5️⃣ Tabelas auxiliares e de governança
 -- =====================================================
@@ -169,6 +286,100 @@ CREATE TABLE IF NOT EXISTS trusted.log_ingestao (
     qtd_registros INTEGER
 );
 
+-- Métricas de vazão de cada carga registrada em log_ingestao
+CREATE TABLE IF NOT EXISTS trusted.log_ingestao_metricas (
+    id_log_ingestao INTEGER PRIMARY KEY REFERENCES trusted.log_ingestao(id),
+    tabela VARCHAR(100),
+    metodo VARCHAR(10),
+    chunks INTEGER,
+    linhas BIGINT,
+    bytes BIGINT,
+    duracao_total_s NUMERIC(12,3),
+    tempo_leitura_s NUMERIC(12,3),
+    tempo_normalizacao_s NUMERIC(12,3),
+    tempo_escrita_s NUMERIC(12,3),
+    tempo_merge_s NUMERIC(12,3),
+    latencia_chunk_p50_ms NUMERIC(12,1),
+    latencia_chunk_p95_ms NUMERIC(12,1),
+    linhas_por_segundo NUMERIC(14,1),
+    bytes_por_segundo NUMERIC(16,1),
+    pico_rss_mb NUMERIC(10,1)
+);
+
+-- Fingerprint do último arquivo carregado por tabela (ingestão idempotente)
+CREATE TABLE IF NOT EXISTS trusted.log_ingestao_arquivo (
+    tabela VARCHAR(100) PRIMARY KEY,
+    arquivo VARCHAR(500),
+    tamanho_bytes BIGINT,
+    modificado_em TIMESTAMP,
+    hash_sha256 CHAR(64),
+    data_ingestao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Checkpoint da carga em andamento: linhas já confirmadas em staging
+-- (gravado na mesma transação de cada chunk; removido no merge)
+CREATE TABLE IF NOT EXISTS trusted.checkpoint_ingestao (
+    tabela VARCHAR(100) PRIMARY KEY,
+    arquivo VARCHAR(500),
+    hash_sha256 CHAR(64),
+    linhas_confirmadas BIGINT NOT NULL DEFAULT 0,
+    lotes_confirmados INTEGER NOT NULL DEFAULT 0,
+    colunas TEXT,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Planos de execução capturados (EXPLAIN ANALYZE) das consultas do pipeline,
+-- com o formato do plano e a marcação de regressão em relação às execuções anteriores
+CREATE TABLE IF NOT EXISTS trusted.historico_planos (
+    id SERIAL PRIMARY KEY,
+    consulta VARCHAR(200) NOT NULL,
+    capturado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    hash_plano CHAR(16),
+    formato_plano TEXT,
+    tempo_planejamento_ms NUMERIC(14,3),
+    tempo_execucao_ms NUMERIC(14,3),
+    blocos_cache BIGINT,
+    blocos_lidos BIGINT,
+    plano JSONB,
+    regressao BOOLEAN DEFAULT FALSE,
+    motivo TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_historico_planos_consulta ON trusted.historico_planos (consulta, capturado_em);
+
+-- Execuções das validações de qualidade (completa, amostra ou lote de ingestão)
+CREATE TABLE IF NOT EXISTS trusted.qualidade_execucao (
+    id SERIAL PRIMARY KEY,
+    camada VARCHAR(20) NOT NULL,
+    escopo VARCHAR(20) NOT NULL,
+    id_log_ingestao INTEGER,
+    janela_inicio TIMESTAMP,
+    janela_fim TIMESTAMP,
+    sucessos INTEGER,
+    avisos INTEGER,
+    erros INTEGER,
+    timeouts INTEGER,
+    executado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_qualidade_execucao_escopo ON trusted.qualidade_execucao (camada, escopo, executado_em);
+
+-- Resultado de cada verificação por execução (ex: 'nulo:pedido.vlr_total'), com a consulta
+-- (grupo de regras) que a calculou e o tempo dela
+CREATE TABLE IF NOT EXISTS trusted.qualidade_dados (
+    id_execucao INTEGER NOT NULL REFERENCES trusted.qualidade_execucao(id),
+    verificacao VARCHAR(200) NOT NULL,
+    etapa VARCHAR(100),
+    status VARCHAR(10) NOT NULL,
+    violacoes BIGINT,
+    mensagem TEXT,
+    grupo VARCHAR(100),
+    duracao_ms NUMERIC(12,2),
+    CONSTRAINT pk_qualidade_dados PRIMARY KEY (id_execucao, verificacao)
+);
+
+CREATE INDEX IF NOT EXISTS idx_qualidade_dados_verificacao ON trusted.qualidade_dados (verificacao, id_execucao);
+
 CREATE TABLE IF NOT EXISTS trusted.dicionario_de_dados (
     tabela VARCHAR(100),
     coluna VARCHAR(100),
@@ -207,6 +418,12 @@ BEGIN
         FOR EACH ROW EXECUTE FUNCTION trusted.set_timestamp();
     END IF;
 
+    PERFORM 1 FROM pg_trigger WHERE tgname = 'trg_set_timestamp_pedido_item';
+    IF NOT FOUND THEN
+        CREATE TRIGGER trg_set_timestamp_pedido_item BEFORE UPDATE ON trusted.pedido_item
+        FOR EACH ROW EXECUTE FUNCTION trusted.set_timestamp();
+    END IF;
+
     PERFORM 1 FROM pg_trigger WHERE tgname = 'trg_set_timestamp_meta';
     IF NOT FOUND THEN
         CREATE TRIGGER trg_set_timestamp_meta BEFORE UPDATE ON trusted.meta
@@ -214,11 +431,91 @@ BEGIN
     END IF;
 END $$;
 
+-- Meses de onde pedidos, itens ou metas saíram (linha excluída ou data movida para outro
+-- mês, inclusive pelo merge da ingestão): o refresh incremental da refined
+-- recalcula também esses meses, que não aparecem mais nas linhas atuais.
+-- Uma linha por tabela × mês × transação (removido_em = NOW(), como atualizado_em)
+CREATE TABLE IF NOT EXISTS trusted.meses_removidos (
+    tabela VARCHAR(50) NOT NULL,
+    mes_ano DATE NOT NULL,
+    removido_em TIMESTAMP NOT NULL,
+    CONSTRAINT pk_meses_removidos PRIMARY KEY (tabela, mes_ano, removido_em)
+);
+
+CREATE INDEX IF NOT EXISTS idx_meses_removidos_removido_em ON trusted.meses_removidos (removido_em);
+
+-- TG_ARGV[0] = tabela de origem (TG_TABLE_NAME seria a partição)
+CREATE OR REPLACE FUNCTION trusted.registrar_mes_removido()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_ARGV[0] = 'meta' THEN
+        INSERT INTO trusted.meses_removidos (tabela, mes_ano, removido_em)
+        VALUES ('meta', MAKE_DATE(OLD.ano, OLD.mes, 1), NOW())
+        ON CONFLICT DO NOTHING;
+    ELSIF TG_ARGV[0] = 'pedido_item' THEN
+        INSERT INTO trusted.meses_removidos (tabela, mes_ano, removido_em)
+        VALUES ('pedido_item', DATE_TRUNC('month', OLD.data_pedido)::DATE, NOW())
+        ON CONFLICT DO NOTHING;
+    ELSE
+        INSERT INTO trusted.meses_removidos (tabela, mes_ano, removido_em)
+        VALUES (TG_ARGV[0], DATE_TRUNC('month', OLD.data)::DATE, NOW())
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Em pedido e pedido_item (particionadas por mês), mudar a data de mês move a
+-- linha de partição: o PostgreSQL dispara o AFTER DELETE na partição de origem.
+-- Em pedido_item legada (sem data_pedido) as triggers ficam para o --migrar
+DO $$
+BEGIN
+    PERFORM 1 FROM pg_trigger WHERE tgname = 'trg_mes_removido_pedido';
+    IF NOT FOUND THEN
+        CREATE TRIGGER trg_mes_removido_pedido AFTER DELETE ON trusted.pedido
+        FOR EACH ROW EXECUTE FUNCTION trusted.registrar_mes_removido('pedido');
+    END IF;
+
+    PERFORM 1 FROM pg_trigger WHERE tgname = 'trg_mes_movido_pedido';
+    IF NOT FOUND THEN
+        CREATE TRIGGER trg_mes_movido_pedido AFTER UPDATE OF data ON trusted.pedido
+        FOR EACH ROW WHEN (DATE_TRUNC('month', OLD.data) <> DATE_TRUNC('month', NEW.data))
+        EXECUTE FUNCTION trusted.registrar_mes_removido('pedido');
+    END IF;
+
+    IF (SELECT relkind FROM pg_class WHERE oid = 'trusted.pedido_item'::regclass) = 'p' THEN
+        PERFORM 1 FROM pg_trigger WHERE tgname = 'trg_mes_removido_pedido_item';
+        IF NOT FOUND THEN
+            CREATE TRIGGER trg_mes_removido_pedido_item AFTER DELETE ON trusted.pedido_item
+            FOR EACH ROW EXECUTE FUNCTION trusted.registrar_mes_removido('pedido_item');
+        END IF;
+
+        PERFORM 1 FROM pg_trigger WHERE tgname = 'trg_mes_movido_pedido_item';
+        IF NOT FOUND THEN
+            CREATE TRIGGER trg_mes_movido_pedido_item AFTER UPDATE OF data_pedido ON trusted.pedido_item
+            FOR EACH ROW WHEN (DATE_TRUNC('month', OLD.data_pedido) <> DATE_TRUNC('month', NEW.data_pedido))
+            EXECUTE FUNCTION trusted.registrar_mes_removido('pedido_item');
+        END IF;
+    END IF;
+
+    PERFORM 1 FROM pg_trigger WHERE tgname = 'trg_mes_removido_meta';
+    IF NOT FOUND THEN
+        CREATE TRIGGER trg_mes_removido_meta AFTER DELETE ON trusted.meta
+        FOR EACH ROW EXECUTE FUNCTION trusted.registrar_mes_removido('meta');
+    END IF;
+
+    PERFORM 1 FROM pg_trigger WHERE tgname = 'trg_mes_movido_meta';
+    IF NOT FOUND THEN
+        CREATE TRIGGER trg_mes_movido_meta AFTER UPDATE OF ano, mes ON trusted.meta
+        FOR EACH ROW WHEN ((OLD.ano, OLD.mes) IS DISTINCT FROM (NEW.ano, NEW.mes))
+        EXECUTE FUNCTION trusted.registrar_mes_removido('meta');
+    END IF;
+END $$;
+
 -- =====================================================
--- 7️⃣ Tratamento de nulls e atualização da dimensão de data
+-- 7️⃣ Tratamento de nulls
 -- =====================================================
 ALTER TABLE trusted.produto ALTER COLUMN descricao SET DEFAULT 'Sem descrição disponível';
 ALTER TABLE trusted.pedido ALTER COLUMN status SET DEFAULT 'FINALIZADO';
 
-SET lc_time = 'pt_BR.UTF-8';
-UPDATE trusted.data SET descricao = TO_CHAR(data, 'TMDay, DD TMMonth YYYY');
+-- trusted.data (incluindo descricao) é gerada pela ingestão: script/ingestao/dimensao_data.py
@@ -0,0 +1,155 @@
+import os
+import re
+from typing import Dict, List, Set
+
+# =====================================================
+# 📝 Leitura das definições de tabelas do ddl.sql
+# =====================================================
+# Fonte única de verdade para colunas, tipos, PKs, FKs e particionamento.
+# Usado pela ingestão (ordem de carga) e pela refined (tabelas sombra)
+# sem duplicar o DDL em Python.
+# =====================================================
+
+DDL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ddl.sql')
+
+_RE_CREATE_TABLE = re.compile(
+    r'CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS\s+(\w+)\.(\w+)\s*\((.*?)\n\)'
+    r'(?:\s*PARTITION\s+BY\s+RANGE\s*\((\w+)\))?;',
+    re.IGNORECASE | re.DOTALL
+)
+_RE_REFERENCES = re.compile(r'REFERENCES\s+(\w+)\.(\w+)', re.IGNORECASE)
+_RE_PK_CONSTRAINT = re.compile(r'PRIMARY\s+KEY\s*\(([^)]*)\)', re.IGNORECASE)
+_PALAVRAS_FIM_TIPO = {'PRIMARY', 'NOT', 'NULL', 'DEFAULT', 'REFERENCES', 'UNIQUE', 'CHECK', 'CONSTRAINT'}
+
+_cache: Dict[str, Dict[str, dict]] = {}
+
+def _remover_comentarios(sql: str) -> str:
+    return re.sub(r'--[^\n]*', '', sql)
+
+def _separar_definicoes(corpo: str) -> List[str]:
+    """Separa o corpo do CREATE TABLE por vírgulas de nível zero (ignora NUMERIC(12,2), CHECK (...))"""
+    partes, atual, nivel = [], [], 0
+    for caractere in corpo:
+        if caractere == '(':
+            nivel += 1
+        elif caractere == ')':
+            nivel -= 1
+        if caractere == ',' and nivel == 0:
+            partes.append(''.join(atual).strip())
+            atual = []
+        else:
+            atual.append(caractere)
+    if ''.join(atual).strip():
+        partes.append(''.join(atual).strip())
+    return [' '.join(p.split()) for p in partes if p]
+
+def _parse_tabela(schema: str, nome: str, corpo: str, particao: str = '') -> dict:
+    tabela = {
+        'schema': schema,
+        'nome': nome,
+        'colunas': {},
+        'pk': [],
+        'fks': {},
+        'particao': particao or None,
+    }
+
+    for definicao in _separar_definicoes(corpo):
+        primeira = definicao.split()[0].upper()
+
+        if primeira == 'CONSTRAINT':
+            pk = _RE_PK_CONSTRAINT.search(definicao)
+            if pk and 'FOREIGN' not in definicao.upper():
+                tabela['pk'] = [c.strip() for c in pk.group(1).split(',')]
+            ref = _RE_REFERENCES.search(definicao)
+            if ref:
+                origem = re.search(r'FOREIGN\s+KEY\s*\(([^)]*)\)', definicao, re.IGNORECASE)
+                colunas = tuple(c.strip() for c in origem.group(1).split(','))
+                tabela['fks'][colunas] = f'{ref.group(1)}.{ref.group(2)}'
+            continue
+
+        # Definição de coluna: nome TIPO [restrições...]
+        tokens = definicao.split()
+        coluna = tokens[0]
+        tipo = []
+        for token in tokens[1:]:
+            if token.upper() in _PALAVRAS_FIM_TIPO:
+                break
+            tipo.append(token)
+        tabela['colunas'][coluna] = ' '.join(tipo).upper()
+
+        if re.search(r'\bPRIMARY\s+KEY\b', definicao, re.IGNORECASE):
+            tabela['pk'] = [coluna]
+        ref = _RE_REFERENCES.search(definicao)
+        if ref:
+            tabela['fks'][(coluna,)] = f'{ref.group(1)}.{ref.group(2)}'
+
+    return tabela
+
+def carregar_tabelas(ddl_path: str = DDL_PATH) -> Dict[str, dict]:
+    """
+    Retorna {'schema.tabela': {colunas, pk, fks, particao}} para cada CREATE TABLE
+    do DDL; particao é a coluna de PARTITION BY RANGE (ou None)
+    """
+    if ddl_path not in _cache:
+        with open(ddl_path, encoding='utf-8') as f:
+            sql = _remover_comentarios(f.read())
+        _cache[ddl_path] = {
+            f'{schema}.{nome}': _parse_tabela(schema, nome, corpo, particao)
+            for schema, nome, corpo, particao in _RE_CREATE_TABLE.findall(sql)
+        }
+    return _cache[ddl_path]
+
+def ddl_tabela(tabela: str, ddl_path: str = DDL_PATH) -> List[str]:
+    """CREATE TABLE de 'schema.tabela' no ddl.sql seguido dos CREATE INDEX sobre ela"""
+    with open(ddl_path, encoding='utf-8') as f:
+        sql = _remover_comentarios(f.read())
+
+    schema, nome = tabela.split('.', 1)
+    comandos = [
+        m.group(0) for m in _RE_CREATE_TABLE.finditer(sql)
+        if (m.group(1), m.group(2)) == (schema, nome)
+    ]
+    if not comandos:
+        raise KeyError(f"Tabela {tabela} não declarada em {ddl_path}")
+
+    indices = re.finditer(
+        rf'CREATE\s+(?:UNIQUE\s+)?INDEX\s+IF\s+NOT\s+EXISTS\s+\w+\s+ON\s+{schema}\.{nome}\b[^;]*;',
+        sql, re.IGNORECASE
+    )
+    return comandos + [m.group(0) for m in indices]
+
+def ddl_triggers(tabela: str, ddl_path: str = DDL_PATH) -> List[str]:
+    """CREATE TRIGGER de 'schema.tabela' no ddl.sql precedidos das funções que eles executam"""
+    with open(ddl_path, encoding='utf-8') as f:
+        sql = _remover_comentarios(f.read())
+
+    schema, nome = tabela.split('.', 1)
+    triggers = [
+        m.group(0) for m in re.finditer(
+            rf'CREATE\s+TRIGGER\s+\w+\s+(?:BEFORE|AFTER)\s[^;]*?\bON\s+{schema}\.{nome}\b[^;]*;',
+            sql, re.IGNORECASE
+        )
+    ]
+    funcoes = []
+    for trigger in triggers:
+        funcao = re.search(r'EXECUTE\s+FUNCTION\s+(\w+\.\w+)\(', trigger, re.IGNORECASE).group(1)
+        definicao = re.search(
+            rf'CREATE\s+OR\s+REPLACE\s+FUNCTION\s+{re.escape(funcao)}\(\).*?\$\$\s+LANGUAGE\s+\w+;',
+            sql, re.IGNORECASE | re.DOTALL
+        ).group(0)
+        if definicao not in funcoes:
+            funcoes.append(definicao)
+    return funcoes + triggers
+
+def dependencias_fk(schema: str = 'trusted', ddl_path: str = DDL_PATH) -> Dict[str, Set[str]]:
+    """Grafo de dependências entre tabelas do schema: {tabela: {tabelas referenciadas}}"""
+    grafo = {}
+    for tabela in carregar_tabelas(ddl_path).values():
+        if tabela['schema'] != schema:
+            continue
+        grafo[tabela['nome']] = {
+            referencia.split('.', 1)[1]
+            for referencia in tabela['fks'].values()
+            if referencia.startswith(f'{schema}.') and referencia != f'{schema}.{tabela["nome"]}'
+        }
+    return grafo
@@ -0,0 +1,99 @@
+import argparse
+import os
+import time
+from sqlalchemy import text
+
+from load_data_rds import COLUNAS_DERIVADAS, load_file_to_postgres
+from conexao import get_engine
+
+# =====================================================
+# 🏎️ Benchmark de ingestão: COPY vs INSERT (execute_values)
+# =====================================================
+# Carrega o mesmo arquivo em uma cópia da tabela trusted (schema benchmark,
+# sem FKs/índices) com cada método e compara linhas/segundo.
+#
+# Uso:
+#   python script/ingestao/benchmark_ingestao.py \
+#       --arquivo ./data/trusted/pedido_item.csv --tabela pedido_item
+# =====================================================
+
+SCHEMA_BENCHMARK = 'benchmark'
+METODOS = ('insert', 'copy')
+
+def preparar_tabela(tabela: str):
+    """Cria benchmark.{tabela} com a mesma estrutura de trusted.{tabela}"""
+    with get_engine().begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_BENCHMARK};"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {SCHEMA_BENCHMARK}.{tabela};"))
+        conn.execute(text(
+            f"CREATE TABLE {SCHEMA_BENCHMARK}.{tabela} (LIKE trusted.{tabela} INCLUDING DEFAULTS);"
+        ))
+        # Colunas preenchidas no merge da trusted (ex: data_pedido) não vêm no arquivo
+        for coluna in COLUNAS_DERIVADAS.get(tabela, {}):
+            conn.execute(text(f'ALTER TABLE {SCHEMA_BENCHMARK}.{tabela} ALTER COLUMN "{coluna}" DROP NOT NULL;'))
+
+def limpar_tabela(tabela: str):
+    with get_engine().begin() as conn:
+        conn.execute(text(f"TRUNCATE TABLE {SCHEMA_BENCHMARK}.{tabela};"))
+
+def remover_tabela(tabela: str):
+    with get_engine().begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {SCHEMA_BENCHMARK}.{tabela};"))
+
+def executar_benchmark(arquivo: str, tabela: str, chunksize: int, repeticoes: int):
+    preparar_tabela(tabela)
+    resultados = {}
+
+    try:
+        for metodo in METODOS:
+            tempos = []
+            for _ in range(repeticoes):
+                limpar_tabela(tabela)
+                inicio = time.perf_counter()
+                linhas = load_file_to_postgres(
+                    arquivo, tabela,
+                    schema=SCHEMA_BENCHMARK,
+                    chunksize=chunksize,
+                    method=metodo,
+                    register_log=False,
+                    idempotent=False
+                )
+                tempos.append(time.perf_counter() - inicio)
+
+            melhor = min(tempos)
+            resultados[metodo] = {
+                'linhas': linhas,
+                'segundos': melhor,
+                'linhas_por_segundo': linhas / melhor if melhor > 0 else 0,
+            }
+    finally:
+        remover_tabela(tabela)
+
+    return resultados
+
+def imprimir_resultados(tabela: str, resultados: dict):
+    print("\n" + "="*60)
+    print(f"🏁 RESULTADO DO BENCHMARK: {tabela}")
+    print("="*60)
+    print(f"{'Método':<10}{'Linhas':>14}{'Segundos':>12}{'Linhas/s':>16}")
+    for metodo, r in resultados.items():
+        print(f"{metodo:<10}{r['linhas']:>14,}{r['segundos']:>12.2f}{r['linhas_por_segundo']:>16,.0f}")
+
+    if resultados.get('insert', {}).get('linhas_por_segundo'):
+        ganho = resultados['copy']['linhas_por_segundo'] / resultados['insert']['linhas_por_segundo']
+        print(f"\n🚀 COPY foi {ganho:.1f}x mais rápido que INSERT")
+    print("="*60)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de ingestão COPY vs INSERT')
+    parser.add_argument('--arquivo', required=True, help='Arquivo a carregar (.csv, .csv.gz, .csv.zst ou .parquet)')
+    parser.add_argument('--tabela', required=True, help='Tabela trusted de referência (ex: pedido_item)')
+    parser.add_argument('--chunksize', type=int, default=5000)
+    parser.add_argument('--repeticoes', type=int, default=3, help='Execuções por método (usa a melhor)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.arquivo):
+        raise SystemExit(f"❌ Arquivo não encontrado: {args.arquivo}")
+
+    resultados = executar_benchmark(args.arquivo, args.tabela, args.chunksize, args.repeticoes)
+    imprimir_resultados(args.tabela, resultados)
@@ -0,0 +1,97 @@
+import os
+from datetime import date
+import numpy as np
+import pandas as pd
+
+# =====================================================
+# 📅 Gerador da dimensão trusted.data
+# =====================================================
+# Gera ano/mes/dia/descricao para qualquer intervalo em uma única passada
+# vetorizada, sem CSV de origem e sem depender do locale do servidor
+# (substitui o SET lc_time + UPDATE ... TO_CHAR pós-carga).
+#
+# descricao segue o formato 'TMDay, DD TMMonth YYYY' do PostgreSQL:
+#   pt_BR → 'Segunda-feira, 01 Janeiro 2024'
+#   en_US → 'Monday, 01 January 2024'
+# =====================================================
+
+DATE_LANG = os.getenv("DATE_LANG", "pt_BR")
+
+# 🗓️ Intervalo mínimo da dimensão (pode ser sobrescrito no .env); a ingestão
+#    o estende em anos inteiros até as datas de pedido e meta dos arquivos
+DIM_DATA_INICIO = os.getenv("DIM_DATA_INICIO", "2020-01-01")
+DIM_DATA_FIM = os.getenv("DIM_DATA_FIM", f"{date.today().year + 1}-12-31")
+
+# Índice 0 = segunda-feira (convenção do pandas: dayofweek)
+NOMES_DIAS = {
+    'pt_BR': ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira',
+              'Sábado', 'Domingo'],
+    'en_US': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+}
+
+NOMES_MESES = {
+    'pt_BR': ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+              'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'],
+    'en_US': ['January', 'February', 'March', 'April', 'May', 'June',
+              'July', 'August', 'September', 'October', 'November', 'December'],
+}
+
+def descrever_datas(datas, idioma=DATE_LANG):
+    """Descrição textual ('Segunda-feira, 01 Janeiro 2024') para um DatetimeIndex/Series de datas"""
+    if idioma not in NOMES_DIAS:
+        raise ValueError(f"Idioma não suportado: {idioma} (use {', '.join(NOMES_DIAS)})")
+
+    datas = pd.DatetimeIndex(datas)
+    dias = np.array(NOMES_DIAS[idioma], dtype=object)[datas.dayofweek]
+    meses = np.array(NOMES_MESES[idioma], dtype=object)[datas.month - 1]
+    return (
+        pd.Series(dias) + ', '
+        + pd.Series(datas.strftime('%d')) + ' '
+        + pd.Series(meses) + ' '
+        + pd.Series(datas.year.astype(str))
+    ).to_numpy()
+
+def gerar_dimensao_data(inicio=DIM_DATA_INICIO, fim=DIM_DATA_FIM, idioma=DATE_LANG):
+    """DataFrame com as colunas de trusted.data para todos os dias entre inicio e fim (inclusive)"""
+    datas = pd.date_range(inicio, fim, freq='D')
+    return pd.DataFrame({
+        'data': datas,
+        'ano': datas.year.astype('Int32'),
+        'mes': datas.month.astype('Int32'),
+        'dia': datas.day.astype('Int32'),
+        'descricao': descrever_datas(datas, idioma),
+    })
+
+def _completar_descricao_arrow(lote, idioma):
+    """completar_descricao para um RecordBatch Arrow (trusted.data em Parquet)"""
+    import pyarrow as pa
+
+    nomes = lote.schema.names
+    if 'data' not in nomes:
+        return lote
+    if 'descricao' in nomes and lote.column(nomes.index('descricao')).null_count == 0:
+        return lote
+
+    descricoes = pd.Series(descrever_datas(lote.column(nomes.index('data')).to_pandas(), idioma))
+    colunas = list(lote.columns)
+    if 'descricao' in nomes:
+        atuais = lote.column(nomes.index('descricao')).to_pandas()
+        colunas[nomes.index('descricao')] = pa.array(atuais.where(atuais.notna(), descricoes), pa.string())
+    else:
+        colunas.append(pa.array(descricoes, pa.string()))
+        nomes = nomes + ['descricao']
+    return pa.RecordBatch.from_arrays(colunas, names=nomes)
+
+def completar_descricao(chunk, idioma=DATE_LANG):
+    """Preenche descricao ausente/nula em um chunk de trusted.data vindo de arquivo (DataFrame ou lote Arrow)"""
+    if not isinstance(chunk, pd.DataFrame):
+        return _completar_descricao_arrow(chunk, idioma)
+    if 'data' not in chunk.columns:
+        return chunk
+    if 'descricao' not in chunk.columns:
+        chunk['descricao'] = descrever_datas(chunk['data'], idioma)
+        return chunk
+    faltantes = chunk['descricao'].isna()
+    if faltantes.any():
+        chunk.loc[faltantes, 'descricao'] = descrever_datas(chunk.loc[faltantes, 'data'], idioma)
+    return chunk
@@ -0,0 +1,336 @@
+import os
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from esquema_ddl import carregar_tabelas
+
+# =====================================================
+# 📖 Leitura tipada dos arquivos fonte (tipos do ddl.sql)
+# =====================================================
+# Formatos aceitos (lidos em lotes, memória limitada ao chunksize):
+#   .csv, .csv.gz, .csv.zst → pandas, em chunks
+#   .parquet                → pyarrow, RecordBatches enviados direto ao COPY
+#
+# Em vez de deixar o pandas inferir os tipos a cada chunk, os tipos
+# vêm das colunas declaradas no ddl.sql:
+#   INTEGER/SERIAL     → Int32 / Int64 (nulos sem virar float)
+#   NUMERIC(p,s)       → lido como texto e escalado em aritmética inteira
+#                        (ex: centavos), sem passar por float
+#   DATE/TIMESTAMP     → datetime64
+#   colunas de domínio → category (status, flg_cancelado, sgl_uf_entrega)
+#   demais textos      → string
+# =====================================================
+
+# 🧩 Normalização de colunas por tabela (nome no CSV → nome no DDL)
+RENOMEACOES_COLUNAS = {
+    'meta': {'vlr_meta': 'valor'},
+    'produto': {'idMarca': 'id_marca'},
+}
+
+# 🏷️ Colunas de baixa cardinalidade lidas como categóricas
+COLUNAS_CATEGORICAS = {'status', 'flg_cancelado', 'sgl_uf_entrega'}
+
+_RE_NUMERIC = re.compile(r'(?:NUMERIC|DECIMAL)\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)')
+
+try:
+    import pyarrow  # noqa: F401
+    _TIPO_TEXTO = 'string[pyarrow]'
+except ImportError:
+    _TIPO_TEXTO = 'string'
+
+def normalizar_colunas(chunk, table_name):
+    """Renomeia as colunas do chunk para os nomes definidos no ddl.sql"""
+    renomear = {
+        origem: destino
+        for origem, destino in RENOMEACOES_COLUNAS.get(table_name, {}).items()
+        if origem in chunk.columns
+    }
+    if renomear:
+        chunk = chunk.rename(columns=renomear)
+    return chunk
+
+@lru_cache(maxsize=None)
+def schema_leitura(table_name, schema='trusted'):
+    """
+    Deriva do ddl.sql os tipos de leitura da tabela.
+
+    Retorna {'dtypes': {coluna_csv: dtype}, 'datas': [coluna], 'decimais': {coluna: escala}}
+    com `dtypes` nos nomes do CSV e `datas`/`decimais` nos nomes do DDL.
+    """
+    definicao = carregar_tabelas().get(f'{schema}.{table_name}')
+    if definicao is None:
+        return {'dtypes': {}, 'datas': [], 'decimais': {}}
+
+    nome_no_csv = {destino: origem for origem, destino in RENOMEACOES_COLUNAS.get(table_name, {}).items()}
+    dtypes, datas, decimais = {}, [], {}
+
+    for coluna, tipo in definicao['colunas'].items():
+        numeric = _RE_NUMERIC.match(tipo)
+        if tipo in ('SERIAL', 'INTEGER', 'INT', 'SMALLINT'):
+            dtype = 'Int32'
+        elif tipo in ('BIGSERIAL', 'BIGINT'):
+            dtype = 'Int64'
+        elif numeric:
+            dtype = _TIPO_TEXTO
+            decimais[coluna] = int(numeric.group(2))
+        elif tipo in ('DATE', 'TIMESTAMP'):
+            dtype = _TIPO_TEXTO
+            datas.append(coluna)
+        elif tipo == 'BOOLEAN':
+            dtype = 'boolean'
+        elif coluna in COLUNAS_CATEGORICAS:
+            dtype = 'category'
+        else:
+            dtype = _TIPO_TEXTO
+        dtypes[nome_no_csv.get(coluna, coluna)] = dtype
+
+    return {'dtypes': dtypes, 'datas': datas, 'decimais': decimais}
+
+def escalar_decimal(serie, escala):
+    """
+    Texto decimal → Int64 escalado ('123.455', 2 → 12346), em aritmética
+    inteira e arredondando a metade para longe do zero, como o NUMERIC.
+    Valores fora do formato [+-]123.45 (ex: notação científica) ou longos
+    demais para int64 passam pelo Decimal, um a um.
+    """
+    texto = serie.astype(_TIPO_TEXTO).str.strip()
+    simples = (texto.str.fullmatch(r'[+-]?(?:\d+\.?\d*|\.\d+)').fillna(False)
+               & texto.str.len().le(18 - escala).fillna(False))
+
+    resultado = pd.Series(pd.NA, index=serie.index, dtype='Int64')
+    if simples.any():
+        valores = texto[simples]
+        ponto = valores.str.find('.')
+        casas = (valores.str.len() - ponto - 1).where(ponto >= 0, 0).to_numpy('int64')
+        digitos = valores.str.replace('.', '', regex=False).astype('int64').to_numpy()
+        # Mais casas que a escala: divide e arredonda pelo resto; menos: completa com zeros
+        divisor = 10 ** np.maximum(casas - escala, 0)
+        quociente, resto = np.divmod(np.abs(digitos), divisor)
+        magnitude = quociente * 10 ** np.maximum(escala - casas, 0) + (2 * resto >= divisor)
+        resultado[simples] = np.where(digitos < 0, -magnitude, magnitude)
+
+    outros = texto.notna() & ~simples
+    if outros.any():
+        resultado[outros] = [_escalar_decimal_texto(valor, escala) for valor in texto[outros]]
+    return resultado
+
+def _escalar_decimal_texto(valor, escala):
+    try:
+        return int((Decimal(valor) * 10 ** escala).to_integral_value(ROUND_HALF_UP))
+    except (ArithmeticError, ValueError):
+        raise ValueError(f"Valor NUMERIC inválido: {valor!r}")
+
+def _tipar_chunk(chunk, leitura):
+    for coluna in leitura['datas']:
+        if coluna in chunk.columns:
+            chunk[coluna] = pd.to_datetime(chunk[coluna], format='ISO8601')
+    for coluna, escala in leitura['decimais'].items():
+        if coluna in chunk.columns:
+            chunk[coluna] = escalar_decimal(chunk[coluna], escala)
+    return chunk
+
+def pico_rss_mb():
+    """Pico de memória residente do processo até agora (MB), se disponível"""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+
+# 🗂️ Extensões suportadas → (formato, compressão)
+FORMATOS = {
+    '.parquet': ('parquet', None),
+    '.pq': ('parquet', None),
+    '.csv.zst': ('csv', 'zstd'),
+    '.csv.zstd': ('csv', 'zstd'),
+    '.csv.gz': ('csv', 'gzip'),
+    '.csv': ('csv', None),
+}
+
+def detectar_formato(caminho):
+    """Retorna (formato, compressão) a partir da extensão do arquivo"""
+    nome = caminho.lower()
+    for extensao, formato in FORMATOS.items():
+        if nome.endswith(extensao):
+            return formato
+    raise ValueError(f"Formato de arquivo não suportado: {caminho} (use {', '.join(FORMATOS)})")
+
+def localizar_arquivo(base_path, table_name):
+    """Primeiro arquivo existente para a tabela, na ordem de FORMATOS (.csv se nenhum existir)"""
+    for extensao in FORMATOS:
+        caminho = f'{base_path}/{table_name}{extensao}'
+        if os.path.exists(caminho):
+            return caminho
+    return f'{base_path}/{table_name}.csv'
+
+def ler_csv_tipado(csv_path, table_name, chunksize=5000, schema='trusted', compression='infer',
+                   pular_linhas=0):
+    """
+    Lê o CSV em chunks com os tipos do ddl.sql, já com as colunas normalizadas.
+
+    pular_linhas descarta as primeiras N linhas de dados (retomada de carga);
+    o cabeçalho é mantido.
+
+    Gera (chunk, stats) com stats = {'linhas', 'memoria_mb', 'pico_rss_mb',
+    'tempo_leitura_s', 'tempo_normalizacao_s'}.
+    """
+    leitura = schema_leitura(table_name, schema)
+    pular = range(1, pular_linhas + 1) if pular_linhas else None
+    leitor = iter(pd.read_csv(
+        csv_path, chunksize=chunksize, dtype=leitura['dtypes'], compression=compression, skiprows=pular
+    ))
+    while True:
+        inicio = time.perf_counter()
+        chunk = next(leitor, None)
+        if chunk is None:
+            return
+        lido = time.perf_counter()
+        chunk = _tipar_chunk(normalizar_colunas(chunk, table_name), leitura)
+        stats = {
+            'linhas': len(chunk),
+            'memoria_mb': chunk.memory_usage(deep=True).sum() / 1024 ** 2,
+            'pico_rss_mb': pico_rss_mb(),
+            'tempo_leitura_s': lido - inicio,
+            'tempo_normalizacao_s': time.perf_counter() - lido,
+        }
+        yield chunk, stats
+
+def ler_parquet(caminho, table_name, chunksize=5000, pular_linhas=0):
+    """
+    Lê o Parquet em RecordBatches de até `chunksize` linhas, com as colunas
+    normalizadas. Os lotes seguem como Arrow até o COPY (sem objetos Python).
+
+    pular_linhas descarta as primeiras N linhas: row groups inteiros são
+    ignorados pelos metadados, sem leitura; o restante é fatiado no lote.
+
+    Gera (lote, stats) como em ler_csv_tipado.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Leitura de Parquet requer o pacote pyarrow (pip install pyarrow)")
+
+    renomear = RENOMEACOES_COLUNAS.get(table_name, {})
+    arquivo = pq.ParquetFile(caminho)
+
+    primeiro_grupo = 0
+    while (primeiro_grupo < arquivo.num_row_groups
+           and pular_linhas >= arquivo.metadata.row_group(primeiro_grupo).num_rows):
+        pular_linhas -= arquivo.metadata.row_group(primeiro_grupo).num_rows
+        primeiro_grupo += 1
+    if primeiro_grupo == arquivo.num_row_groups:
+        return
+
+    grupos = list(range(primeiro_grupo, arquivo.num_row_groups))
+    leitor = arquivo.iter_batches(batch_size=chunksize, row_groups=grupos)
+    while True:
+        inicio = time.perf_counter()
+        lote = next(leitor, None)
+        if lote is None:
+            return
+        if pular_linhas:
+            descartar = min(pular_linhas, lote.num_rows)
+            lote = lote.slice(descartar)
+            pular_linhas -= descartar
+            if lote.num_rows == 0:
+                continue
+        lido = time.perf_counter()
+        nomes = [renomear.get(nome, nome) for nome in lote.schema.names]
+        lote = pa.RecordBatch.from_arrays(lote.columns, names=nomes)
+        stats = {
+            'linhas': lote.num_rows,
+            'memoria_mb': lote.nbytes / 1024 ** 2,
+            'pico_rss_mb': pico_rss_mb(),
+            'tempo_leitura_s': lido - inicio,
+            'tempo_normalizacao_s': time.perf_counter() - lido,
+        }
+        yield lote, stats
+
+def ler_lotes(caminho, table_name, chunksize=5000, schema='trusted', pular_linhas=0):
+    """Leitor em lotes para qualquer formato suportado (ver FORMATOS)"""
+    formato, compressao = detectar_formato(caminho)
+    if formato == 'parquet':
+        return ler_parquet(caminho, table_name, chunksize, pular_linhas)
+    return ler_csv_tipado(caminho, table_name, chunksize, schema, compression=compressao,
+                          pular_linhas=pular_linhas)
+
+def min_max_colunas(caminho, table_name, colunas, chunksize=100000, schema='trusted'):
+    """
+    {coluna: (menor, maior)} lendo só as colunas pedidas (nomes do DDL), em
+    chunks no CSV e pelas colunas do Parquet. Colunas ausentes no arquivo ou
+    só com nulos ficam de fora.
+    """
+    nome_no_arquivo = {c: c for c in colunas}
+    for origem, destino in RENOMEACOES_COLUNAS.get(table_name, {}).items():
+        if destino in nome_no_arquivo:
+            nome_no_arquivo[destino] = origem
+
+    formato, compressao = detectar_formato(caminho)
+    if formato == 'parquet':
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        arquivo = pq.ParquetFile(caminho)
+        presentes = [c for c in colunas if nome_no_arquivo[c] in arquivo.schema_arrow.names]
+        tabela = arquivo.read(columns=[nome_no_arquivo[c] for c in presentes])
+        faixas = {}
+        for coluna in presentes:
+            faixa = pc.min_max(tabela.column(nome_no_arquivo[coluna])).as_py()
+            if faixa['min'] is not None:
+                faixas[coluna] = (faixa['min'], faixa['max'])
+        return faixas
+
+    leitura = schema_leitura(table_name, schema)
+    cabecalho = pd.read_csv(caminho, nrows=0, compression=compressao).columns
+    usar = [nome_no_arquivo[c] for c in colunas if nome_no_arquivo[c] in cabecalho]
+    faixas = {}
+    for chunk in pd.read_csv(caminho, usecols=usar, chunksize=chunksize, compression=compressao,
+                             dtype={c: t for c, t in leitura['dtypes'].items() if c in usar}):
+        chunk = _tipar_chunk(normalizar_colunas(chunk, table_name), leitura)
+        for coluna in chunk.columns:
+            menor, maior = chunk[coluna].min(), chunk[coluna].max()
+            if pd.isna(menor):
+                continue
+            if coluna in faixas:
+                menor, maior = min(faixas[coluna][0], menor), max(faixas[coluna][1], maior)
+            faixas[coluna] = (menor, maior)
+    return faixas
+
+# =====================================================
+# ✍️ Conversão dos tipos de leitura para escrita no banco
+# =====================================================
+def _formatar_decimal(serie, escala):
+    """Inteiro escalado → texto decimal exato (12345, 2 → '123.45')"""
+    if escala == 0:
+        return serie.astype('string')
+    fator = 10 ** escala
+    absoluto = serie.abs()
+    sinal = serie.lt(0).fillna(False).map({True: '-', False: ''}).astype('string')
+    inteiro = (absoluto // fator).astype('string')
+    fracao = (absoluto % fator).astype('string').str.zfill(escala)
+    return sinal + inteiro + '.' + fracao
+
+def preparar_para_escrita(chunk, table_name, schema='trusted'):
+    """Converte decimais escalados e datas do chunk tipado em texto aceito por COPY/INSERT"""
+    leitura = schema_leitura(table_name, schema)
+    chunk = chunk.copy()
+    for coluna, escala in leitura['decimais'].items():
+        if coluna in chunk.columns:
+            chunk[coluna] = _formatar_decimal(chunk[coluna], escala)
+    colunas_ddl = carregar_tabelas().get(f'{schema}.{table_name}', {}).get('colunas', {})
+    for coluna in leitura['datas']:
+        if coluna in chunk.columns and colunas_ddl.get(coluna) == 'DATE':
+            chunk[coluna] = chunk[coluna].dt.strftime('%Y-%m-%d')
+    return chunk
@@ -1,88 +1,742 @@
+import hashlib
+import io
+import json
 import os
+import sys
+import threading
+import time
 import pandas as pd
-from sqlalchemy import create_engine, text
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from psycopg2.extras import execute_values
+from sqlalchemy import text
 from datetime import datetime
-from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conexao import DB_USER, get_engine
+from esquema_ddl import carregar_tabelas, dependencias_fk
+from particoes import garantir_particoes, garantir_particoes_futuras, tabelas_particionadas
+from planos import executar
+from leitores import ler_lotes, localizar_arquivo, min_max_colunas, pico_rss_mb, preparar_para_escrita
+from dimensao_data import DIM_DATA_FIM, DIM_DATA_INICIO, completar_descricao, gerar_dimensao_data
 
 # =====================================================
-# 1️⃣ Carregar variáveis de ambiente (.env)
+# 1️⃣ Configurações (.env carregado por conexao.py)
 # =====================================================
-load_dotenv()
-
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-
 # 🌐 Idioma padrão para formatação de datas (pode ser 'pt_BR' ou 'en_US')
 DATE_LANG = os.getenv("DATE_LANG", "pt_BR")
 
+# 🚚 Método de carga padrão: 'copy' (COPY ... FROM STDIN) ou 'insert' (INSERT ... VALUES em lotes)
+LOAD_METHOD = os.getenv("LOAD_METHOD", "copy")
+
+# 🧵 Nº de tabelas carregadas em paralelo (cada worker usa sua própria conexão do pool;
+#    mantenha DB_POOL_SIZE + DB_MAX_OVERFLOW >= INGESTAO_WORKERS)
+INGESTAO_WORKERS = int(os.getenv("INGESTAO_WORKERS", "4"))
+
+# ♻️ Carga idempotente: pula arquivos inalterados e faz upsert via staging
+INGESTAO_IDEMPOTENTE = os.getenv("INGESTAO_IDEMPOTENTE", "true").lower() in ("1", "true", "sim")
+SCHEMA_STAGING = 'staging'
+
+# ⚡ Fast-load (backfills): staging UNLOGGED, índices e FKs/CHECKs adiados
+INGESTAO_FAST_LOAD = os.getenv("INGESTAO_FAST_LOAD", "false").lower() in ("1", "true", "sim")
+INGESTAO_MAINTENANCE_WORK_MEM = os.getenv("INGESTAO_MAINTENANCE_WORK_MEM", "512MB")
+
+# 📏 Arquivo JSON Lines com o resumo de métricas de cada carga ('' desativa)
+INGESTAO_METRICAS_ARQUIVO = os.getenv("INGESTAO_METRICAS_ARQUIVO", "./logs/metricas_ingestao.jsonl")
+_metricas_lock = threading.Lock()
+
+# =====================================================
+# 2️⃣ Conexão: engine compartilhado e criado sob demanda (script/conexao.py)
+# =====================================================
+# Cada worker faz checkout de uma conexão do pool via get_engine(); nenhuma
+# conexão é aberta só por importar este módulo (ex: benchmark_ingestao.py).
+
+# =====================================================
+# 3️⃣ Função de carga arquivo (CSV/Parquet) → PostgreSQL
+# =====================================================
+
+def _corrigir_inteiros(chunk):
+    """Colunas inteiras com NaN viram float no pandas ('1.0'), o que o COPY rejeita"""
+    for coluna in chunk.select_dtypes(include='float').columns:
+        valores = chunk[coluna].dropna()
+        if (valores == valores.round()).all():
+            chunk[coluna] = chunk[coluna].astype('Int64')
+    return chunk
+
+# Cada função de envio retorna o volume enviado em bytes (métricas de vazão)
+
+def copy_chunk(cursor, chunk, table_name, schema='trusted'):
+    """Envia o chunk para o banco via COPY ... FROM STDIN (formato CSV)"""
+    texto = io.StringIO()
+    _corrigir_inteiros(chunk).to_csv(texto, index=False, header=False)
+    payload = texto.getvalue().encode('utf-8')
+
+    colunas = ', '.join(f'"{coluna}"' for coluna in chunk.columns)
+    cursor.copy_expert(
+        f'COPY {schema}.{table_name} ({colunas}) FROM STDIN WITH (FORMAT csv)',
+        io.BytesIO(payload)
+    )
+    return len(payload)
+
+def insert_chunk(cursor, chunk, table_name, schema='trusted'):
+    """
+    Envia o chunk com INSERT ... VALUES de várias linhas (execute_values, 1000
+    por comando), o mesmo que o DataFrame.to_sql faz com o psycopg2
+    """
+    colunas = ', '.join(f'"{coluna}"' for coluna in chunk.columns)
+    linhas = chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+    execute_values(
+        cursor,
+        f'INSERT INTO {schema}.{table_name} ({colunas}) VALUES %s',
+        list(linhas),
+        page_size=1000
+    )
+    # Sem payload único: usa o tamanho do chunk em memória como aproximação
+    return int(chunk.memory_usage(deep=True, index=False).sum())
+
+def copy_record_batch(cursor, lote, table_name, schema='trusted'):
+    """Envia um RecordBatch Arrow via COPY, serializado em CSV pelo próprio pyarrow"""
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    sink = pa.BufferOutputStream()
+    pacsv.write_csv(lote, sink, write_options=pacsv.WriteOptions(include_header=False))
+    payload = sink.getvalue().to_pybytes()
+
+    colunas = ', '.join(f'"{coluna}"' for coluna in lote.schema.names)
+    cursor.copy_expert(
+        f'COPY {schema}.{table_name} ({colunas}) FROM STDIN WITH (FORMAT csv)',
+        io.BytesIO(payload)
+    )
+    return len(payload)
+
+# =====================================================
+# ♻️ Fingerprint dos arquivos fonte (tamanho, mtime, hash)
+# =====================================================
+def _hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            sha256.update(bloco)
+    return sha256.hexdigest()
+
+def verificar_fingerprint(table_name, caminho, schema='trusted'):
+    """
+    Compara o arquivo com o último fingerprint registrado para a tabela.
+
+    Tamanho e mtime iguais → inalterado, sem ler o arquivo. Caso contrário
+    o hash do conteúdo decide (um `touch` no arquivo não força recarga).
+    Retorna (inalterado, fingerprint_atual).
+    """
+    stat = os.stat(caminho)
+    fingerprint = {
+        'tabela': f'{schema}.{table_name}',
+        'arquivo': os.path.abspath(caminho),
+        'tamanho_bytes': stat.st_size,
+        'modificado_em': datetime.fromtimestamp(stat.st_mtime),
+        'hash_sha256': None,
+    }
+
+    with get_engine().connect() as conn:
+        anterior = conn.execute(text("""
+            SELECT tamanho_bytes, modificado_em, hash_sha256
+            FROM trusted.log_ingestao_arquivo
+            WHERE tabela = :tabela
+        """), {'tabela': fingerprint['tabela']}).fetchone()
+
+    if anterior and anterior[0] == fingerprint['tamanho_bytes'] and anterior[1] == fingerprint['modificado_em']:
+        fingerprint['hash_sha256'] = anterior[2]
+        return True, fingerprint
+
+    fingerprint['hash_sha256'] = _hash_arquivo(caminho)
+    inalterado = anterior is not None and anterior[2] == fingerprint['hash_sha256']
+    return inalterado, fingerprint
+
+def registrar_fingerprint(conn, fingerprint):
+    conn.execute(text("""
+        INSERT INTO trusted.log_ingestao_arquivo
+            (tabela, arquivo, tamanho_bytes, modificado_em, hash_sha256, data_ingestao)
+        VALUES (:tabela, :arquivo, :tamanho_bytes, :modificado_em, :hash_sha256, :data_ingestao)
+        ON CONFLICT (tabela) DO UPDATE SET
+            arquivo = EXCLUDED.arquivo,
+            tamanho_bytes = EXCLUDED.tamanho_bytes,
+            modificado_em = EXCLUDED.modificado_em,
+            hash_sha256 = EXCLUDED.hash_sha256,
+            data_ingestao = EXCLUDED.data_ingestao
+    """), {**fingerprint, 'data_ingestao': datetime.now()})
+
 # =====================================================
-# 2️⃣ Criar engine de conexão com o PostgreSQL (RDS)
+# 🧷 Checkpoint por chunk (retomada de cargas interrompidas)
 # =====================================================
-engine = create_engine(f'postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+# Cada chunk gravado em staging atualiza trusted.checkpoint_ingestao na
+# mesma transação. Se a carga cair (failover do RDS, retry do Airflow), a
+# próxima execução do mesmo arquivo (mesmo hash) continua do último chunk
+# confirmado em vez de recomeçar; o checkpoint é removido no merge.
+def ler_checkpoint(table_name, fingerprint, schema='trusted'):
+    """
+    Retorna {'linhas', 'lotes', 'colunas'} já confirmados em staging para
+    este arquivo, ou None se a carga deve começar do zero.
+
+    O checkpoint só vale se staging.{tabela} ainda tiver exatamente as linhas
+    confirmadas (staging UNLOGGED é esvaziada se o servidor reiniciar).
+    """
+    tabela = f'{schema}.{table_name}'
+    with get_engine().connect() as conn:
+        checkpoint = conn.execute(text("""
+            SELECT hash_sha256, linhas_confirmadas, lotes_confirmados, colunas
+            FROM trusted.checkpoint_ingestao
+            WHERE tabela = :tabela
+        """), {'tabela': tabela}).fetchone()
+        if checkpoint is None:
+            return None
+        if checkpoint[0] != fingerprint['hash_sha256']:
+            print(f"♻️  {table_name}: arquivo mudou desde a carga interrompida, recomeçando do zero.")
+            return None
+
+        existe = conn.execute(
+            text("SELECT to_regclass(:staging)"), {'staging': f'{SCHEMA_STAGING}.{table_name}'}
+        ).scalar()
+        linhas_staging = conn.execute(
+            text(f"SELECT COUNT(*) FROM {SCHEMA_STAGING}.{table_name}")
+        ).scalar() if existe else None
+
+    if linhas_staging != checkpoint[1]:
+        print(
+            f"♻️  {table_name}: staging com {linhas_staging} linha(s), checkpoint com "
+            f"{checkpoint[1]}; recomeçando do zero."
+        )
+        return None
+
+    return {'linhas': checkpoint[1], 'lotes': checkpoint[2], 'colunas': checkpoint[3].split(',')}
+
+def registrar_checkpoint(cursor, fingerprint, linhas, lotes, colunas):
+    """Grava o progresso no cursor da transação do chunk (commit conjunto)"""
+    cursor.execute("""
+        INSERT INTO trusted.checkpoint_ingestao
+            (tabela, arquivo, hash_sha256, linhas_confirmadas, lotes_confirmados, colunas, atualizado_em)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (tabela) DO UPDATE SET
+            arquivo = EXCLUDED.arquivo,
+            hash_sha256 = EXCLUDED.hash_sha256,
+            linhas_confirmadas = EXCLUDED.linhas_confirmadas,
+            lotes_confirmados = EXCLUDED.lotes_confirmados,
+            colunas = EXCLUDED.colunas,
+            atualizado_em = EXCLUDED.atualizado_em
+    """, (
+        fingerprint['tabela'], fingerprint['arquivo'], fingerprint['hash_sha256'],
+        linhas, lotes, ','.join(colunas), datetime.now()
+    ))
+
+def remover_checkpoint(conn, tabela):
+    conn.execute(text("DELETE FROM trusted.checkpoint_ingestao WHERE tabela = :tabela"), {'tabela': tabela})
 
 # =====================================================
-# 3️⃣ Função de carga CSV → PostgreSQL
+# 🔀 Staging + upsert (INSERT ... ON CONFLICT nas PKs do DDL)
 # =====================================================
-def load_csv_to_postgres(csv_path, table_name, schema='trusted', chunksize=5000):
-    print(f"\nIniciando carga: {table_name}")
+# 🧩 Colunas que não vêm no arquivo e são preenchidas na staging a partir de
+#    outra tabela: coluna → (tabela origem, coluna origem, (coluna local, chave origem))
+COLUNAS_DERIVADAS = {
+    # Chave de partição de pedido_item: data do pedido
+    'pedido_item': {'data_pedido': ('trusted.pedido', 'data', ('id_pedido', 'id'))},
+}
+
+def preparar_staging(table_name, schema='trusted', unlogged=False):
+    """Recria staging.{tabela} com a mesma estrutura da tabela destino"""
+    tipo_tabela = "UNLOGGED TABLE" if unlogged else "TABLE"
+    with get_engine().begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_STAGING};"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {SCHEMA_STAGING}.{table_name};"))
+        conn.execute(text(
+            f"CREATE {tipo_tabela} {SCHEMA_STAGING}.{table_name} (LIKE {schema}.{table_name} INCLUDING DEFAULTS);"
+        ))
+        for coluna in COLUNAS_DERIVADAS.get(table_name, {}):
+            conn.execute(text(f'ALTER TABLE {SCHEMA_STAGING}.{table_name} ALTER COLUMN "{coluna}" DROP NOT NULL;'))
+
+def preparar_particoes(conn, table_name, colunas, schema='trusted'):
+    """
+    Antes do merge: preenche as colunas derivadas na staging e cria as
+    partições mensais dos meses presentes nela. Retorna as colunas a mesclar.
+    """
+    for coluna, (origem, coluna_origem, (local, chave)) in COLUNAS_DERIVADAS.get(table_name, {}).items():
+        if coluna in colunas:
+            continue
+        conn.execute(text(f"""
+            UPDATE {SCHEMA_STAGING}.{table_name} s
+            SET "{coluna}" = o."{coluna_origem}"
+            FROM {origem} o
+            WHERE o."{chave}" = s."{local}"
+        """))
+        colunas = colunas + [coluna]
+
+    coluna_particao = tabelas_particionadas(schema).get(table_name)
+    if coluna_particao:
+        inicio, fim = conn.execute(text(
+            f'SELECT MIN("{coluna_particao}"), MAX("{coluna_particao}") FROM {SCHEMA_STAGING}.{table_name}'
+        )).one()
+        garantir_particoes(conn, table_name, inicio, fim, schema)
+    return colunas
+
+def mesclar_staging(conn, table_name, colunas, schema='trusted'):
+    """
+    Aplica staging.{tabela} em {schema}.{tabela} com upsert pela PK do ddl.sql.
+    Linhas idênticas às já existentes não são reescritas.
+    """
+    pk = carregar_tabelas()[f'{schema}.{table_name}']['pk']
+    lista_colunas = ', '.join(f'"{c}"' for c in colunas)
+
+    if not pk or not set(pk) <= set(colunas):
+        print(f"⚠️  {table_name}: PK {pk} ausente no arquivo, staging será apenas anexado.")
+        conn.execute(text(f"""
+            INSERT INTO {schema}.{table_name} ({lista_colunas})
+            SELECT {lista_colunas} FROM {SCHEMA_STAGING}.{table_name}
+        """))
+        return
+
+    lista_pk = ', '.join(f'"{c}"' for c in pk)
+    atualizar = [c for c in colunas if c not in pk]
+
+    # Tabela particionada: a PK inclui a coluna de partição. Se a data de um
+    # registro mudou, move a linha existente para a nova partição antes do
+    # upsert. No PostgreSQL 14 o ON UPDATE CASCADE não acompanha a troca de
+    # partição do pai, então os filhos particionados pela mesma data (ex:
+    # pedido_item) são retirados antes e reinseridos com a nova data depois,
+    # na mesma transação
+    coluna_particao = tabelas_particionadas(schema).get(table_name)
+    chave = [c for c in pk if c != coluna_particao]
+    if coluna_particao and chave:
+        movidos = f"""
+            SELECT DISTINCT ON ({lista_pk}) {lista_colunas}
+            FROM {SCHEMA_STAGING}.{table_name}
+        """
+        filhos = [
+            (filha, coluna, local, chave_origem)
+            for filha, derivadas in COLUNAS_DERIVADAS.items()
+            for coluna, (origem, coluna_origem, (local, chave_origem)) in derivadas.items()
+            if origem == f'{schema}.{table_name}' and coluna_origem == coluna_particao
+        ]
+        for filha, coluna, local, chave_origem in filhos:
+            conn.execute(text(f"""
+                CREATE TEMP TABLE _movidos_{filha} (LIKE {schema}.{filha}) ON COMMIT DROP;
+                WITH removidos AS (
+                    DELETE FROM {schema}.{filha} f
+                    USING ({movidos}) s
+                    WHERE f."{local}" = s."{chave_origem}"
+                      AND f."{coluna}" <> s."{coluna_particao}"
+                    RETURNING f.*
+                )
+                INSERT INTO _movidos_{filha} SELECT * FROM removidos;
+            """))
+
+        conn.execute(text(f"""
+            UPDATE {schema}.{table_name} alvo
+            SET "{coluna_particao}" = s."{coluna_particao}"
+            FROM ({movidos}) s
+            WHERE {' AND '.join(f'alvo."{c}" = s."{c}"' for c in chave)}
+              AND alvo."{coluna_particao}" <> s."{coluna_particao}"
+        """))
+
+        for filha, coluna, local, chave_origem in filhos:
+            conn.execute(text(f"""
+                UPDATE _movidos_{filha} m
+                SET "{coluna}" = p."{coluna_particao}"
+                FROM {schema}.{table_name} p
+                WHERE p."{chave_origem}" = m."{local}"
+            """))
+            inicio, fim = conn.execute(text(
+                f'SELECT MIN("{coluna}"), MAX("{coluna}") FROM _movidos_{filha}'
+            )).one()
+            if inicio is None:
+                continue
+            garantir_particoes(conn, filha, inicio, fim, schema)
+            movidas = conn.execute(text(
+                f"INSERT INTO {schema}.{filha} SELECT * FROM _movidos_{filha}"
+            )).rowcount
+            print(f"🔀 {filha}: {movidas} linha(s) movida(s) junto com {table_name}")
+    if atualizar:
+        conflito = f"""
+            DO UPDATE SET {', '.join(f'"{c}" = EXCLUDED."{c}"' for c in atualizar)}
+            WHERE ({', '.join(f'alvo."{c}"' for c in atualizar)})
+                IS DISTINCT FROM ({', '.join(f'EXCLUDED."{c}"' for c in atualizar)})
+        """
+    else:
+        conflito = "DO NOTHING"
+
+    executar(conn, f"merge:{schema}.{table_name}", f"""
+        INSERT INTO {schema}.{table_name} AS alvo ({lista_colunas})
+        SELECT DISTINCT ON ({lista_pk}) {lista_colunas}
+        FROM {SCHEMA_STAGING}.{table_name}
+        ON CONFLICT ({lista_pk}) {conflito}
+    """)
+
+# =====================================================
+# ⚡ Fast-load: índices e restrições reconstruídos em bloco
+# =====================================================
+def _indices_secundarios(conn, tabela_qualificada):
+    """Índices que não sustentam PK/UNIQUE (ex: idx_pedido_data_uf)"""
+    return conn.execute(text("""
+        SELECT i.relname, pg_get_indexdef(ix.indexrelid)
+        FROM pg_index ix
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        WHERE ix.indrelid = CAST(:tabela AS regclass)
+          AND NOT ix.indisprimary
+          AND NOT ix.indisunique
+    """), {'tabela': tabela_qualificada}).fetchall()
+
+def _restricoes_adiaveis(conn, tabela_qualificada):
+    """FKs e CHECKs da tabela (ex: fk_pedido_data, chk_pedido_sgl_uf_entrega)"""
+    return conn.execute(text("""
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = CAST(:tabela AS regclass)
+          AND contype IN ('f', 'c')
+          AND conparentid = 0  -- ignora as cópias internas de FKs entre tabelas particionadas
+    """), {'tabela': tabela_qualificada}).fetchall()
+
+def aplicar_fast_load(conn, table_name, colunas, schema='trusted'):
+    """
+    Move staging.{tabela} para {schema}.{tabela} sem custo por linha:
+
+    1. remove os índices secundários e as FKs/CHECKs do destino;
+    2. aplica o staging com um único INSERT ... SELECT (upsert pela PK);
+    3. recria as restrições como NOT VALID e valida cada uma com um scan;
+    4. recria os índices e atualiza as estatísticas.
 
-    df_iter = pd.read_csv(csv_path, chunksize=chunksize)
-    total_rows = 0
+    Tudo roda na transação de `conn`: se a validação falhar, nada muda.
+    """
+    tabela_qualificada = f'{schema}.{table_name}'
+    indices = _indices_secundarios(conn, tabela_qualificada)
+    restricoes = _restricoes_adiaveis(conn, tabela_qualificada)
 
-    for chunk in df_iter:
-        # =====================================================
-        # 🧩 Normalização automática de colunas por tabela
-        # =====================================================
-        if table_name == 'pedido':
-            if 'sgl_uf_entrega' in chunk.columns and 'uf_entrega' not in chunk.columns:
-                chunk.rename(columns={'sgl_uf_entrega': 'sgl_uf_entrega'}, inplace=True)
+    conn.execute(text(f"SET LOCAL maintenance_work_mem = '{INGESTAO_MAINTENANCE_WORK_MEM}';"))
 
-        elif table_name == 'meta':
-            if 'vlr_meta' in chunk.columns:
-                chunk.rename(columns={'vlr_meta': 'valor'}, inplace=True)
+    for nome, _ in indices:
+        conn.execute(text(f'DROP INDEX {schema}."{nome}";'))
+    for nome, _ in restricoes:
+        conn.execute(text(f'ALTER TABLE {tabela_qualificada} DROP CONSTRAINT "{nome}";'))
 
-        elif table_name == 'produto':
-            if 'idMarca' in chunk.columns:
-                chunk.rename(columns={'idMarca': 'id_marca'}, inplace=True)
+    mesclar_staging(conn, table_name, colunas, schema)
 
-        # =====================================================
-        # 🚀 Envio do chunk para o banco
-        # =====================================================
-        chunk.to_sql(table_name, con=engine, schema=schema, if_exists='append', index=False)
-        total_rows += len(chunk)
+    # Tabela particionada não aceita FK NOT VALID: a FK é recriada já validada
+    particionada = table_name in tabelas_particionadas(schema)
+    adiadas = [
+        nome for nome, definicao in restricoes
+        if not (particionada and definicao.startswith('FOREIGN KEY'))
+    ]
+    for nome, definicao in restricoes:
+        sufixo = " NOT VALID" if nome in adiadas else ""
+        conn.execute(text(f'ALTER TABLE {tabela_qualificada} ADD CONSTRAINT "{nome}" {definicao}{sufixo};'))
+    for nome in adiadas:
+        conn.execute(text(f'ALTER TABLE {tabela_qualificada} VALIDATE CONSTRAINT "{nome}";'))
+    for _, definicao in indices:
+        # Índice de tabela particionada: pg_get_indexdef devolve "ON ONLY", que não cria nas partições
+        conn.execute(text(f"{definicao.replace(' ON ONLY ', ' ON ', 1)};"))
+
+    conn.execute(text(f"ANALYZE {tabela_qualificada};"))
+    print(f"⚡ {table_name}: {len(indices)} índice(s) e {len(restricoes)} restrição(ões) reconstruídos em bloco.")
+
+# =====================================================
+# 📏 Métricas de vazão por chunk e por tabela
+# =====================================================
+def _imprimir_memoria(table_name, chunksize, memoria_chunks):
+    """Resumo de memória por chunk, para calibrar o chunksize com segurança"""
+    if not memoria_chunks:
+        return
+    maior = max(memoria_chunks, key=lambda m: m['memoria_mb'])
+    media = sum(m['memoria_mb'] for m in memoria_chunks) / len(memoria_chunks)
+    pico = max((m['pico_rss_mb'] or 0) for m in memoria_chunks)
+    print(
+        f"🧮 {table_name}: {len(memoria_chunks)} chunk(s) de até {chunksize} linhas | "
+        f"memória/chunk média {media:.1f} MB, máx {maior['memoria_mb']:.1f} MB | "
+        f"pico RSS {pico:.0f} MB"
+    )
+
+def resumir_metricas(tabela, metodo, chunks, duracao_total_s, tempo_merge_s):
+    """
+    Agrega as métricas por chunk (leitura, normalização, escrita, bytes)
+    em um resumo por tabela, com latência p50/p95 do chunk.
+    """
+    latencias = pd.Series(
+        [c.get('tempo_leitura_s', 0) + c.get('tempo_normalizacao_s', 0) + c['tempo_escrita_s'] for c in chunks],
+        dtype='float64'
+    )
+    linhas = sum(c['linhas'] for c in chunks)
+    volume = sum(c['bytes'] for c in chunks)
+    return {
+        'tabela': tabela,
+        'metodo': metodo,
+        'data_ingestao': datetime.now().isoformat(timespec='seconds'),
+        'chunks': len(chunks),
+        'linhas': linhas,
+        'bytes': volume,
+        'duracao_total_s': round(duracao_total_s, 3),
+        'tempo_leitura_s': round(sum(c.get('tempo_leitura_s', 0) for c in chunks), 3),
+        'tempo_normalizacao_s': round(sum(c.get('tempo_normalizacao_s', 0) for c in chunks), 3),
+        'tempo_escrita_s': round(sum(c['tempo_escrita_s'] for c in chunks), 3),
+        'tempo_merge_s': round(tempo_merge_s, 3),
+        'latencia_chunk_p50_ms': round(float(latencias.quantile(0.5)) * 1000, 1) if len(chunks) else None,
+        'latencia_chunk_p95_ms': round(float(latencias.quantile(0.95)) * 1000, 1) if len(chunks) else None,
+        'linhas_por_segundo': round(linhas / duracao_total_s, 1) if duracao_total_s > 0 else None,
+        'bytes_por_segundo': round(volume / duracao_total_s, 1) if duracao_total_s > 0 else None,
+        'pico_rss_mb': round(max((c['pico_rss_mb'] or 0) for c in chunks), 1) if chunks else None,
+    }
+
+def registrar_metricas(conn, id_log_ingestao, metricas):
+    conn.execute(text("""
+        INSERT INTO trusted.log_ingestao_metricas (
+            id_log_ingestao, tabela, metodo, chunks, linhas, bytes,
+            duracao_total_s, tempo_leitura_s, tempo_normalizacao_s, tempo_escrita_s, tempo_merge_s,
+            latencia_chunk_p50_ms, latencia_chunk_p95_ms, linhas_por_segundo, bytes_por_segundo, pico_rss_mb
+        ) VALUES (
+            :id_log_ingestao, :tabela, :metodo, :chunks, :linhas, :bytes,
+            :duracao_total_s, :tempo_leitura_s, :tempo_normalizacao_s, :tempo_escrita_s, :tempo_merge_s,
+            :latencia_chunk_p50_ms, :latencia_chunk_p95_ms, :linhas_por_segundo, :bytes_por_segundo, :pico_rss_mb
+        )
+    """), {**metricas, 'id_log_ingestao': id_log_ingestao})
+
+def gravar_metricas_json(metricas, arquivo=INGESTAO_METRICAS_ARQUIVO):
+    """Acrescenta o resumo da tabela ao arquivo JSON Lines de métricas (uma linha por carga)"""
+    if not arquivo:
+        return
+    diretorio = os.path.dirname(arquivo)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    with _metricas_lock, open(arquivo, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(metricas, ensure_ascii=False) + '\n')
+
+def _imprimir_metricas(table_name, metricas):
+    if not metricas['chunks']:
+        return
+    print(
+        f"⏱️  {table_name}: {metricas['duracao_total_s']:.2f}s "
+        f"(leitura {metricas['tempo_leitura_s']:.2f}s, normalização {metricas['tempo_normalizacao_s']:.2f}s, "
+        f"escrita {metricas['tempo_escrita_s']:.2f}s, merge {metricas['tempo_merge_s']:.2f}s) | "
+        f"chunk p50 {metricas['latencia_chunk_p50_ms']:.0f} ms, p95 {metricas['latencia_chunk_p95_ms']:.0f} ms | "
+        f"{metricas['linhas_por_segundo'] or 0:,.0f} linhas/s, "
+        f"{(metricas['bytes_por_segundo'] or 0) / 1024 ** 2:.1f} MB/s"
+    )
+
+def _carregar_lotes(lotes, table_name, schema, chunksize, method, register_log,
+                    usar_staging, fast_load, fingerprint=None, retomada=None):
+    """
+    Envia os lotes (DataFrame ou RecordBatch) ao banco, faz o merge e registra o log.
+
+    Com staging e fingerprint, cada chunk grava um checkpoint na mesma
+    transação; `retomada` (ver ler_checkpoint) continua uma carga interrompida
+    sobre a staging existente.
+    """
+    inicio_carga = time.perf_counter()
+    schema_destino = schema
+    if usar_staging:
+        if retomada is None:
+            preparar_staging(table_name, schema, unlogged=fast_load)
+        schema_destino = SCHEMA_STAGING
+    usar_checkpoint = usar_staging and fingerprint is not None
+
+    total_rows = retomada['linhas'] if retomada else 0
+    lotes_confirmados = retomada['lotes'] if retomada else 0
+    colunas = retomada['colunas'] if retomada else []
+    metricas_chunks = []
+
+    raw_conn = get_engine().raw_connection()
+    try:
+        for lote, stats in lotes:
+            eh_arrow = not isinstance(lote, pd.DataFrame)
+            colunas = list(lote.schema.names) if eh_arrow else list(lote.columns)
+
+            # =====================================================
+            # 🚀 Envio do lote para o banco (dados + checkpoint, um commit)
+            # =====================================================
+            inicio_escrita = time.perf_counter()
+            with raw_conn.cursor() as cursor:
+                if method == 'copy' and eh_arrow:
+                    volume = copy_record_batch(cursor, lote, table_name, schema_destino)
+                elif method == 'copy':
+                    volume = copy_chunk(cursor, preparar_para_escrita(lote, table_name, schema), table_name, schema_destino)
+                else:
+                    chunk = lote.to_pandas() if eh_arrow else preparar_para_escrita(lote, table_name, schema)
+                    volume = insert_chunk(cursor, chunk, table_name, schema_destino)
+
+                total_rows += stats['linhas']
+                lotes_confirmados += 1
+                if usar_checkpoint:
+                    registrar_checkpoint(cursor, fingerprint, total_rows, lotes_confirmados, colunas)
+            raw_conn.commit()
+            metricas_chunks.append({
+                **stats, 'bytes': volume, 'tempo_escrita_s': time.perf_counter() - inicio_escrita
+            })
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
 
     # =====================================================
-    # 🧾 Registro de log da ingestão
+    # 🔀 Merge staging → destino (mesma transação do fingerprint/checkpoint)
     # =====================================================
-    with engine.begin() as conn:
-        conn.execute(text("""
-            INSERT INTO trusted.log_ingestao (tabela, data_ingestao, usuario, qtd_registros)
-            VALUES (:tabela, :data_ingestao, :usuario, :qtd)
-        """), {
-            'tabela': f'{schema}.{table_name}',
-            'data_ingestao': datetime.now(),
-            'usuario': DB_USER,
-            'qtd': total_rows
-        })
+    inicio_merge = time.perf_counter()
+    if usar_staging:
+        with get_engine().begin() as conn:
+            if colunas:
+                colunas = preparar_particoes(conn, table_name, colunas, schema)
+            if colunas and fast_load:
+                aplicar_fast_load(conn, table_name, colunas, schema)
+            elif colunas:
+                mesclar_staging(conn, table_name, colunas, schema)
+            if fingerprint is not None:
+                registrar_fingerprint(conn, fingerprint)
+            if usar_checkpoint:
+                remover_checkpoint(conn, fingerprint['tabela'])
+            conn.execute(text(f"DROP TABLE IF EXISTS {SCHEMA_STAGING}.{table_name};"))
 
-    print(f"✅ {table_name} carregada com sucesso: {total_rows} linhas.")
+    tempo_merge = time.perf_counter() - inicio_merge
+    metricas = resumir_metricas(
+        f'{schema}.{table_name}', method, metricas_chunks,
+        time.perf_counter() - inicio_carga, tempo_merge
+    )
 
     # =====================================================
-    # 🧠 Enriquecimento automático da tabela de datas
+    # 🧾 Registro de log da ingestão (+ métricas da carga)
     # =====================================================
+    if register_log:
+        with get_engine().begin() as conn:
+            # data_ingestao pelo relógio do servidor: é a mesma referência de
+            # criado_em/atualizado_em, que delimitam o lote na validação
+            id_log = conn.execute(text("""
+                INSERT INTO trusted.log_ingestao (tabela, data_ingestao, usuario, qtd_registros)
+                VALUES (:tabela, CLOCK_TIMESTAMP(), :usuario, :qtd)
+                RETURNING id
+            """), {
+                'tabela': f'{schema}.{table_name}',
+                'usuario': DB_USER,
+                'qtd': total_rows
+            }).scalar()
+            registrar_metricas(conn, id_log, metricas)
+        gravar_metricas_json({**metricas, 'id_log_ingestao': id_log})
+
+    print(f"✅ {table_name} carregada com sucesso: {total_rows} linhas.")
+    _imprimir_memoria(table_name, chunksize, metricas_chunks)
+    _imprimir_metricas(table_name, metricas)
+
+    return total_rows
+
+def load_file_to_postgres(file_path, table_name, schema='trusted', chunksize=5000,
+                          method=LOAD_METHOD, register_log=True, idempotent=INGESTAO_IDEMPOTENTE,
+                          fast_load=INGESTAO_FAST_LOAD):
+    """
+    Carrega um arquivo (CSV, CSV .gz/.zst ou Parquet) em {schema}.{table_name} em lotes.
+
+    method='copy'   → COPY ... FROM STDIN (bulk load, padrão)
+    method='insert' → INSERT ... VALUES em lotes (equivalente ao DataFrame.to_sql)
+
+    idempotent=True → arquivo inalterado desde a última carga é ignorado;
+    caso contrário é carregado em staging e mesclado com upsert pela PK.
+    Cada chunk confirmado grava um checkpoint: se a carga cair, a próxima
+    execução com o mesmo arquivo retoma do último chunk confirmado.
+
+    fast_load=True → staging UNLOGGED e índices/FKs/CHECKs do destino
+    reconstruídos em bloco após o merge (ver aplicar_fast_load).
+    """
+    if method not in ('copy', 'insert'):
+        raise ValueError(f"Método de carga inválido: {method} (use 'copy' ou 'insert')")
+
+    print(f"\nIniciando carga: {table_name} (método: {method})")
+
+    fingerprint = None
+    retomada = None
+    if idempotent:
+        inalterado, fingerprint = verificar_fingerprint(table_name, file_path, schema)
+        if inalterado:
+            print(f"⏭️  {table_name}: arquivo inalterado desde a última carga, ignorado.")
+            return 0
+
+        retomada = ler_checkpoint(table_name, fingerprint, schema)
+        if retomada:
+            print(
+                f"⏩ {table_name}: retomando após {retomada['linhas']} linhas "
+                f"({retomada['lotes']} lote(s) já confirmados em staging)."
+            )
+
+    lotes = ler_lotes(file_path, table_name, chunksize, schema,
+                      pular_linhas=retomada['linhas'] if retomada else 0)
     if table_name == 'data':
-        print(f"🪄 Enriquecendo tabela de datas (campo descricao) com idioma '{DATE_LANG}'...")
-        with engine.begin() as conn:
-            conn.execute(text(f"""
-                SET lc_time = '{DATE_LANG}.UTF-8';
-                UPDATE trusted.data
-                SET descricao = TO_CHAR(data, 'TMDay, DD TMMonth YYYY')
-                WHERE descricao IS NULL;
-            """))
-        print("✅ Campo descricao preenchido automaticamente com sucesso.")
+        # descricao ausente no arquivo é gerada no próprio lote, CSV ou Parquet (sem UPDATE pós-carga)
+        lotes = ((completar_descricao(lote), stats) for lote, stats in lotes)
+
+    # Tabelas particionadas (ou com colunas derivadas) passam sempre pela
+    # staging: as partições dos meses do arquivo são criadas antes do merge
+    via_staging = table_name in tabelas_particionadas(schema) or (
+        table_name in COLUNAS_DERIVADAS and f'{schema}.{table_name}' in carregar_tabelas()
+    )
+    return _carregar_lotes(
+        lotes, table_name, schema, chunksize, method, register_log,
+        usar_staging=idempotent or fast_load or via_staging, fast_load=fast_load,
+        fingerprint=fingerprint, retomada=retomada
+    )
+
+def load_dataframe_to_postgres(df, table_name, schema='trusted', chunksize=5000,
+                               method=LOAD_METHOD, register_log=True, fast_load=INGESTAO_FAST_LOAD):
+    """Carrega um DataFrame já tipado (ex: dimensão gerada) via staging + upsert pela PK"""
+    print(f"\nIniciando carga: {table_name} (método: {method}, origem: DataFrame)")
+
+    def fatiar():
+        for inicio in range(0, len(df), chunksize):
+            chunk = df.iloc[inicio:inicio + chunksize]
+            yield chunk, {
+                'linhas': len(chunk),
+                'memoria_mb': chunk.memory_usage(deep=True).sum() / 1024 ** 2,
+                'pico_rss_mb': pico_rss_mb(),
+                'tempo_leitura_s': 0.0,
+                'tempo_normalizacao_s': 0.0,
+            }
+
+    return _carregar_lotes(
+        fatiar(), table_name, schema, chunksize, method, register_log,
+        usar_staging=True, fast_load=fast_load
+    )
+
+def carregar_dimensao_data(inicio=DIM_DATA_INICIO, fim=DIM_DATA_FIM, idioma=DATE_LANG):
+    """Gera trusted.data para o intervalo e carrega via COPY (sem CSV e sem UPDATE pós-carga)"""
+    print(f"📅 Gerando dimensão de datas de {inicio} a {fim} (idioma '{idioma}')...")
+    return load_dataframe_to_postgres(gerar_dimensao_data(inicio, fim, idioma), 'data')
+
+def _faixa_datas(caminho, table_name):
+    """(menor, maior) data coberta pelo arquivo: pedido.data ou anos inteiros de meta.ano"""
+    if not os.path.exists(caminho):
+        return None
+    if table_name == 'meta':
+        anos = min_max_colunas(caminho, 'meta', ['ano']).get('ano')
+        return anos and (pd.Timestamp(int(anos[0]), 1, 1), pd.Timestamp(int(anos[1]), 12, 31))
+    datas = min_max_colunas(caminho, table_name, ['data']).get('data')
+    return datas and (pd.Timestamp(datas[0]), pd.Timestamp(datas[1]))
+
+def planejar_dimensao_data(arquivos):
+    """
+    Carga de trusted.data para `arquivos`: o arquivo data.* de origem, se
+    existir, ou a dimensão gerada de DIM_DATA_INICIO a DIM_DATA_FIM estendida
+    (em anos inteiros) até a menor/maior data de pedido e meta dos arquivos.
+    Falha antes de carregar qualquer tabela se houver pedido fora da dimensão.
+    """
+    pedidos = _faixa_datas(arquivos['pedido'], 'pedido')
+
+    if os.path.exists(arquivos['data']):
+        dimensao = _faixa_datas(arquivos['data'], 'data')
+        if pedidos and (not dimensao or pedidos[0] < dimensao[0] or pedidos[1] > dimensao[1]):
+            raise ValueError(
+                f"Pedidos de {pedidos[0]:%Y-%m-%d} a {pedidos[1]:%Y-%m-%d} fora de {arquivos['data']} "
+                f"({f'{dimensao[0]:%Y-%m-%d} a {dimensao[1]:%Y-%m-%d}' if dimensao else 'vazio'}). "
+                f"Complete o arquivo ou remova-o para gerar a dimensão."
+            )
+        print(f"📅 trusted.data lida de {arquivos['data']}.")
+        return arquivos['data']
+
+    inicio, fim = pd.Timestamp(DIM_DATA_INICIO), pd.Timestamp(DIM_DATA_FIM)
+    for faixa in (pedidos, _faixa_datas(arquivos['meta'], 'meta')):
+        if faixa:
+            inicio = min(inicio, pd.Timestamp(faixa[0].year, 1, 1))
+            fim = max(fim, pd.Timestamp(faixa[1].year, 12, 31))
+    return lambda: carregar_dimensao_data(inicio.date(), fim.date())
+
+# Compatibilidade: nome original da função de carga
+load_csv_to_postgres = load_file_to_postgres
 
 # =====================================================
 # 4️⃣ Validação pós-carga
@@ -95,7 +749,7 @@ def validate_data():
         'Pedidos com cliente nulo': 'SELECT COUNT(*) FROM trusted.pedido WHERE cliente_id_hash IS NULL',
         'Itens sem pedido correspondente': '''
             SELECT COUNT(*) FROM trusted.pedido_item i
-            LEFT JOIN trusted.pedido p ON i.id_pedido = p.id
+            LEFT JOIN trusted.pedido p ON i.id_pedido = p.id AND i.data_pedido = p.data
             WHERE p.id IS NULL
         ''',
         'Produtos sem marca correspondente': '''
@@ -105,7 +759,7 @@ def validate_data():
         '''
     }
 
-    with engine.connect() as conn:
+    with get_engine().connect() as conn:
         for desc, sql in queries.items():
             result = conn.execute(text(sql)).fetchone()
             print(f"{desc}: {result[0]}")
@@ -113,27 +767,99 @@ def validate_data():
     print("\n✅ Validação concluída.")
 
 # =====================================================
-# 5️⃣ Execução principal
+# 5️⃣ Carga paralela respeitando as FKs do ddl.sql
+# =====================================================
+def _carregar_tabela(tabela, caminho):
+    if callable(caminho):
+        caminho()
+    elif os.path.exists(caminho):
+        load_file_to_postgres(caminho, tabela)
+    else:
+        print(f"⚠️  Arquivo não encontrado: {caminho}")
+
+def carregar_em_paralelo(arquivos, max_workers=INGESTAO_WORKERS):
+    """
+    Carrega as tabelas de `arquivos` em um pool de `max_workers` threads.
+
+    Uma tabela só inicia quando todas as tabelas que ela referencia via FK
+    (e que fazem parte desta carga) terminaram. Tabelas independentes rodam
+    ao mesmo tempo, então o tempo total fica próximo do caminho crítico.
+    Se uma tabela falha, as que dependem dela não são carregadas.
+
+    `arquivos` mapeia tabela → caminho do arquivo ou função sem argumentos
+    que faz a carga (ex: carregar_dimensao_data).
+
+    Retorna (concluidas, falhas) com falhas = {tabela: exceção}.
+    """
+    grafo = dependencias_fk('trusted')
+    pendentes = {
+        tabela: {dep for dep in grafo.get(tabela, set()) if dep in arquivos}
+        for tabela in arquivos
+    }
+    concluidas, falhas = set(), {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        em_execucao = {}
+
+        def submeter_prontas():
+            for tabela in list(pendentes):
+                if pendentes[tabela] <= concluidas:
+                    del pendentes[tabela]
+                    futuro = executor.submit(_carregar_tabela, tabela, arquivos[tabela])
+                    em_execucao[futuro] = tabela
+
+        submeter_prontas()
+        while em_execucao:
+            finalizados, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in finalizados:
+                tabela = em_execucao.pop(futuro)
+                try:
+                    futuro.result()
+                    concluidas.add(tabela)
+                except Exception as e:
+                    falhas[tabela] = e
+                    print(f"❌ Falha na carga de {tabela}: {e}")
+
+            # Propaga falhas para as tabelas dependentes
+            bloqueadas = True
+            while bloqueadas:
+                bloqueadas = [t for t, deps in pendentes.items() if deps & set(falhas)]
+                for tabela in bloqueadas:
+                    del pendentes[tabela]
+                    falhas[tabela] = RuntimeError("dependência não carregada")
+                    print(f"⏭️  {tabela} ignorada: dependência não carregada")
+
+            submeter_prontas()
+
+    if pendentes:
+        raise RuntimeError(f"Dependência circular entre as tabelas: {sorted(pendentes)}")
+
+    return concluidas, falhas
+
+# =====================================================
+# 6️⃣ Execução principal
 # =====================================================
 if __name__ == '__main__':
     BASE_PATH = './data/trusted'
 
-    arquivos = {
-        'marca': f'{BASE_PATH}/marca.csv',
-        'produto': f'{BASE_PATH}/produto.csv',
-        'data': f'{BASE_PATH}/data.csv',
-        'cliente_pii': f'{BASE_PATH}/cliente_pii.csv',
-        'cliente_pseudo': f'{BASE_PATH}/cliente_pseudo.csv',
-        'pedido': f'{BASE_PATH}/pedido.csv',
-        'pedido_item': f'{BASE_PATH}/pedido_item.csv',
-        'meta': f'{BASE_PATH}/meta.csv'
-    }
+    # Para cada tabela: .parquet, .csv.zst, .csv.gz ou .csv (primeiro que existir)
+    tabelas = ['marca', 'produto', 'data', 'cliente_pii', 'cliente_pseudo', 'pedido', 'pedido_item', 'meta']
+    arquivos = {tabela: localizar_arquivo(BASE_PATH, tabela) for tabela in tabelas}
+
+    # trusted.data: data.* de origem, se existir, ou gerada cobrindo os pedidos e metas dos arquivos
+    try:
+        arquivos['data'] = planejar_dimensao_data(arquivos)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    # Partições dos próximos meses de pedido/pedido_item (as dos meses dos arquivos são criadas na carga)
+    garantir_particoes_futuras()
 
-    for tabela, caminho in arquivos.items():
-        if os.path.exists(caminho):
-            load_csv_to_postgres(caminho, tabela)
-        else:
-            print(f"⚠️  Arquivo não encontrado: {caminho}")
+    _, falhas = carregar_em_paralelo(arquivos)
+    if falhas:
+        print(f"\n❌ Ingestão finalizada com falhas em: {', '.join(sorted(falhas))}")
+        sys.exit(1)
 
     validate_data()
 
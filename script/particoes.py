@@ -0,0 +1,255 @@
+import argparse
+import os
+import re
+import sys
+from datetime import date
+from sqlalchemy import text
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from conexao import get_engine
+from esquema_ddl import carregar_tabelas, ddl_tabela, ddl_triggers
+
+# =====================================================
+# 🗂️ Gerenciador de partições mensais (trusted.pedido / trusted.pedido_item)
+# =====================================================
+# As tabelas declaradas no ddl.sql com PARTITION BY RANGE (coluna) têm uma
+# partição por mês: trusted.pedido_2024_01 cobre [2024-01-01, 2024-02-01).
+# Não há partição DEFAULT: uma linha sem partição falha na carga em vez de
+# ir para um "balde" que depois impede a criação do mês correspondente.
+#
+#   - a ingestão cria as partições dos meses presentes em cada arquivo
+#     antes do merge (garantir_particoes);
+#   - PARTICOES_MESES_FUTUROS meses à frente são pré-criados a cada carga;
+#   - meses antigos podem ser analisados/vacuumizados ou desanexados um a um.
+#
+# Uso:
+#   python script/particoes.py                       # pré-cria meses futuros
+#   python script/particoes.py --migrar              # converte tabelas não particionadas
+#   python script/particoes.py --manter 2024-01      # VACUUM ANALYZE do mês
+#   python script/particoes.py --desanexar-ate 2023-01
+# =====================================================
+
+PARTICOES_MESES_FUTUROS = int(os.getenv("PARTICOES_MESES_FUTUROS", "3"))
+
+def tabelas_particionadas(schema: str = 'trusted') -> dict:
+    """{'tabela': coluna de partição} das tabelas particionadas do schema no ddl.sql"""
+    return {
+        definicao['nome']: definicao['particao']
+        for definicao in carregar_tabelas().values()
+        if definicao['schema'] == schema and definicao['particao']
+    }
+
+def _tipo_relacao(conn, tabela_qualificada: str):
+    return conn.execute(text("""
+        SELECT relkind::TEXT FROM pg_class WHERE oid = to_regclass(:tabela)
+    """), {'tabela': tabela_qualificada}).scalar()
+
+def _primeiro_dia(valor) -> date:
+    return date(valor.year, valor.month, 1)
+
+def _proximo_mes(mes: date) -> date:
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+def meses_entre(inicio, fim) -> list:
+    """Primeiros dias dos meses de inicio a fim (inclusive)"""
+    mes, ultimo, meses = _primeiro_dia(inicio), _primeiro_dia(fim), []
+    while mes <= ultimo:
+        meses.append(mes)
+        mes = _proximo_mes(mes)
+    return meses
+
+def nome_particao(tabela: str, mes: date) -> str:
+    return f"{tabela}_{mes:%Y_%m}"
+
+def criar_particao(conn, tabela: str, mes: date, schema: str = 'trusted') -> bool:
+    """Cria a partição mensal se ainda não existir; retorna True se criou"""
+    particao = nome_particao(tabela, mes)
+    existe = conn.execute(text("SELECT to_regclass(:nome) IS NOT NULL"),
+                          {'nome': f"{schema}.{particao}"}).scalar()
+    if existe:
+        return False
+    conn.execute(text(
+        f"CREATE TABLE {schema}.{particao} PARTITION OF {schema}.{tabela} "
+        f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{_proximo_mes(mes).isoformat()}');"
+    ))
+    return True
+
+def garantir_particoes(conn, tabela: str, inicio, fim, schema: str = 'trusted') -> int:
+    """Cria as partições de tabela para todos os meses entre inicio e fim"""
+    if inicio is None or fim is None:
+        return 0
+    criadas = sum(criar_particao(conn, tabela, mes, schema) for mes in meses_entre(inicio, fim))
+    if criadas:
+        print(f"🗂️  {schema}.{tabela}: {criadas} partição(ões) mensal(is) criada(s).")
+    return criadas
+
+def garantir_particoes_futuras(meses_futuros: int = PARTICOES_MESES_FUTUROS, schema: str = 'trusted'):
+    """Pré-cria as partições do mês atual até `meses_futuros` meses à frente"""
+    hoje = date.today()
+    fim = _primeiro_dia(hoje)
+    for _ in range(meses_futuros):
+        fim = _proximo_mes(fim)
+    with get_engine().begin() as conn:
+        for tabela in tabelas_particionadas(schema):
+            if _tipo_relacao(conn, f"{schema}.{tabela}") == 'p':
+                garantir_particoes(conn, tabela, hoje, fim, schema)
+
+def particoes(conn, tabela: str, schema: str = 'trusted') -> list:
+    """[(nome, mês)] das partições mensais existentes, em ordem"""
+    nomes = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits h
+        JOIN pg_class c ON c.oid = h.inhrelid
+        WHERE h.inhparent = CAST(:tabela AS regclass)
+        ORDER BY c.relname
+    """), {'tabela': f"{schema}.{tabela}"}).scalars().all()
+    resultado = []
+    for nome in nomes:
+        sufixo = re.fullmatch(rf"{tabela}_(\d{{4}})_(\d{{2}})", nome)
+        if sufixo:
+            resultado.append((nome, date(int(sufixo.group(1)), int(sufixo.group(2)), 1)))
+    return resultado
+
+# =====================================================
+# 🧹 Manutenção por mês
+# =====================================================
+def manter_mes(mes: date, schema: str = 'trusted'):
+    """VACUUM ANALYZE das partições do mês (sem varrer o restante das tabelas)"""
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for tabela in tabelas_particionadas(schema):
+            particao = f"{schema}.{nome_particao(tabela, mes)}"
+            if conn.execute(text("SELECT to_regclass(:nome) IS NOT NULL"), {'nome': particao}).scalar():
+                conn.execute(text(f"VACUUM (ANALYZE) {particao};"))
+                print(f"🧹 {particao}: VACUUM ANALYZE concluído.")
+
+def desanexar_ate(limite: date, schema: str = 'trusted'):
+    """
+    Desanexa as partições anteriores a `limite` (viram tabelas comuns, para
+    arquivar ou remover). Tabelas que referenciam outras (pedido_item) são
+    desanexadas primeiro, para não violar a FK.
+    """
+    tabelas = tabelas_particionadas(schema)
+    definicoes = carregar_tabelas()
+    ordem = sorted(tabelas, key=lambda t: -len([
+        ref for ref in definicoes[f"{schema}.{t}"]['fks'].values() if ref.split('.', 1)[1] in tabelas
+    ]))
+    with get_engine().begin() as conn:
+        for tabela in ordem:
+            for nome, mes in particoes(conn, tabela, schema):
+                if mes < _primeiro_dia(limite):
+                    conn.execute(text(f"ALTER TABLE {schema}.{tabela} DETACH PARTITION {schema}.{nome};"))
+                    print(f"📦 {schema}.{nome} desanexada de {schema}.{tabela}.")
+
+# =====================================================
+# 🔄 Migração de tabelas existentes (heap → particionada)
+# =====================================================
+# Bancos criados antes do particionamento têm pedido/pedido_item como
+# tabelas comuns (CREATE TABLE IF NOT EXISTS não altera tabela existente).
+# A migração roda numa única transação: renomeia as tabelas antigas,
+# cria as novas pelo ddl.sql, cria as partições do intervalo de datas,
+# copia os dados (pedido_item recebe data_pedido do pedido), recria as
+# triggers do ddl.sql nas tabelas novas e remove as antigas (o DROP leva
+# junto as triggers que estavam nelas).
+def _renomear_legado(conn, tabela: str, schema: str):
+    """Renomeia a tabela, suas constraints e índices com o sufixo _legado (libera os nomes do DDL)"""
+    legado = f"{tabela}_legado"
+    conn.execute(text(f"ALTER TABLE {schema}.{tabela} RENAME TO {legado};"))
+    for nome in conn.execute(text("""
+        SELECT conname FROM pg_constraint WHERE conrelid = CAST(:tabela AS regclass)
+    """), {'tabela': f"{schema}.{legado}"}).scalars().all():
+        conn.execute(text(f'ALTER TABLE {schema}.{legado} RENAME CONSTRAINT "{nome}" TO "{nome}_legado";'))
+    for nome in conn.execute(text("""
+        SELECT i.relname
+        FROM pg_index ix
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        WHERE ix.indrelid = CAST(:tabela AS regclass) AND NOT ix.indisprimary AND NOT ix.indisunique
+    """), {'tabela': f"{schema}.{legado}"}).scalars().all():
+        conn.execute(text(f'ALTER INDEX {schema}."{nome}" RENAME TO "{nome}_legado";'))
+
+def migrar(schema: str = 'trusted'):
+    tabelas = tabelas_particionadas(schema)
+    with get_engine().begin() as conn:
+        pendentes = [t for t in tabelas if _tipo_relacao(conn, f"{schema}.{t}") == 'r']
+        if not pendentes:
+            print("✅ Tabelas já particionadas, nada a migrar.")
+            return
+
+        for tabela in pendentes:
+            _renomear_legado(conn, tabela, schema)
+
+        # Ordem do DDL: pedido antes de pedido_item (FK)
+        for tabela in tabelas:
+            if tabela not in pendentes:
+                continue
+            for comando in ddl_tabela(f"{schema}.{tabela}"):
+                conn.execute(text(comando))
+
+            legado = f"{schema}.{tabela}_legado"
+            colunas_legado = set(conn.execute(text("""
+                SELECT attname FROM pg_attribute
+                WHERE attrelid = CAST(:tabela AS regclass) AND attnum > 0 AND NOT attisdropped
+            """), {'tabela': legado}).scalars().all())
+            # Colunas novas no DDL (ex: auditoria de pedido_item) ficam com o DEFAULT
+            colunas = [
+                c for c in carregar_tabelas()[f"{schema}.{tabela}"]['colunas']
+                if c in colunas_legado or (tabela == 'pedido_item' and c == 'data_pedido')
+            ]
+
+            if tabela == 'pedido_item' and 'data_pedido' not in colunas_legado:
+                # Item sem pedido não tem data de partição e o JOIN o descartaria
+                # em silêncio antes do DROP do legado: interrompe (rollback de tudo)
+                orfaos, exemplos = conn.execute(text(f"""
+                    SELECT COUNT(*), (ARRAY_AGG(DISTINCT l.id_pedido ORDER BY l.id_pedido))[1:10]
+                    FROM {legado} l
+                    WHERE NOT EXISTS (SELECT 1 FROM {schema}.pedido p WHERE p.id = l.id_pedido)
+                """)).one()
+                if orfaos:
+                    raise RuntimeError(
+                        f"{legado}: {orfaos} item(ns) sem pedido correspondente "
+                        f"(id_pedido {', '.join(map(str, exemplos))}...). Corrija ou remova esses itens "
+                        f"e rode a migração de novo; nada foi alterado."
+                    )
+                origem = f"{legado} l JOIN {schema}.pedido p ON p.id = l.id_pedido"
+                selecao = [f"l.{c}" if c != 'data_pedido' else "p.data" for c in colunas]
+            else:
+                origem = f"{legado} l"
+                selecao = [f"l.{c}" for c in colunas]
+
+            coluna = tabelas[tabela]
+            inicio, fim = conn.execute(text(
+                f"SELECT MIN({selecao[colunas.index(coluna)]}), MAX({selecao[colunas.index(coluna)]}) FROM {origem}"
+            )).one()
+            garantir_particoes(conn, tabela, inicio, fim, schema)
+            qtd = conn.execute(text(
+                f"INSERT INTO {schema}.{tabela} ({', '.join(colunas)}) SELECT {', '.join(selecao)} FROM {origem}"
+            )).rowcount
+            conn.execute(text(f"""
+                SELECT setval(pg_get_serial_sequence('{schema}.{tabela}', 'id'),
+                              COALESCE((SELECT MAX(id) FROM {schema}.{tabela}), 0) + 1, false)
+            """))
+            print(f"🔄 {schema}.{tabela}: {qtd} linha(s) migrada(s) para a tabela particionada.")
+
+            # Depois da cópia: as triggers de auditoria/meses removidos não disparam no INSERT
+            for comando in ddl_triggers(f"{schema}.{tabela}"):
+                conn.execute(text(comando))
+
+        # Remove as antigas na ordem inversa das FKs (itens antes dos pedidos)
+        for tabela in reversed([t for t in tabelas if t in pendentes]):
+            conn.execute(text(f"DROP TABLE {schema}.{tabela}_legado;"))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gerenciador de partições mensais (trusted)')
+    parser.add_argument('--futuros', type=int, default=PARTICOES_MESES_FUTUROS,
+                        help='Meses à frente a pré-criar')
+    parser.add_argument('--migrar', action='store_true', help='Converte tabelas não particionadas')
+    parser.add_argument('--manter', metavar='AAAA-MM', help='VACUUM ANALYZE das partições do mês')
+    parser.add_argument('--desanexar-ate', metavar='AAAA-MM', help='Desanexa partições anteriores ao mês')
+    args = parser.parse_args()
+
+    if args.migrar:
+        migrar()
+    if args.manter:
+        manter_mes(date.fromisoformat(f"{args.manter}-01"))
+    if args.desanexar_ate:
+        desanexar_ate(date.fromisoformat(f"{args.desanexar_ate}-01"))
+    garantir_particoes_futuras(args.futuros)
@@ -0,0 +1,237 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+from sqlalchemy import text
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from conexao import get_engine
+
+# =====================================================
+# 🔬 Captura de planos de execução e detecção de regressão
+# =====================================================
+# Opcional (PLANOS_CAPTURA=true). Cada consulta nomeada do pipeline roda com
+# EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) e o plano vai para
+# trusted.historico_planos com tempos, buffers e o "formato" do plano
+# (tipos de nó, joins e tabelas, sem custos/linhas).
+#
+# Uma execução é marcada como regressão quando, em relação às últimas
+# PLANOS_JANELA execuções da mesma consulta:
+#   - o formato do plano mudou (ex: Hash Join → Nested Loop em pedido_item), ou
+#   - o tempo passou de PLANOS_LIMIAR_TEMPO × a mediana (e ao menos
+#     PLANOS_TEMPO_MINIMO_MS a mais, para ignorar ruído em consultas rápidas).
+#
+# Uso avulso (arquivos .sql, em transação desfeita ao final):
+#   python script/planos.py --arquivo script/CONSULTA_TOP10_PRODUTOS_BEST_SELLERS.sql
+#   python script/planos.py --relatorio
+# =====================================================
+
+PLANOS_CAPTURA = os.getenv("PLANOS_CAPTURA", "false").lower() in ("1", "true", "sim")
+PLANOS_LIMIAR_TEMPO = float(os.getenv("PLANOS_LIMIAR_TEMPO", "2.0"))
+PLANOS_TEMPO_MINIMO_MS = float(os.getenv("PLANOS_TEMPO_MINIMO_MS", "50"))
+PLANOS_JANELA = int(os.getenv("PLANOS_JANELA", "5"))
+
+# Partições mensais (pedido_2024_01, pedido_item_2024_01_pkey...) e tabelas
+# sombra da refined (kpis_vendas__novo) viram um único nome
+_RE_SUFIXO_PARTICAO = re.compile(r"_\d{4}_\d{2}(?=_|$)|__novo$")
+
+def _normalizar_nome(nome: str) -> str:
+    return _RE_SUFIXO_PARTICAO.sub("", nome)
+
+def formato_plano(no: dict) -> str:
+    """
+    Formato estrutural do plano: tipo de nó, join/estratégia e relação/índice
+    de cada nó, sem custos, linhas ou tempos. Filhos de Append sobre partições
+    são agrupados, para o formato não mudar a cada mês novo.
+    """
+    rotulo = no["Node Type"]
+    detalhes = [no[chave] for chave in ("Join Type", "Strategy") if chave in no]
+    for chave in ("Relation Name", "Index Name"):
+        if chave in no:
+            detalhes.append(_normalizar_nome(no[chave]))
+    if detalhes:
+        rotulo += f"({', '.join(detalhes)})"
+
+    filhos = [formato_plano(filho) for filho in no.get("Plans", [])]
+    if no["Node Type"] in ("Append", "Merge Append"):
+        filhos = sorted(set(filhos))
+    return rotulo + (f"[{'; '.join(filhos)}]" if filhos else "")
+
+def _avaliar_regressao(conn, consulta: str, hash_plano: str, tempo_ms: float) -> list:
+    anteriores = conn.execute(text("""
+        SELECT hash_plano, tempo_execucao_ms
+        FROM trusted.historico_planos
+        WHERE consulta = :consulta
+        ORDER BY capturado_em DESC, id DESC
+        LIMIT :janela
+    """), {'consulta': consulta, 'janela': PLANOS_JANELA}).fetchall()
+    if not anteriores:
+        return []
+
+    motivos = []
+    if anteriores[0][0] != hash_plano:
+        motivos.append(f"formato do plano mudou ({anteriores[0][0]} → {hash_plano})")
+    mediana = statistics.median(float(r[1]) for r in anteriores)
+    if tempo_ms > mediana * PLANOS_LIMIAR_TEMPO and tempo_ms - mediana >= PLANOS_TEMPO_MINIMO_MS:
+        motivos.append(f"tempo {tempo_ms:.0f} ms vs mediana {mediana:.0f} ms (x{tempo_ms / max(mediana, 0.001):.1f})")
+    return motivos
+
+def registrar_plano(consulta: str, explain: list) -> dict:
+    """Grava o resultado de um EXPLAIN (FORMAT JSON) no histórico e avalia regressão"""
+    raiz = explain[0]
+    plano = raiz["Plan"]
+    formato = formato_plano(plano)
+    resumo = {
+        'consulta': consulta,
+        'hash_plano': hashlib.sha256(formato.encode()).hexdigest()[:16],
+        'formato_plano': formato,
+        'tempo_planejamento_ms': raiz.get("Planning Time"),
+        'tempo_execucao_ms': raiz.get("Execution Time"),
+        'blocos_cache': plano.get("Shared Hit Blocks"),
+        'blocos_lidos': plano.get("Shared Read Blocks"),
+    }
+
+    # Conexão própria: o histórico não depende da transação da consulta
+    with get_engine().begin() as conn:
+        motivos = _avaliar_regressao(conn, consulta, resumo['hash_plano'], resumo['tempo_execucao_ms'] or 0)
+        conn.execute(text("""
+            INSERT INTO trusted.historico_planos
+                (consulta, hash_plano, formato_plano, tempo_planejamento_ms, tempo_execucao_ms,
+                 blocos_cache, blocos_lidos, plano, regressao, motivo)
+            VALUES
+                (:consulta, :hash_plano, :formato_plano, :tempo_planejamento_ms, :tempo_execucao_ms,
+                 :blocos_cache, :blocos_lidos, CAST(:plano AS JSONB), :regressao, :motivo)
+        """), {
+            **resumo,
+            'plano': json.dumps(explain),
+            'regressao': bool(motivos),
+            'motivo': '; '.join(motivos) or None,
+        })
+
+    if motivos:
+        print(f"⚠️  Regressão de plano em {consulta}: {'; '.join(motivos)}")
+    return {**resumo, 'motivos': motivos}
+
+def capturar_plano(conn, consulta: str, sql: str, parametros=None) -> dict:
+    """
+    Executa `sql` com EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) na conexão/transação
+    de `conn` e registra o plano. INSERT/DELETE são de fato executados.
+    """
+    explain = conn.execute(
+        text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), parametros or {}
+    ).scalar()
+    if isinstance(explain, str):
+        explain = json.loads(explain)
+    return registrar_plano(consulta, explain)
+
+def executar(conn, consulta: str, sql: str, parametros=None):
+    """
+    Executa um comando sem retorno de linhas (INSERT/DELETE). Com
+    PLANOS_CAPTURA, a execução é a do próprio EXPLAIN ANALYZE (sem rodar duas vezes).
+    """
+    if PLANOS_CAPTURA:
+        capturar_plano(conn, consulta, sql, parametros)
+    else:
+        conn.execute(text(sql), parametros or {})
+
+# =====================================================
+# 📄 Execução avulsa: arquivos .sql e relatório
+# =====================================================
+# Comandos com plano (EXPLAIN aceita): consultas, DML e CREATE ... AS
+_RE_PLANEJAVEL = re.compile(
+    r"^(SELECT|WITH|INSERT|UPDATE|DELETE|CREATE\s+(MATERIALIZED\s+VIEW|TABLE)\s+[\w.]+\s+AS)\b",
+    re.IGNORECASE
+)
+
+def _comandos_arquivo(caminho: str) -> list:
+    """Separa o arquivo por ';', respeitando strings, comentários e corpos $$...$$"""
+    with open(caminho, encoding='utf-8') as f:
+        sql = f.read()
+
+    comandos, atual, i = [], [], 0
+    while i < len(sql):
+        if sql.startswith('--', i):
+            fim = sql.find('\n', i)
+            i = len(sql) if fim < 0 else fim
+            continue
+        for delimitador in ("$$", "'"):
+            if sql.startswith(delimitador, i):
+                fim = sql.find(delimitador, i + len(delimitador))
+                fim = len(sql) if fim < 0 else fim + len(delimitador)
+                atual.append(sql[i:fim])
+                i = fim
+                break
+        else:
+            if sql[i] == ';':
+                comandos.append(''.join(atual).strip())
+                atual = []
+            else:
+                atual.append(sql[i])
+            i += 1
+    comandos.append(''.join(atual).strip())
+    return [comando for comando in comandos if comando]
+
+def capturar_arquivo(caminho: str):
+    """
+    Captura o plano de cada consulta do arquivo. Os demais comandos (índices,
+    COMMENT, funções) são executados para as consultas seguintes os
+    enxergarem; tudo é desfeito ao final.
+    """
+    prefixo = os.path.splitext(os.path.basename(caminho))[0]
+    with get_engine().connect() as conn:
+        transacao = conn.begin()
+        try:
+            for indice, comando in enumerate(_comandos_arquivo(caminho), start=1):
+                consulta = f"{prefixo}#{indice}"
+                ponto = conn.begin_nested()
+                try:
+                    # Cursor do driver sem parâmetros: ':' e '%' em literais ficam intactos
+                    with conn.connection.cursor() as cursor:
+                        if _RE_PLANEJAVEL.match(comando):
+                            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {comando}")
+                            explain = cursor.fetchone()[0]
+                            resumo = registrar_plano(
+                                consulta, json.loads(explain) if isinstance(explain, str) else explain
+                            )
+                            print(f"🔬 {consulta}: {resumo['tempo_execucao_ms']:.1f} ms, plano {resumo['hash_plano']}")
+                        else:
+                            cursor.execute(comando)
+                    ponto.commit()
+                except Exception as e:
+                    ponto.rollback()
+                    print(f"❌ {consulta}: {str(e).splitlines()[0]}")
+        finally:
+            transacao.rollback()
+
+def imprimir_relatorio(limite: int = 20):
+    with get_engine().connect() as conn:
+        linhas = conn.execute(text("""
+            SELECT capturado_em, consulta, tempo_execucao_ms, motivo
+            FROM trusted.historico_planos
+            WHERE regressao
+            ORDER BY capturado_em DESC
+            LIMIT :limite
+        """), {'limite': limite}).fetchall()
+
+    print("\n" + "="*60)
+    print("🔬 REGRESSÕES DE PLANO RECENTES")
+    print("="*60)
+    if not linhas:
+        print("✅ Nenhuma regressão registrada.")
+    for capturado_em, consulta, tempo, motivo in linhas:
+        print(f"{capturado_em:%Y-%m-%d %H:%M}  {consulta}  {float(tempo):.0f} ms  → {motivo}")
+    print("="*60)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Captura de planos e detecção de regressão')
+    parser.add_argument('--arquivo', action='append', default=[], help='Arquivo .sql a analisar (repetível)')
+    parser.add_argument('--relatorio', action='store_true', help='Lista as regressões registradas')
+    args = parser.parse_args()
+
+    for arquivo in args.arquivo:
+        capturar_arquivo(arquivo)
+    if args.relatorio or not args.arquivo:
+        imprimir_relatorio()
@@ -0,0 +1,369 @@
+import argparse
+import hashlib
+import inspect
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime
+from functools import lru_cache
+from sqlalchemy import text
+
+from transform_refined import (
+    SUFIXO_SOMBRA, TRANSFORMACOES, _criar_sombra, _estrutura_confere, _parametros_conferem,
+    _somar_meses, _trocar_sombra, erro, inicializar_schemas, log, parametros_mart,
+    registrar_parametros, usa_view_materializada,
+)
+from conexao import DB_APPLICATION_NAME, get_engine
+from esquema_ddl import ddl_tabela
+
+# ==========================================================
+# 🕰️ Backfill histórico da refined em fatias mensais
+# ==========================================================
+# Reconstrói um intervalo de meses sem um único INSERT gigante: cada fatia
+# (mart × mês) é um DELETE + INSERT do mês pelo caminho incremental de
+# transform_refined.py, em sua própria transação (locks e espaço temporário
+# de um mês por vez). As fatias rodam num pool de threads respeitando:
+#   - entradas refined do mesmo mês (base_vendas_diaria antes dos marts);
+#   - marts com "depende_mes_anterior" (LAG): meses em ordem, após as entradas
+#     do mês anterior e do seguinte (a fatia também regrava meses seguintes,
+#     que a fatia de cada um deles regrava de novo depois);
+#   - marts publicados como view materializada: um REFRESH ao final das entradas.
+#
+# Retomada: cada fatia concluída fica em refined.controle_backfill com a
+# versão do mart (hash do código, DDL, parâmetros e entradas refined).
+# Rodar de novo o mesmo backfill (--nome) pula as fatias já concluídas na
+# mesma versão.
+#
+# Throttling (para não disputar o banco com o BI):
+#   - REFINED_BACKFILL_HORARIO_COMERCIAL (ex: 8-19) → no horário, no máximo
+#     REFINED_BACKFILL_WORKERS_COMERCIAL fatias ao mesmo tempo;
+#   - REFINED_BACKFILL_MAX_CONSULTAS_ATIVAS → uma fatia só inicia com menos
+#     consultas de outros clientes ativas no banco (0 = sem limite);
+#   - REFINED_BACKFILL_PAUSA_S → pausa após cada fatia.
+#
+# Uso:
+#   python script/transformacao/backfill_refined.py --inicio 2023-01 --fim 2024-12
+#   python script/transformacao/backfill_refined.py --inicio 2024-01 --fim 2024-06 \
+#       --marts base_vendas_diaria,analise_regional --workers 2
+# ==========================================================
+
+REFINED_BACKFILL_WORKERS = int(os.getenv("REFINED_BACKFILL_WORKERS", "4"))
+REFINED_BACKFILL_WORKERS_COMERCIAL = int(os.getenv("REFINED_BACKFILL_WORKERS_COMERCIAL", "1"))
+REFINED_BACKFILL_HORARIO_COMERCIAL = os.getenv("REFINED_BACKFILL_HORARIO_COMERCIAL", "8-19")
+REFINED_BACKFILL_MAX_CONSULTAS_ATIVAS = int(os.getenv("REFINED_BACKFILL_MAX_CONSULTAS_ATIVAS", "5"))
+REFINED_BACKFILL_PAUSA_S = float(os.getenv("REFINED_BACKFILL_PAUSA_S", "0"))
+
+# Intervalo entre verificações de carga/horário enquanto há fatias esperando
+_INTERVALO_ESPERA_S = 10
+
+# ==========================================================
+# 🧾 Controle das fatias
+# ==========================================================
+def _codigo(funcao, vistas: set) -> str:
+    """
+    Código de `funcao` e, recursivamente, das funções e constantes (SQL_*,
+    REFINED_*) do mesmo módulo que ela usa (ex: _materializar, _filtro_meses)
+    """
+    if funcao in vistas:
+        return ""
+    vistas.add(funcao)
+    modulo = sys.modules[funcao.__module__]
+    nomes, codigos = set(), [funcao.__code__]
+    while codigos:
+        codigo = codigos.pop()
+        nomes.update(codigo.co_names)
+        codigos.extend(c for c in codigo.co_consts if inspect.iscode(c))
+
+    partes = [inspect.getsource(funcao)]
+    for nome in sorted(nomes):
+        valor = getattr(modulo, nome, None)
+        if inspect.isfunction(valor) and valor.__module__ == funcao.__module__:
+            partes.append(_codigo(valor, vistas))
+        elif nome.isupper() and isinstance(valor, (str, int, float)):
+            partes.append(f"{nome}={valor!r}")
+    return "\n".join(partes)
+
+@lru_cache(maxsize=None)
+def versao_mart(tabela: str) -> str:
+    """
+    Hash de tudo que define o conteúdo do mart: código da transformação e do
+    que ela usa em transform_refined.py (_materializar, helpers, SQLs), DDL,
+    parâmetros e a versão das entradas refined (ex: base_vendas_diaria).
+    Mudou algo, as fatias antigas não valem.
+    """
+    transformacao = TRANSFORMACOES[tabela]
+    partes = [_codigo(transformacao["funcao"], set()), *ddl_tabela(f"refined.{tabela}"), parametros_mart(tabela)]
+    partes += [
+        versao_mart(entrada.split('.', 1)[1]) for entrada in transformacao["entradas"]
+        if entrada.startswith('refined.') and entrada.split('.', 1)[1] in TRANSFORMACOES
+    ]
+    return hashlib.sha256("\n".join(partes).encode()).hexdigest()[:16]
+
+def fatias_concluidas(nome: str) -> set:
+    """{(tabela, mes)} concluídas neste backfill na versão atual de cada mart"""
+    with get_engine().connect() as conn:
+        linhas = conn.execute(text("""
+            SELECT tabela, mes_ano, versao FROM refined.controle_backfill
+            WHERE nome = :nome AND status = 'concluida'
+        """), {'nome': nome}).fetchall()
+    return {
+        (tabela, mes) for tabela, mes, versao in linhas
+        if tabela in TRANSFORMACOES and versao == versao_mart(tabela)
+    }
+
+def registrar_fatia(nome: str, tabela: str, mes: date, status: str, duracao_s: float = None, mensagem: str = None):
+    with get_engine().begin() as conn:
+        conn.execute(text("""
+            INSERT INTO refined.controle_backfill (nome, tabela, mes_ano, versao, status, duracao_s, erro, atualizado_em)
+            VALUES (:nome, :tabela, :mes, :versao, :status, :duracao, :erro, CURRENT_TIMESTAMP)
+            ON CONFLICT (nome, tabela, mes_ano) DO UPDATE SET
+                versao = EXCLUDED.versao,
+                status = EXCLUDED.status,
+                duracao_s = EXCLUDED.duracao_s,
+                erro = EXCLUDED.erro,
+                atualizado_em = EXCLUDED.atualizado_em
+        """), {
+            'nome': nome, 'tabela': tabela, 'mes': mes, 'versao': versao_mart(tabela),
+            'status': status, 'duracao': duracao_s, 'erro': mensagem,
+        })
+
+# ==========================================================
+# 🚦 Throttling
+# ==========================================================
+def em_horario_comercial(agora: datetime = None) -> bool:
+    if not REFINED_BACKFILL_HORARIO_COMERCIAL:
+        return False
+    inicio, fim = (int(h) for h in REFINED_BACKFILL_HORARIO_COMERCIAL.split("-"))
+    return inicio <= (agora or datetime.now()).hour < fim
+
+def limite_workers(workers: int) -> int:
+    """Fatias simultâneas permitidas agora (menos no horário comercial)"""
+    if em_horario_comercial():
+        return max(1, min(workers, REFINED_BACKFILL_WORKERS_COMERCIAL))
+    return workers
+
+def consultas_ativas() -> int:
+    """Consultas de outros clientes em execução no banco (exclui as conexões deste processo)"""
+    with get_engine().connect() as conn:
+        return conn.execute(text("""
+            SELECT COUNT(*) FROM pg_stat_activity
+            WHERE datname = current_database()
+              AND backend_type = 'client backend'
+              AND state = 'active'
+              AND pid <> pg_backend_pid()
+              AND application_name <> :aplicacao
+        """), {'aplicacao': DB_APPLICATION_NAME}).scalar()
+
+def banco_com_folga() -> bool:
+    return REFINED_BACKFILL_MAX_CONSULTAS_ATIVAS <= 0 or consultas_ativas() < REFINED_BACKFILL_MAX_CONSULTAS_ATIVAS
+
+# ==========================================================
+# 🧩 Fatias e dependências
+# ==========================================================
+def meses_do_intervalo(inicio: date, fim: date) -> list:
+    meses, mes = [], date(inicio.year, inicio.month, 1)
+    while mes <= fim:
+        meses.append(mes)
+        mes = _somar_meses(mes, 1)
+    return meses
+
+def planejar_fatias(marts: list, meses: list) -> dict:
+    """
+    {fatia: {fatias das quais depende}} com fatia = (tabela, mês) ou
+    (tabela, None) para marts publicados como view materializada.
+    """
+    views = {t for t in marts if usa_view_materializada(t)}
+
+    def fatias_de(tabela):
+        return [(tabela, None)] if tabela in views else [(tabela, mes) for mes in meses]
+
+    fatias = {}
+    for tabela in marts:
+        entradas = [
+            e.split('.', 1)[1] for e in TRANSFORMACOES[tabela]["entradas"]
+            if e.startswith('refined.') and e.split('.', 1)[1] in marts
+        ]
+        for fatia in fatias_de(tabela):
+            mes = fatia[1]
+            dependencias = set()
+            for entrada in entradas:
+                if mes is None or entrada in views:
+                    dependencias.update(fatias_de(entrada))
+                    continue
+                dependencias.add((entrada, mes))
+                if TRANSFORMACOES[tabela].get("depende_mes_anterior"):
+                    # A fatia lê o mês anterior e regrava também os seguintes
+                    dependencias.update(
+                        (entrada, vizinho) for vizinho in (_somar_meses(mes, -1), _somar_meses(mes, 1))
+                        if vizinho in meses
+                    )
+            if mes is not None and TRANSFORMACOES[tabela].get("depende_mes_anterior") \
+                    and _somar_meses(mes, -1) in meses:
+                # Fatias vizinhas regravam o mesmo mês: uma de cada vez, em ordem
+                dependencias.add((tabela, _somar_meses(mes, -1)))
+            fatias[fatia] = dependencias
+    return fatias
+
+def preparar_marts(marts: list, recriar: bool):
+    """
+    Confere se cada mart (tabela) já está na estrutura/parâmetros atuais. Se
+    não estiver, com `recriar` publica a tabela vazia pelo ddl.sql; sem,
+    interrompe (o DELETE + INSERT por mês exige a estrutura atual).
+    """
+    with get_engine().begin() as conn:
+        for comando in ddl_tabela("refined.controle_backfill"):
+            conn.execute(text(comando))
+        for tabela in marts:
+            if usa_view_materializada(tabela):
+                continue
+            if _estrutura_confere(conn, tabela) and _parametros_conferem(conn, tabela):
+                continue
+            if not recriar:
+                raise SystemExit(
+                    f"❌ refined.{tabela} não está na estrutura/parâmetros atuais do ddl.sql. "
+                    f"Use --recriar (a tabela é recriada vazia; meses fora do intervalo ficam sem dados)."
+                )
+            _criar_sombra(conn, tabela)
+            registrar_parametros(conn, tabela, f"{tabela}{SUFIXO_SOMBRA}")
+            _trocar_sombra(conn, tabela)
+            log(f"🧱 refined.{tabela}: recriada vazia pelo ddl.sql.")
+
+def watermarks_atuais() -> dict:
+    """Watermark de cada mart: as fatias o preservam (o backfill não adianta nem atrasa o incremental)"""
+    with get_engine().connect() as conn:
+        return dict(conn.execute(text("SELECT tabela, watermark FROM refined.controle_incremental")).fetchall())
+
+# ==========================================================
+# 🚀 Execução
+# ==========================================================
+def processar_fatia(nome: str, fatia: tuple, watermark) -> float:
+    tabela, mes = fatia
+    inicio = time.perf_counter()
+    TRANSFORMACOES[tabela]["funcao"]({'meses': None if mes is None else [mes], 'watermark': watermark})
+    duracao = time.perf_counter() - inicio
+    if mes is not None:
+        registrar_fatia(nome, tabela, mes, 'concluida', duracao)
+    if REFINED_BACKFILL_PAUSA_S > 0:
+        time.sleep(REFINED_BACKFILL_PAUSA_S)
+    return duracao
+
+def executar_backfill(inicio: date, fim: date, marts: list, nome: str, workers: int = REFINED_BACKFILL_WORKERS,
+                      recriar: bool = False):
+    """
+    Executa as fatias pendentes do intervalo. Retorna (concluidas, puladas, falhas)
+    com falhas = {fatia: exceção}; fatias que dependem de uma falha não rodam.
+    """
+    meses = meses_do_intervalo(inicio, fim)
+    preparar_marts(marts, recriar)
+    pendentes = planejar_fatias(marts, meses)
+    puladas = fatias_concluidas(nome) & set(pendentes)
+    for fatia in puladas:
+        del pendentes[fatia]
+    watermarks = watermarks_atuais()
+    concluidas, falhas = set(puladas), {}
+    if puladas:
+        log(f"⏭️  {len(puladas)} fatia(s) já concluída(s) em execução anterior de '{nome}'.")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        em_execucao = {}
+        aguardando_folga = False
+
+        def submeter_prontas():
+            nonlocal aguardando_folga
+            # Mais antigas primeiro: o histórico fica consistente do início para o fim
+            prontas = sorted(
+                (f for f, deps in pendentes.items() if deps <= concluidas),
+                key=lambda f: (f[1] or date.max, list(TRANSFORMACOES).index(f[0]))
+            )
+            for fatia in prontas:
+                if len(em_execucao) >= limite_workers(workers):
+                    return
+                if not banco_com_folga():
+                    if not aguardando_folga:
+                        log("🚦 Banco ocupado por outras consultas: aguardando folga para novas fatias...")
+                    aguardando_folga = True
+                    return
+                aguardando_folga = False
+                del pendentes[fatia]
+                em_execucao[executor.submit(processar_fatia, nome, fatia, watermarks.get(fatia[0]))] = fatia
+
+        submeter_prontas()
+        while em_execucao or any(deps <= concluidas for deps in pendentes.values()):
+            if not em_execucao:
+                time.sleep(_INTERVALO_ESPERA_S)
+                submeter_prontas()
+                continue
+            finalizados, _ = wait(em_execucao, timeout=_INTERVALO_ESPERA_S, return_when=FIRST_COMPLETED)
+            for futuro in finalizados:
+                fatia = em_execucao.pop(futuro)
+                tabela, mes = fatia
+                rotulo = f"refined.{tabela} [{'view' if mes is None else mes.strftime('%Y-%m')}]"
+                try:
+                    log(f"✅ {rotulo} concluída em {futuro.result():.2f}s.")
+                    concluidas.add(fatia)
+                except Exception as e:
+                    falhas[fatia] = e
+                    erro(f"{rotulo}: {str(e).splitlines()[0]}")
+                    if mes is not None:
+                        registrar_fatia(nome, tabela, mes, 'falha', mensagem=str(e).splitlines()[0])
+
+            # Propaga falhas para as fatias dependentes
+            bloqueadas = True
+            while bloqueadas:
+                bloqueadas = [f for f, deps in pendentes.items() if deps & set(falhas)]
+                for fatia in bloqueadas:
+                    del pendentes[fatia]
+                    falhas[fatia] = RuntimeError("fatia de entrada não concluída")
+
+            submeter_prontas()
+
+    return concluidas - puladas, puladas, falhas
+
+def imprimir_resumo(marts: list, concluidas: set, puladas: set, falhas: dict, tempo_total: float):
+    print("\n" + "="*66)
+    print("🕰️  RESUMO DO BACKFILL DA REFINED")
+    print("="*66)
+    print(f"{'Mart':<34}{'Concluídas':>11}{'Puladas':>9}{'Falhas':>8}")
+    for tabela in marts:
+        contar = lambda fatias: sum(1 for t, _ in fatias if t == tabela)
+        print(f"{tabela:<34}{contar(concluidas):>11}{contar(puladas):>9}{contar(falhas):>8}")
+    print(f"\n⏱️  Tempo total: {tempo_total:.2f}s")
+    print("="*66)
+
+def _mes_argumento(valor: str) -> date:
+    return date.fromisoformat(f"{valor}-01")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill da refined em fatias mensais (paralelo e retomável)')
+    parser.add_argument('--inicio', type=_mes_argumento, required=True, help='Primeiro mês (AAAA-MM)')
+    parser.add_argument('--fim', type=_mes_argumento, required=True, help='Último mês (AAAA-MM)')
+    parser.add_argument('--marts', help='Marts separados por vírgula (padrão: todos)')
+    parser.add_argument('--workers', type=int, default=REFINED_BACKFILL_WORKERS, help='Fatias simultâneas (fora do horário comercial)')
+    parser.add_argument('--nome', help='Identificador do backfill para retomada (padrão: AAAA-MM..AAAA-MM)')
+    parser.add_argument('--reiniciar', action='store_true', help='Descarta as fatias já concluídas deste backfill')
+    parser.add_argument('--recriar', action='store_true', help='Recria vazios os marts fora da estrutura do ddl.sql')
+    args = parser.parse_args()
+
+    marts = [t.strip() for t in args.marts.split(',')] if args.marts else list(TRANSFORMACOES)
+    desconhecidos = [t for t in marts if t not in TRANSFORMACOES]
+    if desconhecidos:
+        raise SystemExit(f"❌ Mart(s) desconhecido(s): {', '.join(desconhecidos)} (use {', '.join(TRANSFORMACOES)})")
+    marts = [t for t in TRANSFORMACOES if t in marts]
+    nome = args.nome or f"{args.inicio:%Y-%m}..{args.fim:%Y-%m}"
+
+    inicializar_schemas()
+    if args.reiniciar:
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM refined.controle_backfill WHERE nome = :nome"), {'nome': nome})
+
+    log(f"🕰️  Backfill '{nome}': {len(marts)} mart(s), {len(meses_do_intervalo(args.inicio, args.fim))} mês(es), "
+        f"até {args.workers} fatia(s) simultânea(s).")
+    inicio = time.perf_counter()
+    concluidas, puladas, falhas = executar_backfill(args.inicio, args.fim, marts, nome, args.workers, args.recriar)
+    imprimir_resumo(marts, concluidas, puladas, falhas, time.perf_counter() - inicio)
+
+    if falhas:
+        erro(f"Backfill finalizado com {len(falhas)} fatia(s) com falha; rode de novo para retomar.")
+        sys.exit(1)
+    log("🏁 Backfill finalizado com sucesso!")
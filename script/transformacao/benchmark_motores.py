@@ -0,0 +1,93 @@
+import argparse
+import time
+from sqlalchemy import text
+
+from refined_local import REFINED_LOCAL_ORIGEM, calcular_marts
+from transform_refined import TRANSFORMACOES, erro
+from conexao import get_engine
+
+# =====================================================
+# 🏎️ Benchmark: caminho SQL (transform_refined) vs motor local (pandas)
+# =====================================================
+# Para janelas crescentes dos meses mais recentes (ex: 1, 3, 6 meses e
+# todo o histórico), mede o tempo de cada implementação dos marts:
+#   - SQL   → as funções de transform_refined.py com a janela de meses
+#             (DELETE + INSERT dos meses nas tabelas publicadas; o watermark
+#             de cada mart é preservado)
+#   - local → refined_local.calcular_marts lendo os arquivos trusted
+#             (leitura + cálculo, sem publicar)
+# e indica o mais rápido em cada tamanho de dados (pedidos/itens da janela).
+#
+# Uso:
+#   python script/transformacao/benchmark_motores.py --janelas 1,3,6,0
+# =====================================================
+
+def meses_disponiveis() -> list:
+    with get_engine().connect() as conn:
+        return conn.execute(text("""
+            SELECT DISTINCT DATE_TRUNC('month', data)::DATE FROM trusted.pedido ORDER BY 1
+        """)).scalars().all()
+
+def executar_sql(meses: list) -> float:
+    """Roda todos os marts do caminho SQL na janela de meses; retorna o tempo (s)"""
+    with get_engine().connect() as conn:
+        watermarks = dict(conn.execute(text(
+            "SELECT tabela, watermark FROM refined.controle_incremental"
+        )).fetchall())
+
+    inicio = time.perf_counter()
+    for tabela, transformacao in TRANSFORMACOES.items():
+        if tabela == "vendas_categoria_variacao":
+            # Fora do motor local com janela de meses (exige o histórico completo)
+            continue
+        try:
+            transformacao["funcao"]({'meses': meses, 'watermark': watermarks.get(tabela)})
+        except Exception as e:
+            erro(f"refined.{tabela} (SQL): {str(e).splitlines()[0]}")
+    return time.perf_counter() - inicio
+
+def executar_benchmark(janelas: list, origem: str, repeticoes: int) -> list:
+    disponiveis = meses_disponiveis()
+    resultados = []
+    for janela in janelas:
+        meses = disponiveis[-janela:] if janela else disponiveis
+        tempos_sql, tempos_local, stats = [], [], {}
+        for _ in range(repeticoes):
+            tempos_sql.append(executar_sql(meses))
+            inicio = time.perf_counter()
+            _, stats = calcular_marts(origem, meses)
+            tempos_local.append(time.perf_counter() - inicio)
+        resultados.append({
+            'meses': len(meses),
+            'pedidos': stats['pedidos'],
+            'itens': stats['itens'],
+            'sql_s': min(tempos_sql),
+            'local_s': min(tempos_local),
+        })
+    return resultados
+
+def imprimir_resultados(resultados: list):
+    print("\n" + "="*76)
+    print("🏁 RESULTADO DO BENCHMARK: SQL vs MOTOR LOCAL (melhor tempo de cada)")
+    print("="*76)
+    print(f"{'Meses':>6}{'Pedidos*':>11}{'Itens*':>11}{'SQL (s)':>10}{'Local (s)':>11}   Mais rápido")
+    for r in resultados:
+        if r['sql_s'] <= r['local_s']:
+            vencedor = f"SQL ({r['local_s'] / max(r['sql_s'], 1e-9):.1f}x)"
+        else:
+            vencedor = f"local ({r['sql_s'] / max(r['local_s'], 1e-9):.1f}x)"
+        print(f"{r['meses']:>6}{r['pedidos']:>11,}{r['itens']:>11,}{r['sql_s']:>10.2f}{r['local_s']:>11.2f}   {vencedor}")
+    print("-"*76)
+    print("* lidos pelo motor local na janela (sem vendas_categoria_variacao nos dois caminhos)")
+    print("="*76)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark dos marts: caminho SQL vs motor local (pandas)')
+    parser.add_argument('--janelas', default='1,3,6,0',
+                        help='Tamanhos da janela em meses mais recentes (0 = histórico completo)')
+    parser.add_argument('--origem', default=REFINED_LOCAL_ORIGEM, help='Diretório dos arquivos trusted')
+    parser.add_argument('--repeticoes', type=int, default=1, help='Execuções por janela (vale o melhor tempo)')
+    args = parser.parse_args()
+
+    janelas = [int(j) for j in args.janelas.split(',') if j.strip()]
+    imprimir_resultados(executar_benchmark(janelas, args.origem, args.repeticoes))
@@ -0,0 +1,114 @@
+import argparse
+import statistics
+import threading
+import time
+from sqlalchemy import text
+
+import transform_refined as refined
+from transform_refined import TRANSFORMACOES, planejar_refresh
+from conexao import get_engine
+
+# =====================================================
+# 🏎️ Benchmark dos marts: tabela (sombra + troca) vs view materializada
+# =====================================================
+# Para cada backend, publica o mart e repete o refresh completo enquanto
+# uma thread leitora consulta o mart sem parar, medindo:
+#   - tempo de cada refresh (sombra + troca / REFRESH CONCURRENTLY)
+#   - latência das leituras durante os refreshes (p50, p95, máx.)
+# Ao final o mart volta ao backend configurado no .env.
+#
+# Uso:
+#   python script/transformacao/benchmark_refined.py --mart kpis_vendas
+# =====================================================
+
+BACKENDS = ('tabela', 'view')
+
+def refresh_completo(mart: str):
+    """Refresh completo do mart no backend ativo (sem janela de meses)"""
+    TRANSFORMACOES[mart]["funcao"](planejar_refresh(mart, modo='completo'))
+
+def ler_continuamente(mart: str, consulta: str, parar: threading.Event, latencias: list, erros: list):
+    """Executa a consulta de leitura em laço até `parar`, guardando a latência (ms)"""
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            try:
+                conn.execute(text(consulta.format(mart=mart))).fetchall()
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            except Exception as e:
+                erros.append(str(e).splitlines()[0])
+
+def _percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def executar_benchmark(mart: str, repeticoes: int, consulta: str):
+    configurado = set(refined.REFINED_VIEWS_MATERIALIZADAS)
+    resultados = {}
+
+    try:
+        for backend in BACKENDS:
+            refined.REFINED_VIEWS_MATERIALIZADAS.discard(mart)
+            if backend == 'view':
+                refined.REFINED_VIEWS_MATERIALIZADAS.add(mart)
+            # Publica o mart no backend (criação/troca fora da medição)
+            refresh_completo(mart)
+
+            latencias, erros, tempos = [], [], []
+            parar = threading.Event()
+            leitor = threading.Thread(target=ler_continuamente, args=(mart, consulta, parar, latencias, erros))
+            leitor.start()
+            try:
+                for _ in range(repeticoes):
+                    inicio = time.perf_counter()
+                    refresh_completo(mart)
+                    tempos.append(time.perf_counter() - inicio)
+            finally:
+                parar.set()
+                leitor.join()
+
+            resultados[backend] = {
+                'refresh_medio_s': statistics.mean(tempos),
+                'refresh_max_s': max(tempos),
+                'leituras': len(latencias),
+                'leitura_p50_ms': _percentil(latencias, 50),
+                'leitura_p95_ms': _percentil(latencias, 95),
+                'leitura_max_ms': max(latencias, default=0.0),
+                'erros_leitura': len(erros),
+            }
+    finally:
+        refined.REFINED_VIEWS_MATERIALIZADAS.clear()
+        refined.REFINED_VIEWS_MATERIALIZADAS.update(configurado)
+        refresh_completo(mart)
+
+    return resultados
+
+def imprimir_resultados(mart: str, resultados: dict):
+    print("\n" + "="*86)
+    print(f"🏁 RESULTADO DO BENCHMARK: refined.{mart}")
+    print("="*86)
+    print(f"{'Backend':<10}{'Refresh méd.(s)':>16}{'Refresh máx.(s)':>16}{'Leituras':>10}"
+          f"{'p50 (ms)':>10}{'p95 (ms)':>10}{'máx. (ms)':>11}{'Erros':>7}")
+    for backend, r in resultados.items():
+        print(f"{backend:<10}{r['refresh_medio_s']:>16.2f}{r['refresh_max_s']:>16.2f}{r['leituras']:>10,}"
+              f"{r['leitura_p50_ms']:>10.1f}{r['leitura_p95_ms']:>10.1f}{r['leitura_max_ms']:>11.1f}"
+              f"{r['erros_leitura']:>7}")
+    print("="*86)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark dos marts: tabela vs view materializada')
+    parser.add_argument('--mart', default='kpis_vendas', help='Mart refined com PK/UNIQUE no ddl.sql')
+    parser.add_argument('--repeticoes', type=int, default=3, help='Refreshes medidos por backend')
+    parser.add_argument('--consulta', default='SELECT * FROM refined.{mart} ORDER BY 1 DESC LIMIT 100',
+                        help='Consulta da thread leitora ({mart} = nome do mart)')
+    args = parser.parse_args()
+
+    if args.mart not in TRANSFORMACOES:
+        raise SystemExit(f"❌ Mart desconhecido: {args.mart} (use {', '.join(TRANSFORMACOES)})")
+    if refined.chave_unica(args.mart) is None:
+        raise SystemExit(f"❌ refined.{args.mart} não tem PK/UNIQUE no ddl.sql (exigido pela view materializada)")
+
+    resultados = executar_benchmark(args.mart, args.repeticoes, args.consulta)
+    imprimir_resultados(args.mart, resultados)
@@ -0,0 +1,549 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# ==========================================================
+# 🧮 Motor local da refined (pandas, direto dos arquivos trusted)
+# ==========================================================
+# Segunda implementação dos marts de transform_refined.py, calculada em
+# memória a partir dos arquivos CSV/Parquet da trusted (./data/trusted),
+# sem ingestão nem ida ao PostgreSQL. Serve para backfill, desenvolvimento
+# local e como conferência cruzada do caminho SQL.
+#
+# Memória limitada: pedido_item (a maior tabela) é lida em chunks de
+# REFINED_LOCAL_CHUNKSIZE linhas, duas vezes:
+#   1ª passada → estado por pedido (itens válidos, primeiro item, primeiro
+#                item cancelado por marca), em arrays numpy indexados pelo pedido
+#   2ª passada → agregação parcial de cada chunk por dia × UF × produto × marca,
+#                consolidada aos poucos (memória ~ tamanho da base, não dos itens)
+# Pedidos, produtos, marcas e metas ficam em memória (só as colunas usadas).
+#
+# Valores NUMERIC são mantidos como inteiros escalados (centavos, como em
+# leitores.py): somas exatas e ROUND(x, 2) do PostgreSQL (metade para longe
+# do zero) refeito em aritmética inteira.
+#
+# Uso:
+#   python script/transformacao/refined_local.py --comparar
+#   python script/transformacao/refined_local.py --meses 2024-01,2024-02 --saida ./data/refined
+#   python script/transformacao/refined_local.py --publicar      # COPY para refined.* (sombra + troca)
+# ==========================================================
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ingestao'))
+from conexao import get_engine
+from leitores import (
+    escalar_decimal, ler_lotes, localizar_arquivo, pico_rss_mb, preparar_para_escrita, schema_leitura,
+)
+from load_data_rds import copy_chunk
+from transform_refined import (
+    REFINED_TOP_N, SUFIXO_SOMBRA, TRANSFORMACOES, _criar_sombra, _dependentes, _trocar_sombra,
+    colunas_mart, erro, log, registrar_parametros, usa_view_materializada,
+)
+
+REFINED_LOCAL_ORIGEM = os.getenv("REFINED_LOCAL_ORIGEM", "./data/trusted")
+REFINED_LOCAL_CHUNKSIZE = int(os.getenv("REFINED_LOCAL_CHUNKSIZE", "100000"))
+
+# 🔑 Grão de cada mart (conferência cruzada) e coluna/expressão do mês (DELETE por janela)
+MARTS = {
+    "base_vendas_diaria": {
+        "chave": ["data", "sgl_uf_entrega", "id_produto", "id_marca"],
+        "mes": "DATE_TRUNC('month', data)::DATE",
+    },
+    "mais_vendidos_mensal_estado": {"chave": ["mes_ano", "sgl_uf_entrega", "id_produto"], "mes": "mes_ano"},
+    "performance_mensal_marca": {"chave": ["ano", "mes", "id"], "mes": "MAKE_DATE(ano, mes, 1)"},
+    "kpis_vendas": {"chave": ["mes_ano"], "mes": "mes_ano"},
+    "analise_cancelamentos": {"chave": ["mes_ano", "sgl_uf_entrega", "marca"], "mes": "mes_ano"},
+    "vendas_categoria_variacao": {"chave": ["mes_ano", "categoria"], "mes": "mes_ano"},
+    "analise_regional": {"chave": ["mes_ano", "sgl_uf_entrega"], "mes": "mes_ano"},
+}
+
+# Medidas da base somadas com NULL quando não há linha no filtro (SUM do SQL);
+# as demais são contagens (COUNT, nunca NULL)
+SOMAS_BASE = [
+    "qtd_produto", "vlr_pedidos_itens", "qtd_produto_valido", "vlr_itens_validos",
+    "vlr_pedidos_validos", "vlr_pedidos_cancelamento",
+]
+CONTAGENS_BASE = [
+    "qtd_pedidos", "qtd_pedidos_cancelamento", "qtd_itens", "qtd_itens_validos",
+    "qtd_vlr_pedidos_validos", "qtd_itens_cancelamento", "qtd_vlr_pedidos_cancelamento",
+]
+
+# ==========================================================
+# 📖 Leitura dos arquivos trusted
+# ==========================================================
+def _tipar_parquet(df, tabela):
+    """Lote Parquet → mesmos tipos de ler_csv_tipado (datas datetime64, NUMERIC escalado)"""
+    leitura = schema_leitura(tabela)
+    for coluna in leitura['datas']:
+        if coluna in df.columns:
+            df[coluna] = pd.to_datetime(df[coluna])
+    for coluna, escala in leitura['decimais'].items():
+        if coluna in df.columns:
+            df[coluna] = escalar_decimal(df[coluna], escala)
+    return df
+
+def ler_tabela(origem, tabela, colunas, chunksize=REFINED_LOCAL_CHUNKSIZE):
+    """Gera chunks pandas tipados de `tabela` (CSV ou Parquet) só com `colunas`"""
+    caminho = localizar_arquivo(origem, tabela)
+    for lote, _ in ler_lotes(caminho, tabela, chunksize):
+        if not isinstance(lote, pd.DataFrame):
+            lote = _tipar_parquet(lote.to_pandas(), tabela)
+        yield lote[[c for c in colunas if c in lote.columns]]
+
+def _ler_inteira(origem, tabela, colunas):
+    chunks = list(ler_tabela(origem, tabela, colunas))
+    if not chunks:
+        return pd.DataFrame(columns=colunas)
+    return pd.concat(chunks, ignore_index=True)
+
+def _mes(datas):
+    """DATE_TRUNC('month', data) de uma Series datetime64"""
+    return pd.Series(datas.values.astype('datetime64[M]').astype('datetime64[ns]'), index=datas.index)
+
+def _dividir(numerador, denominador, fator=1):
+    """
+    ROUND(numerador * fator / NULLIF(denominador, 0)) em inteiros, com o
+    arredondamento do NUMERIC do PostgreSQL (metade para longe do zero)
+    """
+    n = numerador.astype('Int64') * fator
+    d = denominador.astype('Int64')
+    d = d.where(d != 0)
+    q = (2 * n.abs() + d.abs()) // (2 * d.abs())
+    return q.where((n < 0).fillna(False) == (d < 0).fillna(False), -q)
+
+# ==========================================================
+# 🧱 Base diária (espelho de carregar_base_vendas_diaria)
+# ==========================================================
+def _ler_pedidos(origem, meses_leitura):
+    colunas = ['id', 'data', 'status', 'sgl_uf_entrega', 'vlr_total']
+    partes = []
+    for chunk in ler_tabela(origem, 'pedido', colunas):
+        if meses_leitura is not None:
+            chunk = chunk[_mes(chunk['data']).isin(meses_leitura)]
+        partes.append(chunk)
+    pedidos = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=colunas)
+    # Reenvio do mesmo pedido no arquivo: vale a última linha (como o upsert da ingestão)
+    pedidos = pedidos.drop_duplicates('id', keep='last').reset_index(drop=True)
+    pedidos['sgl_uf_entrega'] = pedidos['sgl_uf_entrega'].astype(object)
+    pedidos['cancelado'] = pedidos['status'].astype(object).eq('CANCELADO').fillna(False).to_numpy(bool)
+    return pedidos
+
+def _itens_do_chunk(chunk, ids_pedido, produtos, codigo_nome_marca):
+    """Itens do chunk com a posição do pedido (itens de pedidos fora da leitura são descartados)"""
+    posicao = pd.Index(ids_pedido).get_indexer(chunk['id_pedido'].astype('float64'))
+    chunk = chunk[posicao >= 0].reset_index(drop=True)
+    chunk['posicao'] = posicao[posicao >= 0]
+    chunk['id_marca'] = chunk['id_produto'].map(produtos['id_marca']).astype('Int64')
+    chunk['codigo_marca'] = chunk['id_marca'].map(codigo_nome_marca).fillna(-1).astype('int64')
+    chunk['valido'] = chunk['flg_cancelado'].astype(object).eq('N').fillna(False).to_numpy(bool)
+    return chunk
+
+def calcular_base(origem, meses_leitura=None, chunksize=REFINED_LOCAL_CHUNKSIZE, stats=None):
+    stats = stats if stats is not None else {}
+    inicio = time.perf_counter()
+
+    pedidos = _ler_pedidos(origem, meses_leitura)
+    produtos = _ler_inteira(origem, 'produto', ['id', 'id_marca']).set_index('id')
+    marcas = _ler_inteira(origem, 'marca', ['id', 'nome']).set_index('id')
+    # ROW_NUMBER por nome de marca (não por id): marcas homônimas dividem a contagem
+    codigos, _ = pd.factorize(marcas['nome'])
+    codigo_nome_marca = pd.Series(codigos, index=marcas.index)
+
+    n = len(pedidos)
+    ids_pedido = pedidos['id'].astype('float64').to_numpy()
+    cancelado = pedidos['cancelado'].to_numpy()
+    colunas_item = ['id', 'id_pedido', 'id_produto', 'flg_cancelado', 'qtd_produto', 'vlr_unitario']
+    stats['tempo_pedidos_s'] = time.perf_counter() - inicio
+
+    # 1ª passada: estado por pedido
+    inicio = time.perf_counter()
+    sem_item = np.iinfo(np.int64).max
+    itens_validos = np.zeros(n, dtype=np.int64)
+    primeiro_item = np.full(n, sem_item, dtype=np.int64)
+    primeiro_cancelado = pd.Series(dtype='int64')
+    fator_chave = len(marcas) + 1
+    qtd_itens = 0
+    for chunk in ler_tabela(origem, 'pedido_item', colunas_item, chunksize):
+        itens = _itens_do_chunk(chunk, ids_pedido, produtos, codigo_nome_marca)
+        qtd_itens += len(itens)
+        posicao, ids = itens['posicao'].to_numpy(), itens['id'].astype('int64').to_numpy()
+        itens_validos += np.bincount(posicao, weights=itens['valido'], minlength=n).astype(np.int64)
+        menores = pd.Series(ids).groupby(posicao).min()
+        primeiro_item[menores.index] = np.minimum(primeiro_item[menores.index], menores.to_numpy())
+
+        cancelamento = cancelado[posicao] | itens['flg_cancelado'].astype(object).eq('S').fillna(False).to_numpy(bool)
+        chave = posicao[cancelamento] * fator_chave + itens['codigo_marca'].to_numpy()[cancelamento] + 1
+        menores = pd.Series(ids[cancelamento]).groupby(chave).min()
+        primeiro_cancelado = pd.concat([primeiro_cancelado, menores]).groupby(level=0).min()
+    stats['tempo_passada_1_s'] = time.perf_counter() - inicio
+
+    # 2ª passada: agregação parcial por chunk, consolidada a cada ~chunksize grupos
+    inicio = time.perf_counter()
+    chave_base = MARTS["base_vendas_diaria"]["chave"]
+    acumulado, pendentes = None, []
+
+    def consolidar(partes):
+        return pd.concat(partes, ignore_index=True).groupby(chave_base, dropna=False, as_index=False).sum(min_count=1)
+
+    for chunk in ler_tabela(origem, 'pedido_item', colunas_item, chunksize):
+        itens = _itens_do_chunk(chunk, ids_pedido, produtos, codigo_nome_marca)
+        posicao, ids = itens['posicao'].to_numpy(), itens['id'].astype('int64').to_numpy()
+        vlr_total = pedidos['vlr_total'].take(posicao).reset_index(drop=True)
+        valido = itens['valido'].to_numpy()
+        cancelamento = cancelado[posicao] | itens['flg_cancelado'].astype(object).eq('S').fillna(False).to_numpy(bool)
+        ordem_pedido = ids == primeiro_item[posicao]
+        chave = posicao * fator_chave + itens['codigo_marca'].to_numpy() + 1
+        ordem_cancelamento = cancelamento & (ids == primeiro_cancelado.reindex(chave).to_numpy())
+        pedido_valido = valido | ((itens_validos[posicao] == 0) & ordem_pedido)
+
+        linhas = pd.DataFrame({
+            'data': pedidos['data'].take(posicao).to_numpy(),
+            'sgl_uf_entrega': pedidos['sgl_uf_entrega'].take(posicao).to_numpy(),
+            'id_produto': itens['id_produto'].astype('Int64'),
+            'id_marca': itens['id_marca'],
+            'qtd_pedidos': ordem_pedido.astype(np.int64),
+            'qtd_pedidos_cancelamento': ordem_cancelamento.astype(np.int64),
+            'qtd_itens': np.ones(len(itens), dtype=np.int64),
+            'qtd_produto': itens['qtd_produto'].astype('Int64'),
+            'vlr_pedidos_itens': vlr_total,
+            'qtd_itens_validos': valido.astype(np.int64),
+            'qtd_produto_valido': itens['qtd_produto'].astype('Int64').where(valido),
+            'vlr_itens_validos': (itens['qtd_produto'].astype('Int64') * itens['vlr_unitario']).where(valido),
+            'vlr_pedidos_validos': vlr_total.where(pedido_valido),
+            'qtd_vlr_pedidos_validos': (vlr_total.notna().to_numpy() & pedido_valido).astype(np.int64),
+            'qtd_itens_cancelamento': cancelamento.astype(np.int64),
+            'vlr_pedidos_cancelamento': vlr_total.where(cancelamento),
+            'qtd_vlr_pedidos_cancelamento': (vlr_total.notna().to_numpy() & cancelamento).astype(np.int64),
+        })
+        pendentes.append(linhas.groupby(chave_base, dropna=False, as_index=False).sum(min_count=1))
+        if sum(len(p) for p in pendentes) >= chunksize:
+            acumulado = consolidar(([acumulado] if acumulado is not None else []) + pendentes)
+            pendentes = []
+
+    # Pedidos sem item: uma linha com produto/marca NULL (LEFT JOIN)
+    sem_itens = pedidos[primeiro_item == sem_item]
+    linhas = pd.DataFrame({
+        'data': sem_itens['data'],
+        'sgl_uf_entrega': sem_itens['sgl_uf_entrega'],
+        'id_produto': pd.array([pd.NA] * len(sem_itens), dtype='Int64'),
+        'id_marca': pd.array([pd.NA] * len(sem_itens), dtype='Int64'),
+        'qtd_pedidos': 1,
+        'qtd_vlr_pedidos_validos': sem_itens['vlr_total'].notna().astype(np.int64),
+        'vlr_pedidos_validos': sem_itens['vlr_total'],
+    })
+    for coluna in CONTAGENS_BASE:
+        if coluna not in linhas:
+            linhas[coluna] = 0
+    for coluna in SOMAS_BASE:
+        if coluna not in linhas:
+            linhas[coluna] = pd.array([pd.NA] * len(sem_itens), dtype='Int64')
+    pendentes.append(linhas.groupby(chave_base, dropna=False, as_index=False).sum(min_count=1))
+
+    base = consolidar(([acumulado] if acumulado is not None else []) + pendentes)
+    base = base[chave_base + [c for c in colunas_mart("base_vendas_diaria") if c not in chave_base]]
+    for coluna in SOMAS_BASE + CONTAGENS_BASE + ['id_produto', 'id_marca']:
+        base[coluna] = base[coluna].astype('Int64')
+    stats['tempo_passada_2_s'] = time.perf_counter() - inicio
+    stats.update({'pedidos': n, 'itens': qtd_itens, 'linhas_base': len(base)})
+    return base, pedidos
+
+# ==========================================================
+# 📊 Marts a partir da base (espelho das consultas SQL)
+# ==========================================================
+def _soma(grupos, coluna):
+    return grupos[coluna].sum(min_count=1).astype('Int64')
+
+def mart_mais_vendidos(base, produtos):
+    b = base[base['sgl_uf_entrega'].notna() & base['id_produto'].isin(produtos.index)].copy()
+    b['mes_ano'] = _mes(b['data'])
+    b['nome_produto'] = b['id_produto'].map(produtos['nome'])
+    df = b.groupby(['mes_ano', 'sgl_uf_entrega', 'id_produto', 'nome_produto'])['qtd_produto'] \
+          .sum(min_count=1).astype('Int64').rename('total_qtd').reset_index()
+    # RANK() ... ORDER BY SUM DESC: NULL vem primeiro no DESC do PostgreSQL
+    df['posicao'] = df.groupby(['mes_ano', 'sgl_uf_entrega'])['total_qtd'] \
+                      .rank(method='min', ascending=False, na_option='top').astype('Int64')
+    return df[df['posicao'] <= REFINED_TOP_N] if REFINED_TOP_N > 0 else df
+
+def mart_performance_mensal(base, marcas, metas):
+    # JOIN trusted.data: a ingestão garante que a dimensão cobre todas as datas de pedido
+    b = base[base['id_marca'].isin(marcas.index)].copy()
+    b['ano'], b['mes'] = b['data'].dt.year, b['data'].dt.month
+    df = b.groupby(['ano', 'mes', 'id_marca'])['vlr_pedidos_itens'].sum(min_count=1) \
+          .astype('Int64').rename('vlr_total_vendido').reset_index().rename(columns={'id_marca': 'id'})
+    df['nome_marca'] = df['id'].map(marcas['nome'])
+    df = df.merge(metas[['ano', 'mes', 'id_marca', 'valor']],
+                  how='left', left_on=['ano', 'mes', 'id'], right_on=['ano', 'mes', 'id_marca'])
+    df['vlr_meta'] = df['valor'].astype('Int64').fillna(0)
+    # (vendido / meta) * 100 com 2 casas, ambos em centavos
+    df['perc_atingimento_meta'] = _dividir(df['vlr_total_vendido'], df['valor'], fator=10_000)
+    return df
+
+def mart_kpis_vendas(base, pedidos):
+    p = pedidos.assign(mes_ano=_mes(pedidos['data']))
+    df = p.groupby('mes_ano').agg(qtd_pedidos=('id', 'size'), qtd_cancelamentos=('cancelado', 'sum'))
+    b = base.assign(mes_ano=_mes(base['data']))
+    grupos = b.groupby('mes_ano')
+    df['receita_bruta'] = _soma(grupos, 'vlr_pedidos_validos')
+    df['qtd_vlr'] = grupos['qtd_vlr_pedidos_validos'].sum()
+    df['qtd_produtos_distintos'] = b[b['qtd_itens_validos'] > 0].groupby('mes_ano')['id_produto'].nunique()
+    df['qtd_itens_vendidos'] = _soma(grupos, 'qtd_produto_valido')
+    df = df.reset_index()
+    df['ticket_medio'] = _dividir(df['receita_bruta'], df['qtd_vlr'])
+    df['pct_cancelamento'] = _dividir(df['qtd_cancelamentos'], df['qtd_pedidos'], fator=10_000)
+    df['qtd_produtos_distintos'] = df['qtd_produtos_distintos'].fillna(0).astype('Int64')
+    return df
+
+def mart_analise_cancelamentos(base, marcas):
+    b = base[(base['qtd_itens_cancelamento'] > 0) & base['id_marca'].isin(marcas.index)].copy()
+    b['mes_ano'] = _mes(b['data'])
+    b['marca'] = b['id_marca'].map(marcas['nome'])
+    grupos = b.groupby(['mes_ano', 'sgl_uf_entrega', 'marca'], dropna=False)
+    df = pd.DataFrame({
+        'qtd_pedidos_cancelados': grupos['qtd_pedidos_cancelamento'].sum(),
+        'vlr_total_cancelado': _soma(grupos, 'vlr_pedidos_cancelamento'),
+        'qtd_itens_cancelados': grupos['qtd_itens_cancelamento'].sum(),
+        'qtd_vlr': grupos['qtd_vlr_pedidos_cancelamento'].sum(),
+    }).reset_index()
+    df['ticket_medio_cancelado'] = _dividir(df['vlr_total_cancelado'], df['qtd_vlr'])
+    return df
+
+def mart_vendas_categoria(base, produtos):
+    b = base[(base['qtd_itens_validos'] > 0) & base['id_produto'].isin(produtos.index)].copy()
+    b['mes_ano'] = _mes(b['data'])
+    categoria = produtos['categoria'] if 'categoria' in produtos else pd.Series(pd.NA, index=produtos.index)
+    b['categoria'] = b['id_produto'].map(categoria).fillna('Sem Categoria')
+    grupos = b.groupby(['mes_ano', 'categoria'])
+    df = pd.DataFrame({
+        'total_qtd': _soma(grupos, 'qtd_produto_valido'),
+        'total_valor': _soma(grupos, 'vlr_itens_validos'),
+    }).reset_index().sort_values(['categoria', 'mes_ano'])
+    # LAG por categoria: mês anterior presente na base (não necessariamente o calendário)
+    for coluna, variacao in (('total_qtd', 'pct_variacao_qtd'), ('total_valor', 'pct_variacao_valor')):
+        anterior = df.groupby('categoria')[coluna].shift(1)
+        anterior = anterior.where((anterior > 0).fillna(False))
+        df[variacao] = _dividir(df[coluna] - anterior, anterior, fator=10_000)
+    return df
+
+def mart_analise_regional(base):
+    b = base[base['sgl_uf_entrega'].notna()].copy()
+    b['mes_ano'] = _mes(b['data'])
+    grupos = b.groupby(['mes_ano', 'sgl_uf_entrega'])
+    validos = b[b['qtd_itens_validos'] > 0].groupby(['mes_ano', 'sgl_uf_entrega'])
+    df = pd.DataFrame({
+        'qtd_pedidos': grupos['qtd_pedidos'].sum(),
+        'receita_total': _soma(grupos, 'vlr_pedidos_validos'),
+        'qtd_vlr': grupos['qtd_vlr_pedidos_validos'].sum(),
+        'qtd_itens': _soma(grupos, 'qtd_produto_valido'),
+        'qtd_produtos_distintos': validos['id_produto'].nunique(),
+        'qtd_marcas_distintas': validos['id_marca'].nunique(),
+    }).reset_index()
+    df['ticket_medio'] = _dividir(df['receita_total'], df['qtd_vlr'])
+    for coluna in ('qtd_produtos_distintos', 'qtd_marcas_distintas'):
+        df[coluna] = df[coluna].fillna(0).astype('Int64')
+    return df
+
+def calcular_marts(origem=REFINED_LOCAL_ORIGEM, meses=None, chunksize=REFINED_LOCAL_CHUNKSIZE):
+    """
+    Calcula os marts da refined a partir dos arquivos de `origem`.
+
+    meses None = histórico completo; com meses, lê e devolve só os meses pedidos,
+    sem vendas_categoria_variacao (o LAG de cada categoria lê o último mês em
+    que ela vendeu, em qualquer ponto do histórico).
+
+    Retorna ({mart: DataFrame com as colunas do ddl.sql}, stats).
+    """
+    stats = {}
+    inicio = time.perf_counter()
+    meses_leitura = None if meses is None else pd.to_datetime(sorted(meses))
+
+    base, pedidos = calcular_base(origem, meses_leitura, chunksize, stats)
+    produtos = _ler_inteira(origem, 'produto', ['id', 'id_marca', 'nome', 'categoria']).set_index('id')
+    marcas = _ler_inteira(origem, 'marca', ['id', 'nome']).set_index('id')
+    metas = _ler_inteira(origem, 'meta', ['ano', 'mes', 'id_marca', 'valor'])
+
+    inicio_marts = time.perf_counter()
+    marts = {
+        "base_vendas_diaria": base,
+        "mais_vendidos_mensal_estado": mart_mais_vendidos(base, produtos),
+        "performance_mensal_marca": mart_performance_mensal(base, marcas, metas),
+        "kpis_vendas": mart_kpis_vendas(base, pedidos),
+        "analise_cancelamentos": mart_analise_cancelamentos(base, marcas),
+        "analise_regional": mart_analise_regional(base),
+    }
+    if meses is None:
+        marts["vendas_categoria_variacao"] = mart_vendas_categoria(base, produtos)
+    else:
+        log("⏭️  refined.vendas_categoria_variacao: exige o histórico completo, ignorada com --meses.")
+
+    for tabela, df in marts.items():
+        if meses is not None:
+            df = df[_mes_do_mart(tabela, df).isin(meses_leitura)]
+        marts[tabela] = df[colunas_mart(tabela)].sort_values(MARTS[tabela]["chave"]).reset_index(drop=True)
+
+    stats['tempo_marts_s'] = time.perf_counter() - inicio_marts
+    stats['tempo_total_s'] = time.perf_counter() - inicio
+    stats['pico_rss_mb'] = pico_rss_mb()
+    return marts, stats
+
+def _mes_do_mart(tabela, df):
+    if tabela == "base_vendas_diaria":
+        return _mes(df['data'])
+    if tabela == "performance_mensal_marca":
+        return pd.to_datetime(pd.DataFrame({'year': df['ano'], 'month': df['mes'], 'day': 1}))
+    return df['mes_ano']
+
+# ==========================================================
+# 💾 Saída: arquivos, COPY para a refined e conferência com o SQL
+# ==========================================================
+def salvar_arquivos(marts, destino):
+    """Grava cada mart em {destino}/{mart}.csv (valores no formato do COPY)"""
+    os.makedirs(destino, exist_ok=True)
+    for tabela, df in marts.items():
+        preparar_para_escrita(df, tabela, 'refined').to_csv(f"{destino}/{tabela}.csv", index=False)
+        log(f"💾 {destino}/{tabela}.csv ({len(df):,} linhas)")
+
+def publicar(marts, meses=None):
+    """
+    Grava os marts em refined.* via COPY: histórico completo em tabela sombra
+    + troca (ou DELETE + COPY se houver views dependentes); com meses, DELETE
+    dos meses + COPY. Marts publicados como view materializada são ignorados
+    (a view é sempre calculada pelo SELECT do caminho SQL).
+    """
+    for tabela in TRANSFORMACOES:
+        if tabela not in marts:
+            continue
+        if usa_view_materializada(tabela):
+            log(f"⏭️  refined.{tabela}: publicada como view materializada, ignorada (atualizada por transform_refined.py).")
+            continue
+        df = preparar_para_escrita(marts[tabela], tabela, 'refined')
+        with get_engine().begin() as conn:
+            if meses is not None:
+                saida = sorted({m.date() for m in _mes_do_mart(tabela, marts[tabela])} | set(meses))
+                conn.execute(text(
+                    f"DELETE FROM refined.{tabela} WHERE {MARTS[tabela]['mes']} = ANY(:meses);"
+                ), {'meses': saida})
+                destino = tabela
+            elif _dependentes(conn, tabela):
+                conn.execute(text(f"DELETE FROM refined.{tabela};"))
+                registrar_parametros(conn, tabela)
+                destino = tabela
+            else:
+                _criar_sombra(conn, tabela)
+                destino = f"{tabela}{SUFIXO_SOMBRA}"
+
+            with conn.connection.cursor() as cursor:
+                for inicio in range(0, len(df), REFINED_LOCAL_CHUNKSIZE):
+                    copy_chunk(cursor, df.iloc[inicio:inicio + REFINED_LOCAL_CHUNKSIZE], destino, 'refined')
+
+            if destino != tabela:
+                conn.execute(text(f"ANALYZE refined.{destino};"))
+                registrar_parametros(conn, tabela, destino)
+                _trocar_sombra(conn, tabela)
+        log(f"✅ refined.{tabela}: {len(df):,} linha(s) publicadas pelo motor local.")
+
+def _como_texto(df, tabela):
+    """Valores como texto no formato do PostgreSQL (NULL → None) para comparar"""
+    df = preparar_para_escrita(df, tabela, 'refined').astype(object)
+    return df.where(df.notna(), None).astype(object).map(lambda v: None if v is None else str(v))
+
+def comparar_com_sql(marts, meses=None, limite_exemplos=3):
+    """
+    Confere cada mart local com refined.{mart} no banco (mesmos meses).
+    Retorna {mart: {'local', 'banco', 'so_local', 'so_banco', 'divergentes', 'status'}}.
+    """
+    resultados = {}
+    with get_engine().connect() as conn:
+        for tabela, df in marts.items():
+            colunas = colunas_mart(tabela)
+            chave = MARTS[tabela]["chave"]
+            filtro, parametros = "TRUE", {}
+            if meses is not None:
+                filtro = f"{MARTS[tabela]['mes']} = ANY(:meses)"
+                parametros = {'meses': sorted({m.date() for m in _mes_do_mart(tabela, df)} | set(meses))}
+            try:
+                banco = pd.DataFrame(conn.execute(text(
+                    f"SELECT {', '.join(f'CAST({c} AS TEXT) AS {c}' for c in colunas)} "
+                    f"FROM refined.{tabela} WHERE {filtro}"
+                ), parametros).fetchall(), columns=colunas)
+            except Exception as e:
+                erro(f"refined.{tabela} não pôde ser lida: {str(e).splitlines()[0]}")
+                resultados[tabela] = {'local': len(df), 'banco': None, 'status': 'SEM_TABELA'}
+                continue
+
+            banco = banco.astype(object).where(banco.notna(), None)
+            local = _como_texto(df, tabela)
+            juntos = local.merge(banco, how='outer', on=chave, suffixes=('', '_banco'), indicator=True)
+            comuns = juntos[juntos['_merge'] == 'both']
+            medidas = [c for c in colunas if c not in chave]
+            divergentes = comuns[np.logical_or.reduce(
+                [comuns[c].ne(comuns[f"{c}_banco"]) & ~(comuns[c].isna() & comuns[f"{c}_banco"].isna())
+                 for c in medidas]
+            )] if medidas and len(comuns) else comuns.iloc[0:0]
+
+            resultado = {
+                'local': len(local),
+                'banco': len(banco),
+                'so_local': int((juntos['_merge'] == 'left_only').sum()),
+                'so_banco': int((juntos['_merge'] == 'right_only').sum()),
+                'divergentes': len(divergentes),
+            }
+            resultado['status'] = 'OK' if not (
+                resultado['so_local'] or resultado['so_banco'] or resultado['divergentes']
+            ) else 'DIVERGENTE'
+            resultados[tabela] = resultado
+
+            for _, linha in divergentes.head(limite_exemplos).iterrows():
+                diferencas = {c: (linha[c], linha[f"{c}_banco"]) for c in medidas
+                              if linha[c] != linha[f"{c}_banco"]}
+                erro(f"refined.{tabela} {dict(zip(chave, linha[chave]))}: local ≠ banco {diferencas}")
+    return resultados
+
+def imprimir_resumo(stats, comparacao=None):
+    print("\n" + "="*70)
+    print("🧮 MOTOR LOCAL DA REFINED")
+    print("="*70)
+    print(f"Pedidos: {stats['pedidos']:,} | Itens: {stats['itens']:,} | Linhas da base: {stats['linhas_base']:,}")
+    print(f"Pedidos/dimensões: {stats['tempo_pedidos_s']:.2f}s | 1ª passada: {stats['tempo_passada_1_s']:.2f}s | "
+          f"2ª passada: {stats['tempo_passada_2_s']:.2f}s | Marts: {stats['tempo_marts_s']:.2f}s")
+    pico = stats.get('pico_rss_mb')
+    print(f"⏱️  Total: {stats['tempo_total_s']:.2f}s" + (f" | Pico de memória: {pico:.0f} MB" if pico else ""))
+    if comparacao:
+        print("-"*70)
+        print(f"{'Mart':<30}{'Local':>9}{'Banco':>9}{'Só loc.':>9}{'Só bco.':>9}{'Difer.':>8}  Status")
+        for tabela, r in comparacao.items():
+            if r['banco'] is None:
+                print(f"{tabela:<30}{r['local']:>9,}{'-':>9}{'-':>9}{'-':>9}{'-':>8}  ⚠️ {r['status']}")
+                continue
+            icone = '✅' if r['status'] == 'OK' else '❌'
+            print(f"{tabela:<30}{r['local']:>9,}{r['banco']:>9,}{r['so_local']:>9,}{r['so_banco']:>9,}"
+                  f"{r['divergentes']:>8,}  {icone} {r['status']}")
+    print("="*70)
+
+def _meses_argumento(valor):
+    return sorted(date.fromisoformat(f"{m.strip()}-01") for m in valor.split(",") if m.strip())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Motor local (pandas) dos marts da refined')
+    parser.add_argument('--origem', default=REFINED_LOCAL_ORIGEM, help='Diretório dos arquivos trusted')
+    parser.add_argument('--meses', type=_meses_argumento, help='Meses a calcular (AAAA-MM,AAAA-MM); padrão: todos')
+    parser.add_argument('--chunksize', type=int, default=REFINED_LOCAL_CHUNKSIZE, help='Linhas de pedido_item por chunk')
+    parser.add_argument('--saida', help='Diretório para gravar os marts em CSV')
+    parser.add_argument('--publicar', action='store_true', help='Grava os marts em refined.* via COPY')
+    parser.add_argument('--comparar', action='store_true', help='Confere os marts com refined.* no banco')
+    args = parser.parse_args()
+
+    marts, stats = calcular_marts(args.origem, args.meses, args.chunksize)
+    if args.saida:
+        salvar_arquivos(marts, args.saida)
+    comparacao = comparar_com_sql(marts, args.meses) if args.comparar else None
+    if args.publicar:
+        publicar(marts, args.meses)
+    imprimir_resumo(stats, comparacao)
+
+    if comparacao and any(r['status'] != 'OK' for r in comparacao.values()):
+        sys.exit(1)
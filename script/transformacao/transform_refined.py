@@ -1,120 +1,603 @@
+import hashlib
 import os
+import re
+import sys
 import textwrap
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
-from dotenv import load_dotenv
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date
+from sqlalchemy import text
 
 # ==========================================================
-# 🧩 Carregar variáveis de ambiente (.env)
+# 🔗 Conexão: engine compartilhado e criado sob demanda (script/conexao.py)
 # ==========================================================
-load_dotenv()
-
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conexao import get_engine
+from esquema_ddl import carregar_tabelas, ddl_tabela
+from planos import executar
 
 # ==========================================================
-# 🔗 Conexão com o banco
+# ⚙️ Modo de atualização dos marts
 # ==========================================================
-engine = create_engine(
-    f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-)
+# 'incremental' → recalcula só os meses com pedidos/metas criados ou
+#                 alterados desde o último watermark de cada mart
+# 'completo'    → DROP + CREATE TABLE AS sobre todo o histórico
+REFINED_MODO = os.getenv("REFINED_MODO", "incremental")
+
+# 🧵 Nº de marts calculados ao mesmo tempo (cada um em sua conexão do pool)
+REFINED_PARALELISMO = int(os.getenv("REFINED_PARALELISMO", "4"))
+
+# 🪟 Marts publicados como MATERIALIZED VIEW (lista separada por vírgula,
+# ou 'todos' = todos os marts com chave PK/UNIQUE no ddl.sql). Os demais
+# seguem como tabela (sombra + troca / DELETE + INSERT por mês).
+REFINED_VIEWS_MATERIALIZADAS = {
+    t.strip() for t in os.getenv("REFINED_VIEWS_MATERIALIZADAS", "").split(",") if t.strip()
+}
+
+# 🥇 Posições guardadas por mês × UF em mais_vendidos_mensal_estado
+# (0 = ranking completo). Empates na última posição são mantidos.
+REFINED_TOP_N = int(os.getenv("REFINED_TOP_N", "10"))
 
 # ==========================================================
 # 🧠 Funções utilitárias de log
 # ==========================================================
+# Lock: as transformações rodam em threads e compartilham o stdout
+_log_lock = threading.Lock()
+
 def log(msg: str):
-    print(f"🟢 {msg}")
+    with _log_lock:
+        print(f"🟢 {msg}")
 
 def erro(msg: str):
-    print(f"❌ ERRO: {msg}")
+    with _log_lock:
+        print(f"❌ ERRO: {msg}")
 
 # ==========================================================
 # 📂 Criação automática dos schemas
 # ==========================================================
 def inicializar_schemas():
-    with engine.begin() as conn:
+    with get_engine().begin() as conn:
         conn.execute(text("CREATE SCHEMA IF NOT EXISTS trusted;"))
         conn.execute(text("CREATE SCHEMA IF NOT EXISTS refined;"))
+        conn.execute(text(textwrap.dedent("""
+            CREATE TABLE IF NOT EXISTS refined.controle_incremental (
+                tabela VARCHAR(100) PRIMARY KEY,
+                watermark TIMESTAMP,
+                modo VARCHAR(20),
+                meses_recalculados INTEGER,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)))
     log("📂 Schemas verificados/criados com sucesso.")
 
+# ==========================================================
+# 🧭 Controle incremental (watermark por mart)
+# ==========================================================
+# O watermark é o maior GREATEST(criado_em, atualizado_em) de
+# trusted.pedido/pedido_item/meta já refletido no mart. Os meses afetados
+# são os de pedidos (p.data), itens (data_pedido) e metas (ano/mes)
+# alterados depois dele, mais os meses de onde pedidos, itens ou metas
+# saíram (excluídos ou com a data movida de mês, registrados por trigger em
+# trusted.meses_removidos); cada mart apaga e reinsere só esses meses, na
+# mesma transação que avança o watermark.
+SQL_ALTERACOES = """
+    SELECT DATE_TRUNC('month', data)::DATE AS mes_ano,
+           GREATEST(criado_em, atualizado_em) AS alterado_em
+    FROM trusted.pedido
+    WHERE GREATEST(criado_em, atualizado_em) > :desde
+    UNION ALL
+    SELECT DATE_TRUNC('month', data_pedido)::DATE,
+           GREATEST(criado_em, atualizado_em)
+    FROM trusted.pedido_item
+    WHERE GREATEST(criado_em, atualizado_em) > :desde
+    UNION ALL
+    SELECT MAKE_DATE(ano, mes, 1),
+           GREATEST(criado_em, atualizado_em)
+    FROM trusted.meta
+    WHERE GREATEST(criado_em, atualizado_em) > :desde
+    UNION ALL
+    SELECT mes_ano, removido_em
+    FROM trusted.meses_removidos
+    WHERE removido_em > :desde
+"""
+
+def _somar_meses(mes: date, n: int) -> date:
+    total = mes.year * 12 + mes.month - 1 + n
+    return date(total // 12, total % 12 + 1, 1)
+
+def _watermark_anterior(conn, tabela: str, modo: str):
+    """Watermark do mart publicado, ou None se o refresh tem de ser completo"""
+    view = usa_view_materializada(tabela)
+    if modo == 'incremental' and _estrutura_confere(conn, tabela, view) \
+            and (view or _parametros_conferem(conn, tabela)):
+        return conn.execute(text("""
+            SELECT watermark FROM refined.controle_incremental WHERE tabela = :tabela
+        """), {'tabela': tabela}).scalar()
+    return None
+
+def _horizonte_watermark():
+    """
+    Limite do watermark novo: início da transação aberta mais antiga do banco
+    (menos 1 µs), ou o instante da consulta se não houver nenhuma.
+
+    Linhas gravadas com NOW()/CURRENT_TIMESTAMP levam o início da própria
+    transação; uma transação aberta antes do snapshot do planejamento pode
+    fazer commit depois com alterado_em menor que o maior já visto. Lido
+    antes do snapshot, em conexão própria. Transações de outros usuários só
+    aparecem com o mesmo usuário do banco ou pg_read_all_stats.
+    """
+    with get_engine().connect() as conn:
+        return conn.execute(text("""
+            SELECT (LEAST(MIN(xact_start), CLOCK_TIMESTAMP()) - INTERVAL '1 microsecond')::TIMESTAMP
+            FROM pg_stat_activity
+            WHERE datname = CURRENT_DATABASE()
+              AND backend_type = 'client backend'
+              AND pid <> pg_backend_pid()
+              AND xact_start IS NOT NULL
+        """)).scalar()
+
+def planejar_refreshes(tabelas, modo: str = REFINED_MODO) -> dict:
+    """
+    Define a janela de atualização de cada mart, {tabela: janela}, com
+    janela = {'meses': None (histórico completo) ou [date, ...], 'watermark': timestamp}.
+
+    Todas as janelas saem do mesmo snapshot (REPEATABLE READ), antes de
+    qualquer mart rodar: a base e os marts derivados dela com o mesmo
+    watermark recebem a mesma janela e o mesmo watermark novo, e um pedido
+    alterado durante a execução fica para a próxima em todos eles (em vez de
+    entrar no watermark de um mart derivado sem estar na base que ele lê).
+    O watermark novo não passa do início da transação aberta mais antiga
+    (_horizonte_watermark): linhas que ainda não tinham commit entram na
+    próxima execução, e meses já vistos depois dele são recalculados de novo.
+
+    Sem watermark registrado (primeira execução), com a tabela publicada
+    fora da estrutura do ddl.sql ou calculada com outros parâmetros (ex:
+    REFINED_TOP_N alterado), o refresh é completo. Marts publicados
+    como view materializada não têm janela: qualquer alteração gera refresh.
+    """
+    janelas, alteracoes_desde = {}, {}
+    horizonte = _horizonte_watermark()
+    with get_engine().connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        for tabela in tabelas:
+            anterior = _watermark_anterior(conn, tabela, modo)
+            desde = anterior or date(1900, 1, 1)
+            if desde not in alteracoes_desde:
+                alteracoes_desde[desde] = conn.execute(text(f"""
+                    SELECT mes_ano, MAX(alterado_em)
+                    FROM ({SQL_ALTERACOES}) a
+                    GROUP BY mes_ano
+                    ORDER BY mes_ano
+                """), {'desde': desde}).fetchall()
+            alteracoes = alteracoes_desde[desde]
+
+            watermark = max((r[1] for r in alteracoes if r[1] is not None), default=None)
+            if watermark is not None and horizonte is not None:
+                watermark = min(watermark, horizonte)
+            if anterior is not None:
+                watermark = max(watermark or anterior, anterior)
+
+            if anterior is None or (alteracoes and usa_view_materializada(tabela)):
+                # A view é sempre atualizada inteira (REFRESH), sem janela de meses
+                janelas[tabela] = {'meses': None, 'watermark': watermark}
+            else:
+                janelas[tabela] = {'meses': [r[0] for r in alteracoes], 'watermark': watermark}
+    return janelas
+
+def planejar_refresh(tabela: str, modo: str = REFINED_MODO) -> dict:
+    """Janela de atualização de um único mart (ver planejar_refreshes)"""
+    return planejar_refreshes([tabela], modo)[tabela]
+
+def _filtro_meses(coluna_data: str, janela, parametro: str = 'meses') -> str:
+    """Filtro de meses sobre uma coluna DATE (com faixa para usar o índice)"""
+    if janela is None or janela['meses'] is None:
+        return "TRUE"
+    return (
+        f"{coluna_data} >= :{parametro}_inicio AND {coluna_data} < :{parametro}_fim "
+        f"AND DATE_TRUNC('month', {coluna_data})::DATE = ANY(:{parametro})"
+    )
+
+def _parametros_meses(meses, parametro: str = 'meses') -> dict:
+    if meses is None:
+        return {}
+    return {
+        parametro: list(meses),
+        f'{parametro}_inicio': min(meses),
+        f'{parametro}_fim': _somar_meses(max(meses), 1),
+    }
+
+# ==========================================================
+# 🔁 Tabela sombra + troca atômica (estrutura do ddl.sql)
+# ==========================================================
+# O refresh completo grava em refined.{tabela}__novo, criada com o DDL da
+# tabela (tipos, PK/UNIQUE e índices), e troca as tabelas numa única
+# transação: leitores seguem lendo a versão anterior até o commit e nunca
+# encontram a tabela ausente ou sem índices.
+SUFIXO_SOMBRA = "__novo"
+
+# Colunas preenchidas pelo DEFAULT do DDL, fora do SELECT dos marts
+COLUNAS_AUDITORIA = ("criado_em", "atualizado_em")
+
+def colunas_mart(tabela: str) -> list:
+    """Colunas de refined.{tabela} no ddl.sql, na ordem do SELECT do mart"""
+    definicao = carregar_tabelas().get(f"refined.{tabela}")
+    if definicao is None:
+        raise KeyError(f"refined.{tabela} não está declarada no ddl.sql")
+    return [c for c in definicao["colunas"] if c not in COLUNAS_AUDITORIA]
+
+def _tipo_relacao(conn, tabela: str):
+    """'r' (tabela), 'm' (view materializada) ou None se refined.{tabela} não existe"""
+    return conn.execute(text("""
+        SELECT c.relkind::TEXT
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'refined' AND c.relname = :tabela
+    """), {'tabela': tabela}).scalar()
+
+def _estrutura_confere(conn, tabela: str, view: bool = False) -> bool:
+    """
+    O mart publicado existe no formato esperado (tabela/view materializada)
+    e tem as colunas do ddl.sql (ex: não é um CTAS antigo)
+    """
+    if _tipo_relacao(conn, tabela) != ('m' if view else 'r'):
+        return False
+    # pg_attribute em vez de information_schema: cobre também views materializadas
+    colunas = conn.execute(text("""
+        SELECT attname
+        FROM pg_attribute
+        WHERE attrelid = CAST(:tabela AS regclass) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """), {'tabela': f"refined.{tabela}"}).scalars().all()
+    return colunas == list(carregar_tabelas()[f"refined.{tabela}"]["colunas"])
+
+def parametros_mart(tabela: str) -> str:
+    """Parâmetros de configuração que mudam o conteúdo do mart (ex: 'top_n=10'), ou ''"""
+    return TRANSFORMACOES[tabela].get("parametros", "")
+
+def _parametros_conferem(conn, tabela: str) -> bool:
+    """A tabela publicada foi calculada com os parâmetros atuais (COMMENT da tabela)"""
+    esperado = parametros_mart(tabela)
+    if not esperado:
+        return True
+    atual = conn.execute(text("""
+        SELECT obj_description(CAST(:tabela AS regclass), 'pg_class')
+    """), {'tabela': f"refined.{tabela}"}).scalar()
+    return atual == esperado
+
+def registrar_parametros(conn, tabela: str, relacao: str = None):
+    """Grava os parâmetros do mart no COMMENT da tabela (relacao = sombra, se informada)"""
+    if parametros_mart(tabela):
+        conn.execute(text(f"COMMENT ON TABLE refined.{relacao or tabela} IS '{parametros_mart(tabela)}';"))
+
+def _remover_relacao(conn, tabela: str):
+    """DROP de refined.{tabela}, seja tabela ou view materializada"""
+    tipo = _tipo_relacao(conn, tabela)
+    if tipo == 'm':
+        conn.execute(text(f"DROP MATERIALIZED VIEW refined.{tabela};"))
+    elif tipo is not None:
+        conn.execute(text(f"DROP TABLE refined.{tabela};"))
+
+def _dependentes(conn, tabela: str) -> list:
+    """Views (materializadas ou não) que leem refined.{tabela}"""
+    return conn.execute(text("""
+        SELECT DISTINCT v.oid::regclass::TEXT
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+        WHERE d.refobjid = to_regclass(:tabela) AND v.oid <> d.refobjid
+    """), {'tabela': f"refined.{tabela}"}).scalars().all()
+
+def _criar_sombra(conn, tabela: str):
+    """Cria refined.{tabela}__novo pelo DDL, com constraints e índices sufixados"""
+    sombra = f"{tabela}{SUFIXO_SOMBRA}"
+    conn.execute(text(f"DROP TABLE IF EXISTS refined.{sombra};"))
+    for comando in ddl_tabela(f"refined.{tabela}"):
+        comando = re.sub(rf"\brefined\.{tabela}\b", f"refined.{sombra}", comando)
+        comando = re.sub(r"\bCONSTRAINT\s+(\w+)", rf"CONSTRAINT \1{SUFIXO_SOMBRA}", comando)
+        comando = re.sub(r"\bINDEX\s+IF\s+NOT\s+EXISTS\s+(\w+)", rf"INDEX \1{SUFIXO_SOMBRA}", comando)
+        conn.execute(text(comando))
+
+def _trocar_sombra(conn, tabela: str):
+    """Publica refined.{tabela}__novo (tabela ou view) no lugar de refined.{tabela} (mesma transação)"""
+    _remover_relacao(conn, tabela)
+    conn.execute(text(f"ALTER TABLE refined.{tabela}{SUFIXO_SOMBRA} RENAME TO {tabela};"))
+
+    # Constraints primeiro (renomeiam o índice da PK/UNIQUE junto), depois os índices avulsos
+    restricoes = conn.execute(text("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = CAST(:tabela AS regclass) AND RIGHT(conname, :tamanho) = :sufixo
+    """), {'tabela': f"refined.{tabela}", 'sufixo': SUFIXO_SOMBRA, 'tamanho': len(SUFIXO_SOMBRA)}).scalars().all()
+    for nome in restricoes:
+        conn.execute(text(
+            f'ALTER TABLE refined.{tabela} RENAME CONSTRAINT "{nome}" TO "{nome[:-len(SUFIXO_SOMBRA)]}";'
+        ))
+
+    indices = conn.execute(text("""
+        SELECT i.relname
+        FROM pg_index ix
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        WHERE ix.indrelid = CAST(:tabela AS regclass) AND RIGHT(i.relname, :tamanho) = :sufixo
+    """), {'tabela': f"refined.{tabela}", 'sufixo': SUFIXO_SOMBRA, 'tamanho': len(SUFIXO_SOMBRA)}).scalars().all()
+    for nome in indices:
+        conn.execute(text(f'ALTER INDEX refined."{nome}" RENAME TO "{nome[:-len(SUFIXO_SOMBRA)]}";'))
+
+# ==========================================================
+# 🪟 Marts como view materializada (REFRESH CONCURRENTLY)
+# ==========================================================
+# A view guarda o SELECT do mart com as colunas convertidas para os tipos
+# do ddl.sql e um índice UNIQUE no lugar da PK/UNIQUE declarada, o que
+# permite REFRESH CONCURRENTLY: leitores não são bloqueados durante o
+# refresh. O hash do SELECT fica no COMMENT da view; se a consulta mudar
+# (nova versão do script), a view é recriada via sombra + troca.
+_RE_CHAVE = re.compile(r"CONSTRAINT\s+(\w+)\s+(?:PRIMARY\s+KEY|UNIQUE)\s*\(([^)]*)\)", re.IGNORECASE)
+
+def chave_unica(tabela: str):
+    """(nome, colunas) da PK/UNIQUE declarada para refined.{tabela} no ddl.sql, ou None"""
+    chave = _RE_CHAVE.search(ddl_tabela(f"refined.{tabela}")[0])
+    return (chave.group(1), chave.group(2).strip()) if chave else None
+
+def usa_view_materializada(tabela: str) -> bool:
+    if tabela in REFINED_VIEWS_MATERIALIZADAS:
+        return True
+    return "todos" in REFINED_VIEWS_MATERIALIZADAS and chave_unica(tabela) is not None
+
+def _select_view(tabela: str, select: str) -> str:
+    """SELECT do mart com os tipos e as colunas de auditoria do ddl.sql"""
+    tipos = carregar_tabelas()[f"refined.{tabela}"]["colunas"]
+    colunas = [f"CAST(s.{c} AS {tipos[c]}) AS {c}" for c in colunas_mart(tabela)]
+    colunas += [f"CURRENT_TIMESTAMP::TIMESTAMP AS {c}" for c in COLUNAS_AUDITORIA if c in tipos]
+    consulta = select.strip().rstrip(";")
+    return f"SELECT {', '.join(colunas)}\nFROM (\n{consulta}\n) s"
+
+def _publicar_view(conn, tabela: str, select: str, parametros: dict):
+    """REFRESH CONCURRENTLY da view, ou cria a view sombra e troca se ainda não existe/mudou"""
+    chave = chave_unica(tabela)
+    if chave is None:
+        raise ValueError(
+            f"refined.{tabela} não tem PK/UNIQUE no ddl.sql: REFRESH CONCURRENTLY exige um índice único"
+        )
+
+    consulta = _select_view(tabela, select)
+    # Parâmetros (ex: top_n=10) já mudam o SELECT; ficam no COMMENT para leitura
+    versao = " ".join(filter(None, [f"sha:{hashlib.sha256(consulta.encode()).hexdigest()[:16]}",
+                                    parametros_mart(tabela)]))
+    atual = None
+    if _estrutura_confere(conn, tabela, view=True):
+        atual = conn.execute(text("""
+            SELECT obj_description(CAST(:tabela AS regclass), 'pg_class')
+        """), {'tabela': f"refined.{tabela}"}).scalar()
+
+    if atual == versao:
+        conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY refined.{tabela};"))
+        log(f"🪟 refined.{tabela}: view materializada atualizada (REFRESH CONCURRENTLY).")
+        return
+
+    # Primeira publicação (ou SELECT alterado): cria a view sombra com os índices e troca
+    sombra = f"{tabela}{SUFIXO_SOMBRA}"
+    conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS refined.{sombra};"))
+    conn.execute(text(f"CREATE MATERIALIZED VIEW refined.{sombra} AS {consulta}"), parametros)
+    conn.execute(text(f"CREATE UNIQUE INDEX {chave[0]}{SUFIXO_SOMBRA} ON refined.{sombra} ({chave[1]});"))
+    for comando in ddl_tabela(f"refined.{tabela}")[1:]:
+        comando = re.sub(rf"\brefined\.{tabela}\b", f"refined.{sombra}", comando)
+        comando = re.sub(r"\bINDEX\s+IF\s+NOT\s+EXISTS\s+(\w+)", rf"INDEX \1{SUFIXO_SOMBRA}", comando)
+        conn.execute(text(comando))
+    conn.execute(text(f"COMMENT ON MATERIALIZED VIEW refined.{sombra} IS '{versao}';"))
+    conn.execute(text(f"ANALYZE refined.{sombra};"))
+    _trocar_sombra(conn, tabela)
+    log(f"🪟 refined.{tabela}: view materializada criada.")
+
+def _materializar(tabela: str, select: str, janela=None, coluna_mes: str = "mes_ano", parametros=None,
+                  coluna_data: str = None):
+    """
+    Grava o resultado de `select` em refined.{tabela}.
+
+    janela None/completa → tabela sombra com o DDL + INSERT + troca atômica
+    janela com meses     → DELETE dos meses + INSERT na tabela publicada
+    view materializada   → REFRESH CONCURRENTLY (ou criação + troca)
+    O watermark da janela é registrado na mesma transação.
+
+    O DELETE usa `coluna_mes` (primeiro dia do mês) ou, se informada,
+    a faixa de datas em `coluna_data` (tabelas em grão diário).
+    """
+    janela = janela or {'meses': None, 'watermark': None}
+    meses = janela['meses']
+    parametros = {**_parametros_meses(meses), **(parametros or {})}
+    colunas = ", ".join(colunas_mart(tabela))
+
+    with get_engine().begin() as conn:
+        if usa_view_materializada(tabela):
+            _publicar_view(conn, tabela, select, parametros)
+        elif meses is None and _dependentes(conn, tabela):
+            # Views materializadas leem esta tabela: sem DROP, substitui o conteúdo
+            # no lugar (DELETE mantém a versão anterior visível até o commit)
+            conn.execute(text(f"DELETE FROM refined.{tabela};"))
+            executar(conn, f"refined.{tabela}:completo", f"INSERT INTO refined.{tabela} ({colunas}) {select}", parametros)
+            registrar_parametros(conn, tabela)
+        elif meses is None:
+            _criar_sombra(conn, tabela)
+            executar(conn, f"refined.{tabela}:completo",
+                     f"INSERT INTO refined.{tabela}{SUFIXO_SOMBRA} ({colunas}) {select}", parametros)
+            conn.execute(text(f"ANALYZE refined.{tabela}{SUFIXO_SOMBRA};"))
+            registrar_parametros(conn, tabela, f"{tabela}{SUFIXO_SOMBRA}")
+            _trocar_sombra(conn, tabela)
+        else:
+            filtro = _filtro_meses(coluna_data, janela) if coluna_data else f"{coluna_mes} = ANY(:meses)"
+            executar(conn, f"refined.{tabela}:delete", f"DELETE FROM refined.{tabela} WHERE {filtro};", parametros)
+            executar(conn, f"refined.{tabela}:incremental", f"INSERT INTO refined.{tabela} ({colunas}) {select}", parametros)
+
+        conn.execute(text("""
+            INSERT INTO refined.controle_incremental (tabela, watermark, modo, meses_recalculados, atualizado_em)
+            VALUES (:tabela, :watermark, :modo, :meses, CURRENT_TIMESTAMP)
+            ON CONFLICT (tabela) DO UPDATE SET
+                watermark = EXCLUDED.watermark,
+                modo = EXCLUDED.modo,
+                meses_recalculados = EXCLUDED.meses_recalculados,
+                atualizado_em = EXCLUDED.atualizado_em
+        """), {
+            'tabela': tabela,
+            'watermark': janela['watermark'],
+            'modo': 'completo' if meses is None else 'incremental',
+            'meses': None if meses is None else len(meses),
+        })
+
+    if meses is not None:
+        log(f"♻️  refined.{tabela}: {len(meses)} mês(es) recalculado(s) ({', '.join(m.strftime('%Y-%m') for m in meses)}).")
+
+# ==========================================================
+# 🧱 Base: refined.base_vendas_diaria (dia × UF × produto × marca)
+# ==========================================================
+# Junta pedido, pedido_item, produto e marca uma única vez por execução.
+# Os marts de produto/marca/UF agregam esta base em vez de refazer o join.
+#
+# Contagens distintas de pedidos não somam entre linhas da base (um pedido
+# tem itens de vários produtos), então cada pedido é atribuído a uma única
+# linha via ROW_NUMBER: somar qtd_pedidos (ou qtd_pedidos_cancelamento,
+# por nome de marca) em qualquer agrupamento que contenha a linha atribuída
+# dá o COUNT(DISTINCT p.id) exato.
+#
+# As médias por linha pedido × item (ticket médio) são reconstruídas com a
+# soma e a contagem de vlr_total não nulo de cada recorte.
+def carregar_base_vendas_diaria(janela=None):
+    log("Gerando tabela refined.base_vendas_diaria...")
+
+    select = textwrap.dedent(f"""
+        WITH itens AS (
+            SELECT
+                p.id AS id_pedido,
+                p.data,
+                p.sgl_uf_entrega,
+                p.vlr_total,
+                i.id AS id_item,
+                i.id_produto,
+                pr.id_marca,
+                i.qtd_produto,
+                i.vlr_unitario,
+                i.flg_cancelado = 'N' AS item_valido,
+                COALESCE(i.id IS NOT NULL AND (p.status = 'CANCELADO' OR i.flg_cancelado = 'S'), FALSE) AS cancelamento,
+                COUNT(*) FILTER (WHERE i.flg_cancelado = 'N') OVER (PARTITION BY p.id) AS itens_validos_pedido,
+                ROW_NUMBER() OVER (PARTITION BY p.id ORDER BY i.id) AS ordem_pedido,
+                ROW_NUMBER() OVER (
+                    PARTITION BY p.id, m.nome,
+                        COALESCE(i.id IS NOT NULL AND (p.status = 'CANCELADO' OR i.flg_cancelado = 'S'), FALSE)
+                    ORDER BY i.id
+                ) AS ordem_cancelamento_marca
+            FROM trusted.pedido p
+            LEFT JOIN trusted.pedido_item i
+                ON i.id_pedido = p.id AND i.data_pedido = p.data
+               AND {_filtro_meses('i.data_pedido', janela)}
+            LEFT JOIN trusted.produto pr ON pr.id = i.id_produto
+            LEFT JOIN trusted.marca m ON m.id = pr.id_marca
+            WHERE {_filtro_meses('p.data', janela)}
+        )
+        SELECT
+            data,
+            sgl_uf_entrega,
+            id_produto,
+            id_marca,
+            -- pedidos atribuídos a esta linha (somáveis = contagem distinta)
+            COUNT(*) FILTER (WHERE ordem_pedido = 1) AS qtd_pedidos,
+            COUNT(*) FILTER (WHERE cancelamento AND ordem_cancelamento_marca = 1) AS qtd_pedidos_cancelamento,
+            -- todos os itens
+            COUNT(id_item) AS qtd_itens,
+            SUM(qtd_produto) AS qtd_produto,
+            SUM(vlr_total) FILTER (WHERE id_item IS NOT NULL) AS vlr_pedidos_itens,
+            -- itens não cancelados
+            COUNT(*) FILTER (WHERE item_valido) AS qtd_itens_validos,
+            SUM(qtd_produto) FILTER (WHERE item_valido) AS qtd_produto_valido,
+            SUM(qtd_produto * vlr_unitario) FILTER (WHERE item_valido) AS vlr_itens_validos,
+            -- linhas pedido × item não cancelado (pedido sem item válido conta uma vez)
+            SUM(vlr_total) FILTER (
+                WHERE item_valido OR (itens_validos_pedido = 0 AND ordem_pedido = 1)
+            ) AS vlr_pedidos_validos,
+            COUNT(vlr_total) FILTER (
+                WHERE item_valido OR (itens_validos_pedido = 0 AND ordem_pedido = 1)
+            ) AS qtd_vlr_pedidos_validos,
+            -- itens de cancelamento (pedido cancelado ou item cancelado)
+            COUNT(*) FILTER (WHERE cancelamento) AS qtd_itens_cancelamento,
+            SUM(vlr_total) FILTER (WHERE cancelamento) AS vlr_pedidos_cancelamento,
+            COUNT(vlr_total) FILTER (WHERE cancelamento) AS qtd_vlr_pedidos_cancelamento
+        FROM itens
+        GROUP BY data, sgl_uf_entrega, id_produto, id_marca;
+    """)
+
+    _materializar("base_vendas_diaria", select, janela, coluna_data="data")
+    log("✅ Tabela refined.base_vendas_diaria criada com sucesso.")
+
 # ==========================================================
 # 🥇 Tabela: mais_vendidos_mensal_estado
 # ==========================================================
-def carregar_best_sellers():
+# Só as REFINED_TOP_N primeiras posições de cada mês × UF são gravadas: o
+# ranking é calculado sobre todos os produtos e cortado antes do INSERT.
+# Leituras por posição usam idx_mais_vendidos_posicao (mes_ano, UF, posicao).
+def carregar_best_sellers(janela=None):
     log("Gerando tabela refined.mais_vendidos_mensal_estado...")
 
-    query = text(textwrap.dedent("""
-        DROP TABLE IF EXISTS refined.mais_vendidos_mensal_estado;
-        CREATE TABLE refined.mais_vendidos_mensal_estado AS
-        SELECT
-            DATE_TRUNC('month', p.data)::DATE AS mes_ano,
-            p.sgl_uf_entrega,
-            i.id_produto,
-            pr.nome AS nome_produto,
-            SUM(i.qtd_produto) AS total_qtd,
-            RANK() OVER (
-                PARTITION BY DATE_TRUNC('month', p.data), p.sgl_uf_entrega
-                ORDER BY SUM(i.qtd_produto) DESC
-            ) AS posicao
-        FROM trusted.pedido p
-        JOIN trusted.pedido_item i ON i.id_pedido = p.id
-        JOIN trusted.produto pr ON pr.id = i.id_produto
-        GROUP BY DATE_TRUNC('month', p.data), p.sgl_uf_entrega, i.id_produto, pr.nome;
-    """))
+    corte = f"r.posicao <= {REFINED_TOP_N}" if REFINED_TOP_N > 0 else "TRUE"
+    select = textwrap.dedent(f"""
+        SELECT r.*
+        FROM (
+            SELECT
+                DATE_TRUNC('month', b.data)::DATE AS mes_ano,
+                b.sgl_uf_entrega,
+                b.id_produto,
+                pr.nome AS nome_produto,
+                SUM(b.qtd_produto)::BIGINT AS total_qtd,
+                RANK() OVER (
+                    PARTITION BY DATE_TRUNC('month', b.data), b.sgl_uf_entrega
+                    ORDER BY SUM(b.qtd_produto) DESC
+                ) AS posicao
+            FROM refined.base_vendas_diaria b
+            JOIN trusted.produto pr ON pr.id = b.id_produto
+            WHERE b.sgl_uf_entrega IS NOT NULL  -- UF faz parte da PK (pk_mais_vendidos)
+              AND {_filtro_meses('b.data', janela)}
+            GROUP BY DATE_TRUNC('month', b.data), b.sgl_uf_entrega, b.id_produto, pr.nome
+        ) r
+        WHERE {corte}
+    """)
 
-    with engine.begin() as conn:
-        conn.execute(query)
+    _materializar("mais_vendidos_mensal_estado", select, janela)
     log("✅ Tabela refined.mais_vendidos_mensal_estado criada com sucesso.")
 
 # ==========================================================
 # 📊 Tabela: performance_mensal_marca
 # ==========================================================
-def carregar_performance_mensal():
+def carregar_performance_mensal(janela=None):
     log("Gerando tabela refined.performance_mensal_marca...")
 
-    query = text(textwrap.dedent("""
-        DROP TABLE IF EXISTS refined.performance_mensal_marca;
-        CREATE TABLE refined.performance_mensal_marca AS
+    select = textwrap.dedent(f"""
         SELECT
             d.ano,
             d.mes,
             m.id,
             m.nome AS nome_marca,
-            SUM(p.vlr_total) AS vlr_total_vendido,
+            SUM(b.vlr_pedidos_itens) AS vlr_total_vendido,
             COALESCE(mt.valor, 0) AS vlr_meta,
             ROUND(
-                (SUM(p.vlr_total) / NULLIF(mt.valor, 0)) * 100,
+                (SUM(b.vlr_pedidos_itens) / NULLIF(mt.valor, 0)) * 100,
                 2
             ) AS perc_atingimento_meta
-        FROM trusted.pedido_item pi
-        JOIN trusted.pedido p ON pi.id_pedido = p.id
-        JOIN trusted.data d ON p.data = d.data
-        JOIN trusted.produto pr ON pr.id = pi.id_produto
-        JOIN trusted.marca m ON m.id = pr.id_marca
+        FROM refined.base_vendas_diaria b
+        JOIN trusted.data d ON b.data = d.data
+        JOIN trusted.marca m ON m.id = b.id_marca
         LEFT JOIN trusted.meta mt
             ON mt.id_marca = m.id
             AND mt.ano = d.ano
             AND mt.mes = d.mes
+        WHERE {_filtro_meses('b.data', janela)}
         GROUP BY d.ano, d.mes, m.id, m.nome, mt.valor
         ORDER BY d.ano, d.mes, m.nome;
-    """))
+    """)
 
-    with engine.begin() as conn:
-        conn.execute(query)
+    _materializar("performance_mensal_marca", select, janela, coluna_mes="MAKE_DATE(ano, mes, 1)")
     log("✅ Tabela refined.performance_mensal_marca criada com sucesso.")
 
 # ==========================================================
 # 📊 Tabela: KPIs consolidados de vendas
 # ==========================================================
-def carregar_kpis_vendas():
+def carregar_kpis_vendas(janela=None):
     log("Gerando tabela refined.kpis_vendas...")
 
-    query = text(textwrap.dedent("""
-        DROP TABLE IF EXISTS refined.kpis_vendas;
-        CREATE TABLE refined.kpis_vendas AS
+    select = textwrap.dedent(f"""
         SELECT
             DATE_TRUNC('month', p.data)::DATE AS mes_ano,
             COUNT(DISTINCT p.id) AS qtd_pedidos,
@@ -129,66 +612,90 @@ def carregar_kpis_vendas():
             COUNT(DISTINCT i.id_produto) AS qtd_produtos_distintos,
             SUM(i.qtd_produto) AS qtd_itens_vendidos
         FROM trusted.pedido p
-        LEFT JOIN trusted.pedido_item i ON i.id_pedido = p.id AND i.flg_cancelado = 'N'
+        LEFT JOIN trusted.pedido_item i
+            ON i.id_pedido = p.id AND i.data_pedido = p.data AND i.flg_cancelado = 'N'
+           AND {_filtro_meses('i.data_pedido', janela)}
+        WHERE {_filtro_meses('p.data', janela)}
         GROUP BY DATE_TRUNC('month', p.data)
         ORDER BY mes_ano;
-    """))
+    """)
 
-    with engine.begin() as conn:
-        conn.execute(query)
+    _materializar("kpis_vendas", select, janela)
     log("✅ Tabela refined.kpis_vendas criada com sucesso.")
 
 # ==========================================================
 # 🚫 Tabela: Análise de cancelamentos
 # ==========================================================
-def carregar_analise_cancelamentos():
+def carregar_analise_cancelamentos(janela=None):
     log("Gerando tabela refined.analise_cancelamentos...")
 
-    query = text(textwrap.dedent("""
-        DROP TABLE IF EXISTS refined.analise_cancelamentos;
-        CREATE TABLE refined.analise_cancelamentos AS
+    select = textwrap.dedent(f"""
         SELECT
-            DATE_TRUNC('month', p.data)::DATE AS mes_ano,
-            p.sgl_uf_entrega,
+            DATE_TRUNC('month', b.data)::DATE AS mes_ano,
+            b.sgl_uf_entrega,
             m.nome AS marca,
-            COUNT(DISTINCT p.id) AS qtd_pedidos_cancelados,
-            SUM(p.vlr_total) AS vlr_total_cancelado,
-            COUNT(DISTINCT i.id) AS qtd_itens_cancelados,
-            ROUND(AVG(p.vlr_total), 2) AS ticket_medio_cancelado
-        FROM trusted.pedido p
-        JOIN trusted.pedido_item i ON i.id_pedido = p.id
-        JOIN trusted.produto pr ON pr.id = i.id_produto
-        JOIN trusted.marca m ON m.id = pr.id_marca
-        WHERE p.status = 'CANCELADO' OR i.flg_cancelado = 'S'
-        GROUP BY DATE_TRUNC('month', p.data), p.sgl_uf_entrega, m.nome
+            SUM(b.qtd_pedidos_cancelamento)::BIGINT AS qtd_pedidos_cancelados,
+            SUM(b.vlr_pedidos_cancelamento) AS vlr_total_cancelado,
+            SUM(b.qtd_itens_cancelamento)::BIGINT AS qtd_itens_cancelados,
+            ROUND(
+                SUM(b.vlr_pedidos_cancelamento) / NULLIF(SUM(b.qtd_vlr_pedidos_cancelamento), 0),
+                2
+            ) AS ticket_medio_cancelado
+        FROM refined.base_vendas_diaria b
+        JOIN trusted.marca m ON m.id = b.id_marca
+        WHERE b.qtd_itens_cancelamento > 0
+          AND {_filtro_meses('b.data', janela)}
+        GROUP BY DATE_TRUNC('month', b.data), b.sgl_uf_entrega, m.nome
         ORDER BY mes_ano, qtd_pedidos_cancelados DESC;
-    """))
+    """)
 
-    with engine.begin() as conn:
-        conn.execute(query)
+    _materializar("analise_cancelamentos", select, janela)
     log("✅ Tabela refined.analise_cancelamentos criada com sucesso.")
 
 # ==========================================================
 # 📈 Tabela: Variação de vendas por categoria
 # ==========================================================
-def carregar_vendas_categoria():
+# Vendas mensais por categoria (histórico inteiro: o LAG de cada categoria
+# lê o mês anterior em que ela vendeu, que pode estar fora da janela)
+SQL_VENDAS_MENSAIS_CATEGORIA = """
+    SELECT
+        DATE_TRUNC('month', b.data)::DATE AS mes_ano,
+        COALESCE(pr.categoria, 'Sem Categoria') AS categoria,
+        SUM(b.qtd_produto_valido)::BIGINT AS total_qtd,
+        SUM(b.vlr_itens_validos) AS total_valor
+    FROM refined.base_vendas_diaria b
+    JOIN trusted.produto pr ON pr.id = b.id_produto
+    WHERE b.qtd_itens_validos > 0
+    GROUP BY DATE_TRUNC('month', b.data), COALESCE(pr.categoria, 'Sem Categoria')
+"""
+
+def _meses_seguintes_categoria(meses) -> list:
+    """Para cada categoria, o próximo mês com vendas depois de cada mês em `meses`"""
+    with get_engine().connect() as conn:
+        return conn.execute(text(f"""
+            WITH vendas_mensais AS ({SQL_VENDAS_MENSAIS_CATEGORIA})
+            SELECT DISTINCT (
+                SELECT MIN(v.mes_ano) FROM vendas_mensais v
+                WHERE v.categoria = c.categoria AND v.mes_ano > m.mes_ano
+            )
+            FROM UNNEST(CAST(:meses AS DATE[])) AS m(mes_ano)
+            CROSS JOIN (SELECT DISTINCT categoria FROM vendas_mensais) c
+        """), {'meses': list(meses)}).scalars().all()
+
+def carregar_vendas_categoria(janela=None):
     log("Gerando tabela refined.vendas_categoria_variacao...")
 
-    query = text(textwrap.dedent("""
-        DROP TABLE IF EXISTS refined.vendas_categoria_variacao;
-        CREATE TABLE refined.vendas_categoria_variacao AS
-        WITH vendas_mensais AS (
-            SELECT
-                DATE_TRUNC('month', p.data)::DATE AS mes_ano,
-                COALESCE(pr.categoria, 'Sem Categoria') AS categoria,
-                SUM(i.qtd_produto) AS total_qtd,
-                SUM(i.qtd_produto * i.vlr_unitario) AS total_valor
-            FROM trusted.pedido p
-            JOIN trusted.pedido_item i ON i.id_pedido = p.id
-            JOIN trusted.produto pr ON pr.id = i.id_produto
-            WHERE i.flg_cancelado = 'N'
-            GROUP BY DATE_TRUNC('month', p.data), COALESCE(pr.categoria, 'Sem Categoria')
-        ),
+    # A variação de um mês depende do mês anterior em que a categoria vendeu:
+    # além dos meses afetados, recalcula o próximo mês com vendas de cada
+    # categoria depois deles (o LAG dele aponta para um mês afetado, ou passa
+    # a apontar para outro se a categoria sumiu do mês afetado)
+    if janela is not None and janela['meses'] is not None:
+        seguintes = [m for m in _meses_seguintes_categoria(janela['meses']) if m is not None]
+        janela = {**janela, 'meses': sorted(set(janela['meses']) | set(seguintes))}
+    saida = "TRUE" if janela is None or janela['meses'] is None else "mes_ano = ANY(:meses)"
+
+    select = textwrap.dedent(f"""
+        WITH vendas_mensais AS ({SQL_VENDAS_MENSAIS_CATEGORIA}),
         vendas_com_lag AS (
             SELECT
                 mes_ano,
@@ -221,63 +728,179 @@ def carregar_vendas_categoria():
                 2
             ) AS pct_variacao_valor
         FROM vendas_com_lag
+        WHERE {saida}
         ORDER BY mes_ano DESC, total_valor DESC;
-    """))
+    """)
 
-    with engine.begin() as conn:
-        conn.execute(query)
+    _materializar("vendas_categoria_variacao", select, janela)
     log("✅ Tabela refined.vendas_categoria_variacao criada com sucesso.")
 
 # ==========================================================
 # 🌍 Tabela: Análise por região (UF)
 # ==========================================================
-def carregar_analise_regional():
+def carregar_analise_regional(janela=None):
     log("Gerando tabela refined.analise_regional...")
 
-    query = text(textwrap.dedent("""
-        DROP TABLE IF EXISTS refined.analise_regional;
-        CREATE TABLE refined.analise_regional AS
+    select = textwrap.dedent(f"""
         SELECT
-            DATE_TRUNC('month', p.data)::DATE AS mes_ano,
-            p.sgl_uf_entrega,
-            COUNT(DISTINCT p.id) AS qtd_pedidos,
-            SUM(p.vlr_total) AS receita_total,
-            ROUND(AVG(p.vlr_total), 2) AS ticket_medio,
-            SUM(i.qtd_produto) AS qtd_itens,
-            COUNT(DISTINCT i.id_produto) AS qtd_produtos_distintos,
-            COUNT(DISTINCT pr.id_marca) AS qtd_marcas_distintas
-        FROM trusted.pedido p
-        LEFT JOIN trusted.pedido_item i ON i.id_pedido = p.id AND i.flg_cancelado = 'N'
-        LEFT JOIN trusted.produto pr ON pr.id = i.id_produto
-        WHERE p.sgl_uf_entrega IS NOT NULL
-        GROUP BY DATE_TRUNC('month', p.data), p.sgl_uf_entrega
+            DATE_TRUNC('month', b.data)::DATE AS mes_ano,
+            b.sgl_uf_entrega,
+            SUM(b.qtd_pedidos)::BIGINT AS qtd_pedidos,
+            SUM(b.vlr_pedidos_validos) AS receita_total,
+            ROUND(SUM(b.vlr_pedidos_validos) / NULLIF(SUM(b.qtd_vlr_pedidos_validos), 0), 2) AS ticket_medio,
+            SUM(b.qtd_produto_valido)::BIGINT AS qtd_itens,
+            COUNT(DISTINCT b.id_produto) FILTER (WHERE b.qtd_itens_validos > 0) AS qtd_produtos_distintos,
+            COUNT(DISTINCT b.id_marca) FILTER (WHERE b.qtd_itens_validos > 0) AS qtd_marcas_distintas
+        FROM refined.base_vendas_diaria b
+        WHERE b.sgl_uf_entrega IS NOT NULL
+          AND {_filtro_meses('b.data', janela)}
+        GROUP BY DATE_TRUNC('month', b.data), b.sgl_uf_entrega
         ORDER BY mes_ano DESC, receita_total DESC;
-    """))
+    """)
 
-    with engine.begin() as conn:
-        conn.execute(query)
+    _materializar("analise_regional", select, janela)
     log("✅ Tabela refined.analise_regional criada com sucesso.")
 
+# ==========================================================
+# 🗺️ Catálogo de transformações: saída → função e entradas
+# ==========================================================
+# Uma transformação só inicia quando as entradas produzidas por outras
+# transformações deste catálogo (refined.*) terminaram; as demais rodam
+# em paralelo. "parametros" identifica a configuração que gerou o mart:
+# se mudar, o próximo refresh incremental vira completo.
+# "depende_mes_anterior": cada mês lê os anteriores (LAG) e a janela de um mês
+# também regrava meses seguintes; o backfill processa esses meses em ordem.
+TRANSFORMACOES = {
+    "base_vendas_diaria": {
+        "funcao": carregar_base_vendas_diaria,
+        "entradas": ["trusted.pedido", "trusted.pedido_item", "trusted.produto", "trusted.marca"],
+    },
+    "mais_vendidos_mensal_estado": {
+        "funcao": carregar_best_sellers,
+        "entradas": ["refined.base_vendas_diaria", "trusted.produto"],
+        "parametros": f"top_n={REFINED_TOP_N}",
+    },
+    "performance_mensal_marca": {
+        "funcao": carregar_performance_mensal,
+        "entradas": ["refined.base_vendas_diaria", "trusted.data", "trusted.marca", "trusted.meta"],
+    },
+    "kpis_vendas": {
+        "funcao": carregar_kpis_vendas,
+        "entradas": ["trusted.pedido", "trusted.pedido_item"],
+    },
+    "analise_cancelamentos": {
+        "funcao": carregar_analise_cancelamentos,
+        "entradas": ["refined.base_vendas_diaria", "trusted.marca"],
+    },
+    "vendas_categoria_variacao": {
+        "funcao": carregar_vendas_categoria,
+        "entradas": ["refined.base_vendas_diaria", "trusted.produto"],
+        "depende_mes_anterior": True,
+    },
+    "analise_regional": {
+        "funcao": carregar_analise_regional,
+        "entradas": ["refined.base_vendas_diaria"],
+    },
+}
+
+def executar_transformacao(tabela: str, janela=None):
+    """Executa a transformação do mart na janela dada (ou planejada agora, se None)"""
+    if janela is None:
+        janela = planejar_refresh(tabela)
+    if janela['meses'] == []:
+        log(f"⏭️  refined.{tabela}: nenhum pedido/meta alterado desde o último refresh.")
+        return
+    TRANSFORMACOES[tabela]["funcao"](janela)
+
+def executar_em_paralelo(transformacoes=TRANSFORMACOES, max_workers=REFINED_PARALELISMO):
+    """
+    Executa as transformações em um pool de `max_workers` threads.
+
+    Dependências vêm das entradas declaradas: quem lê refined.X espera a
+    transformação que grava X. Se uma falha, as dependentes não rodam.
+    As janelas de todas são planejadas antes, de uma vez (planejar_refreshes).
+
+    Retorna (duracoes, falhas) com duracoes = {tabela: segundos} e
+    falhas = {tabela: exceção}.
+    """
+    pendentes = {
+        tabela: {
+            entrada.split('.', 1)[1] for entrada in definicao["entradas"]
+            if entrada.startswith('refined.') and entrada.split('.', 1)[1] in transformacoes
+        }
+        for tabela, definicao in transformacoes.items()
+    }
+    concluidas, duracoes, falhas = set(), {}, {}
+    janelas = planejar_refreshes(transformacoes)
+
+    def cronometrar(tabela):
+        inicio = time.perf_counter()
+        try:
+            executar_transformacao(tabela, janelas[tabela])
+        finally:
+            duracoes[tabela] = time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        em_execucao = {}
+
+        def submeter_prontas():
+            for tabela in list(pendentes):
+                if pendentes[tabela] <= concluidas:
+                    del pendentes[tabela]
+                    em_execucao[executor.submit(cronometrar, tabela)] = tabela
+
+        submeter_prontas()
+        while em_execucao:
+            finalizados, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in finalizados:
+                tabela = em_execucao.pop(futuro)
+                try:
+                    futuro.result()
+                    concluidas.add(tabela)
+                except Exception as e:
+                    falhas[tabela] = e
+                    erro(f"Erro ao gerar refined.{tabela}: {e}")
+
+            # Propaga falhas para as transformações dependentes
+            bloqueadas = True
+            while bloqueadas:
+                bloqueadas = [t for t, deps in pendentes.items() if deps & set(falhas)]
+                for tabela in bloqueadas:
+                    del pendentes[tabela]
+                    falhas[tabela] = RuntimeError("entrada refined não gerada")
+                    erro(f"refined.{tabela} ignorada: entrada refined não gerada")
+
+            submeter_prontas()
+
+    if pendentes:
+        raise RuntimeError(f"Dependência circular entre as transformações: {sorted(pendentes)}")
+
+    return duracoes, falhas
+
+def imprimir_resumo(duracoes: dict, falhas: dict, tempo_total: float):
+    print("\n" + "="*60)
+    print("📋 RESUMO DAS TRANSFORMAÇÕES")
+    print("="*60)
+    for tabela in TRANSFORMACOES:
+        status = "❌ FALHA" if tabela in falhas else "✅ OK"
+        segundos = f"{duracoes[tabela]:.2f}s" if tabela in duracoes else "-"
+        print(f"{status:<10}{'refined.' + tabela:<42}{segundos:>8}")
+    print(f"\n⏱️  Tempo total: {tempo_total:.2f}s (paralelismo: {REFINED_PARALELISMO})")
+    print("="*60)
+
 # ==========================================================
 # 🚀 Execução principal do pipeline refined
 # ==========================================================
 if __name__ == "__main__":
-    log("🚀 Iniciando transformações na camada refined...")
+    log(f"🚀 Iniciando transformações na camada refined (modo: {REFINED_MODO})...")
     inicializar_schemas()
 
-    transformacoes = [
-        carregar_best_sellers,
-        carregar_performance_mensal,
-        carregar_kpis_vendas,
-        carregar_analise_cancelamentos,
-        carregar_vendas_categoria,
-        carregar_analise_regional,
-    ]
+    inicio = time.perf_counter()
+    duracoes, falhas = executar_em_paralelo()
+    imprimir_resumo(duracoes, falhas, time.perf_counter() - inicio)
 
-    for func in transformacoes:
-        try:
-            func()
-        except SQLAlchemyError as e:
-            erro(f"Erro ao executar {func.__name__}: {e}")
+    if falhas:
+        erro(f"Pipeline refined finalizado com falhas em: {', '.join(sorted(falhas))}")
+        sys.exit(1)
 
     log("🏁 Pipeline refined finalizado com sucesso!")
@@ -0,0 +1,278 @@
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from statistics import NormalDist
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conexao import DB_POOL_SIZE, DB_MAX_OVERFLOW, fechar_conexao, get_engine, obter_conexao
+from esquema_ddl import ddl_tabela
+from planos import PLANOS_CAPTURA, capturar_plano
+
+# =====================================================
+# 🧵 Execução paralela das validações
+# =====================================================
+# As etapas (funções validate_*) de validate_trusted.py e validate_refined.py
+# rodam em paralelo num pool de threads, cada uma na sua conexão do pool de
+# conexao.py (VALIDACAO_PARALELISMO etapas por vez, limitado ao tamanho do
+# pool). Cada etapa roda com statement_timeout próprio: uma consulta que
+# passar do limite é cancelada pelo banco e a etapa aparece como TIMEOUT,
+# sem travar as demais nem a task do Airflow. Uma consulta pode ter limite
+# próprio (executar_consulta(timeout_ms=...), ex: os grupos de regras de
+# validate_trusted.py).
+#
+# Os resultados vão para um ColetorResultados (thread-safe). A saída de
+# cada etapa é acumulada e impressa inteira, na ordem declarada, assim que
+# ela e as anteriores terminam.
+#
+#   VALIDACAO_PARALELISMO   etapas simultâneas (padrão 4)
+#   VALIDACAO_TIMEOUT_MS    statement_timeout padrão por etapa (0 = sem limite)
+# =====================================================
+
+VALIDACAO_PARALELISMO = int(os.getenv("VALIDACAO_PARALELISMO", "4"))
+VALIDACAO_TIMEOUT_MS = int(os.getenv("VALIDACAO_TIMEOUT_MS", "300000"))
+
+# SQLSTATE de consulta cancelada (statement_timeout)
+_QUERY_CANCELED = "57014"
+
+class TempoEsgotado(Exception):
+    """Consulta de validação cancelada pelo statement_timeout (da etapa ou da própria consulta)"""
+
+class ColetorResultados:
+    """Resultados das validações (SUCCESS/WARNING/ERROR/TIMEOUT), seguro entre threads"""
+
+    def __init__(self):
+        self.resultados = []
+        self._lock = threading.Lock()
+
+    def registrar(self, status: str, message: str, etapa: str = None, chave: str = None, violacoes: int = None,
+                  duracao_ms: float = None, grupo: str = None):
+        with self._lock:
+            self.resultados.append({
+                "status": status, "message": message, "etapa": etapa, "chave": chave,
+                "violacoes": violacoes, "duracao_ms": duracao_ms, "grupo": grupo, "timestamp": datetime.now()
+            })
+
+    def contar(self, status: str) -> int:
+        with self._lock:
+            return sum(1 for r in self.resultados if r["status"] == status)
+
+# Etapa em execução na thread atual: coletor, nome, saída acumulada e timeout
+_contexto = threading.local()
+_coletor_padrao = ColetorResultados()
+
+def _saida(linha: str):
+    linhas = getattr(_contexto, 'linhas', None)
+    if linhas is None:
+        print(linha)
+    else:
+        linhas.append(linha)
+
+def _registrar(status: str, simbolo: str, message: str, chave: str = None, violacoes: int = None,
+               duracao_ms: float = None, grupo: str = None):
+    _saida(f"{simbolo} {message}")
+    coletor = getattr(_contexto, 'coletor', None) or _coletor_padrao
+    coletor.registrar(status, message, getattr(_contexto, 'etapa', None), chave, violacoes, duracao_ms, grupo)
+
+def cabecalho(titulo: str):
+    """Título da etapa na saída"""
+    _saida("\n" + "="*60)
+    _saida(titulo)
+    _saida("="*60)
+
+# `chave` identifica a verificação entre execuções (ex: 'nulo:pedido.vlr_total'),
+# `violacoes` é a quantidade encontrada e `duracao_ms` o tempo da consulta
+# (`grupo`) que a calculou; todos vão para trusted.qualidade_dados
+def log_success(message: str, chave: str = None, violacoes: int = None, duracao_ms: float = None, grupo: str = None):
+    """Log de sucesso"""
+    _registrar("SUCCESS", "✅", message, chave, violacoes, duracao_ms, grupo)
+
+def log_warning(message: str, chave: str = None, violacoes: int = None, duracao_ms: float = None, grupo: str = None):
+    """Log de aviso"""
+    _registrar("WARNING", "⚠️ ", message, chave, violacoes, duracao_ms, grupo)
+
+def log_error(message: str, chave: str = None, violacoes: int = None, duracao_ms: float = None, grupo: str = None):
+    """Log de erro"""
+    _registrar("ERROR", "❌", message, chave, violacoes, duracao_ms, grupo)
+
+def log_timeout(message: str, chave: str = None, grupo: str = None):
+    """Log de consulta cancelada por tempo"""
+    _registrar("TIMEOUT", "⏱️ ", message, chave, grupo=grupo)
+
+def intervalo_wilson(violacoes: int, amostra: int, confianca: float = 0.95) -> tuple:
+    """(taxa, limite inferior, limite superior) da taxa de violação pelo intervalo de Wilson"""
+    if amostra == 0:
+        return 0.0, 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confianca / 2)
+    taxa = violacoes / amostra
+    denominador = 1 + z**2 / amostra
+    centro = (taxa + z**2 / (2 * amostra)) / denominador
+    margem = z * math.sqrt(taxa * (1 - taxa) / amostra + z**2 / (4 * amostra**2)) / denominador
+    return taxa, max(0.0, centro - margem), min(1.0, centro + margem)
+
+def executar_consulta(query: str, nome: str, medir: bool = False, timeout_ms: int = None,
+                      registrar_timeout: bool = True):
+    """
+    Executa a query na conexão da thread (com o statement_timeout da etapa,
+    ou `timeout_ms` só nesta consulta) e retorna as linhas; com `medir`,
+    retorna (linhas, duração em ms), sem contar a captura do plano. Com
+    PLANOS_CAPTURA, o plano é capturado antes com `nome`. Consulta cancelada
+    por tempo → registra TIMEOUT (se `registrar_timeout`) e levanta TempoEsgotado.
+    """
+    conn = obter_conexao()
+    if timeout_ms is not None:
+        conn.execute(text(f"SET statement_timeout = {int(timeout_ms)}"))
+    try:
+        if PLANOS_CAPTURA:
+            capturar_plano(conn, nome, query)
+        inicio = time.perf_counter()
+        linhas = conn.execute(text(query)).fetchall()
+        return (linhas, (time.perf_counter() - inicio) * 1000) if medir else linhas
+    except OperationalError as e:
+        if getattr(e.orig, 'pgcode', None) != _QUERY_CANCELED:
+            raise
+        if registrar_timeout:
+            limite = timeout_ms if timeout_ms is not None else getattr(_contexto, 'timeout_ms', None)
+            log_timeout(f"Consulta {nome} excedeu {limite or '?'} ms e foi cancelada",
+                        chave=f"timeout:{getattr(_contexto, 'etapa', None) or nome}")
+        raise TempoEsgotado(nome) from e
+    finally:
+        if timeout_ms is not None:
+            # Volta ao statement_timeout da etapa (conexão em autocommit: SET LOCAL não valeria)
+            etapa_ms = getattr(_contexto, 'timeout_ms', None)
+            conn.execute(text("RESET statement_timeout" if etapa_ms is None
+                              else f"SET statement_timeout = {int(etapa_ms)}"))
+
+def _executar_etapa(coletor: ColetorResultados, funcao, timeout_ms: int) -> list:
+    """Roda uma etapa na thread atual e devolve as linhas de saída"""
+    _contexto.coletor, _contexto.etapa, _contexto.linhas = coletor, funcao.__name__, []
+    _contexto.timeout_ms = timeout_ms
+    conn = obter_conexao()
+    try:
+        conn.execute(text(f"SET statement_timeout = {int(timeout_ms)}"))
+        inicio = time.perf_counter()
+        try:
+            funcao()
+        except TempoEsgotado:
+            pass
+        except Exception as e:
+            log_error(f"Falha inesperada em {funcao.__name__}: {str(e).splitlines()[0]}")
+        _contexto.linhas.append(f"   ({funcao.__name__}: {time.perf_counter() - inicio:.2f}s)")
+        return _contexto.linhas
+    finally:
+        try:
+            conn.execute(text("RESET statement_timeout"))
+        finally:
+            fechar_conexao()
+            _contexto.coletor = _contexto.etapa = _contexto.linhas = _contexto.timeout_ms = None
+
+def executar_validacoes(etapas: list, paralelismo: int = VALIDACAO_PARALELISMO,
+                        timeout_ms: int = VALIDACAO_TIMEOUT_MS) -> ColetorResultados:
+    """
+    Executa as etapas em paralelo. Cada etapa é uma função ou (função,
+    timeout_ms) para um statement_timeout diferente do padrão. A saída é
+    impressa na ordem de `etapas`; retorna o coletor com os resultados.
+    """
+    coletor = ColetorResultados()
+    etapas = [etapa if isinstance(etapa, tuple) else (etapa, timeout_ms) for etapa in etapas]
+    # Cada etapa ocupa uma conexão do pool durante toda a execução
+    workers = max(1, min(paralelismo, DB_POOL_SIZE + DB_MAX_OVERFLOW, len(etapas)))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="validacao") as executor:
+        futuros = [executor.submit(_executar_etapa, coletor, funcao, limite) for funcao, limite in etapas]
+        for futuro in futuros:
+            for linha in futuro.result():
+                print(linha)
+    return coletor
+
+# =====================================================
+# 🗄️ Histórico de resultados (trusted.qualidade_execucao / qualidade_dados)
+# =====================================================
+# Cada execução grava o escopo (completa, amostra ou lote) e o resultado
+# de cada verificação com `chave`, com o tempo da consulta que a calculou.
+# A validação de um lote consolida o seu resultado com a última execução
+# completa (ver validate_trusted.py); historico_verificacoes resume custo e
+# falhas de cada verificação nas últimas execuções completas.
+
+def registrar_execucao(coletor: ColetorResultados, camada: str, escopo: str, id_log_ingestao: int = None,
+                       janela_inicio=None, janela_fim=None) -> int:
+    """Grava a execução e os resultados com chave; retorna o id da execução"""
+    resultados = {}
+    for r in coletor.resultados:
+        if r["chave"]:
+            resultados[r["chave"]] = r
+    with get_engine().begin() as conn:
+        for tabela in ("trusted.qualidade_execucao", "trusted.qualidade_dados"):
+            for comando in ddl_tabela(tabela):
+                conn.execute(text(comando))
+        id_execucao = conn.execute(text("""
+            INSERT INTO trusted.qualidade_execucao
+                (camada, escopo, id_log_ingestao, janela_inicio, janela_fim, sucessos, avisos, erros, timeouts)
+            VALUES
+                (:camada, :escopo, :id_log, :inicio, :fim, :sucessos, :avisos, :erros, :timeouts)
+            RETURNING id
+        """), {
+            'camada': camada, 'escopo': escopo, 'id_log': id_log_ingestao,
+            'inicio': janela_inicio, 'fim': janela_fim,
+            'sucessos': coletor.contar("SUCCESS"), 'avisos': coletor.contar("WARNING"),
+            'erros': coletor.contar("ERROR"), 'timeouts': coletor.contar("TIMEOUT"),
+        }).scalar()
+        if resultados:
+            conn.execute(text("""
+                INSERT INTO trusted.qualidade_dados
+                    (id_execucao, verificacao, etapa, status, violacoes, mensagem, grupo, duracao_ms)
+                VALUES
+                    (:id_execucao, :verificacao, :etapa, :status, :violacoes, :mensagem, :grupo, :duracao_ms)
+            """), [{
+                'id_execucao': id_execucao, 'verificacao': chave, 'etapa': r["etapa"],
+                'status': r["status"], 'violacoes': r["violacoes"], 'mensagem': r["message"],
+                'grupo': r["grupo"], 'duracao_ms': r["duracao_ms"],
+            } for chave, r in resultados.items()])
+    return id_execucao
+
+def ultima_execucao(camada: str, escopo: str = 'completa'):
+    """(executado_em, {verificacao: {status, violacoes, mensagem}}) da última execução do escopo, ou None"""
+    with get_engine().connect() as conn:
+        if conn.execute(text("SELECT to_regclass('trusted.qualidade_execucao')")).scalar() is None:
+            return None
+        execucao = conn.execute(text("""
+            SELECT id, executado_em FROM trusted.qualidade_execucao
+            WHERE camada = :camada AND escopo = :escopo
+            ORDER BY executado_em DESC, id DESC
+            LIMIT 1
+        """), {'camada': camada, 'escopo': escopo}).fetchone()
+        if execucao is None:
+            return None
+        linhas = conn.execute(text("""
+            SELECT verificacao, status, violacoes, mensagem FROM trusted.qualidade_dados
+            WHERE id_execucao = :id
+        """), {'id': execucao[0]}).fetchall()
+    return execucao[1], {v: {'status': st, 'violacoes': n, 'mensagem': m} for v, st, n, m in linhas}
+
+def historico_verificacoes(camada: str, execucoes: int = 30) -> dict:
+    """
+    {verificacao: {execucoes, falhas, duracao_media_ms, duracao_max_ms}} nas
+    últimas `execucoes` validações completas da camada ({} sem histórico)
+    """
+    with get_engine().connect() as conn:
+        if conn.execute(text("SELECT to_regclass('trusted.qualidade_dados')")).scalar() is None:
+            return {}
+        linhas = conn.execute(text("""
+            SELECT d.verificacao, COUNT(*), COUNT(*) FILTER (WHERE d.status <> 'SUCCESS'),
+                   AVG(d.duracao_ms), MAX(d.duracao_ms)
+            FROM trusted.qualidade_dados d
+            JOIN (
+                SELECT id FROM trusted.qualidade_execucao
+                WHERE camada = :camada AND escopo = 'completa'
+                ORDER BY executado_em DESC, id DESC
+                LIMIT :execucoes
+            ) e ON e.id = d.id_execucao
+            GROUP BY d.verificacao
+        """), {'camada': camada, 'execucoes': execucoes}).fetchall()
+    return {v: {'execucoes': n, 'falhas': falhas, 'duracao_media_ms': media, 'duracao_max_ms': maximo}
+            for v, n, falhas, media, maximo in linhas}
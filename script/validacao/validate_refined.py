@@ -1,57 +1,43 @@
+import hashlib
 import os
-from sqlalchemy import create_engine, text
+import re
+import sys
 from datetime import datetime
-from dotenv import load_dotenv
 from typing import List, Tuple
 
 # =====================================================
-# 1️⃣ Carregar variáveis de ambiente
+# 1️⃣ Conexão: engine compartilhado e criado sob demanda (script/conexao.py)
 # =====================================================
-load_dotenv()
-
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-
-# =====================================================
-# 2️⃣ Criar engine de conexão
-# =====================================================
-engine = create_engine(f'postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
-
-# =====================================================
-# 3️⃣ Variáveis globais para controle
-# =====================================================
-validation_results = []
-total_errors = 0
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conexao import fechar_conexao
+from executor_validacoes import (
+    TempoEsgotado, cabecalho, executar_consulta, executar_validacoes, log_error, log_success, log_warning,
+)
 
 # =====================================================
 # 🛠️ Funções auxiliares
 # =====================================================
+# log_success/log_warning/log_error registram no coletor da execução
+# paralela (executor_validacoes.py)
 
-def log_success(message: str):
-    """Log de sucesso"""
-    print(f"✅ {message}")
-    validation_results.append({"status": "SUCCESS", "message": message, "timestamp": datetime.now()})
-
-def log_warning(message: str):
-    """Log de aviso"""
-    print(f"⚠️  {message}")
-    validation_results.append({"status": "WARNING", "message": message, "timestamp": datetime.now()})
+def execute_query(query: str, nome: str = None) -> List[Tuple]:
+    """
+    Executa query na conexão da etapa (com o statement_timeout dela) e retorna
+    o resultado. Com PLANOS_CAPTURA, o plano é capturado antes (EXPLAIN ANALYZE) com o nome
+    informado ou 'validate_refined.<função>:<hash da query>'.
+    """
+    if nome is None:
+        chamador = sys._getframe(1).f_code.co_name
+        nome = f"validate_refined.{chamador}:{hashlib.sha1(query.encode()).hexdigest()[:8]}"
+    return executar_consulta(query, nome)
 
-def log_error(message: str):
-    """Log de erro"""
-    global total_errors
-    total_errors += 1
-    print(f"❌ {message}")
-    validation_results.append({"status": "ERROR", "message": message, "timestamp": datetime.now()})
-
-def execute_query(query: str) -> List[Tuple]:
-    """Executa query e retorna resultado"""
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        return result.fetchall()
+def top_n_publicado() -> int:
+    """Corte de posições de mais_vendidos_mensal_estado ('top_n=N' no COMMENT da tabela/view; 0 = completo)"""
+    comentario = execute_query(
+        "SELECT obj_description(to_regclass('refined.mais_vendidos_mensal_estado'), 'pg_class')"
+    )[0][0] or ''
+    corte = re.search(r'\btop_n=(\d+)', comentario)
+    return int(corte.group(1)) if corte else 0
 
 # =====================================================
 # 🧪 VALIDAÇÕES DA CAMADA REFINED
@@ -59,9 +45,7 @@ def execute_query(query: str) -> List[Tuple]:
 
 def validate_table_existence():
     """1️⃣ Valida se as tabelas refined existem"""
-    print("\n" + "="*60)
-    print("📊 VALIDAÇÃO 1: Existência das Tabelas Refined")
-    print("="*60)
+    cabecalho("📊 VALIDAÇÃO 1: Existência das Tabelas Refined")
     
     tables = [
         'mais_vendidos_mensal_estado',
@@ -85,9 +69,7 @@ def validate_table_existence():
 
 def validate_refined_counts():
     """2️⃣ Valida se as tabelas refined possuem dados"""
-    print("\n" + "="*60)
-    print("📈 VALIDAÇÃO 2: Contagem de Registros Refined")
-    print("="*60)
+    cabecalho("📈 VALIDAÇÃO 2: Contagem de Registros Refined")
     
     tables = ['mais_vendidos_mensal_estado', 'performance_mensal_marca']
     
@@ -101,14 +83,14 @@ def validate_refined_counts():
                 log_warning(f"Tabela refined.{table} está VAZIA!")
             else:
                 log_success(f"Tabela refined.{table}: {count:,} registros")
+        except TempoEsgotado:
+            continue
         except Exception as e:
             log_error(f"Erro ao consultar refined.{table}: {str(e)}")
 
 def validate_mais_vendidos_ranking():
     """3️⃣ Valida rankings dos mais vendidos"""
-    print("\n" + "="*60)
-    print("🏆 VALIDAÇÃO 3: Rankings dos Mais Vendidos")
-    print("="*60)
+    cabecalho("🏆 VALIDAÇÃO 3: Rankings dos Mais Vendidos")
     
     try:
         # Verificar se os rankings começam em 1
@@ -144,15 +126,29 @@ def validate_mais_vendidos_ranking():
             log_warning(f"Encontrados {result[0][0]} gaps nos rankings")
         else:
             log_success("Não há gaps nos rankings")
+
+        # Verificar o corte top N (REFINED_TOP_N) aplicado na carga
+        top_n = top_n_publicado()
+        if top_n:
+            query = f"""
+                SELECT COUNT(*) FROM refined.mais_vendidos_mensal_estado
+                WHERE posicao > {top_n}
+            """
+            result = execute_query(query)
+
+            if result[0][0] > 0:
+                log_error(f"Encontrados {result[0][0]} registros além do top {top_n}")
+            else:
+                log_success(f"Rankings limitados ao top {top_n} por mês/estado")
             
+    except TempoEsgotado:
+        raise
     except Exception as e:
         log_error(f"Erro ao validar rankings: {str(e)}")
 
 def validate_performance_calculations():
     """4️⃣ Valida cálculos de performance"""
-    print("\n" + "="*60)
-    print("💯 VALIDAÇÃO 4: Cálculos de Performance")
-    print("="*60)
+    cabecalho("💯 VALIDAÇÃO 4: Cálculos de Performance")
     
     try:
         # Verificar se percentual de atingimento está calculado corretamente
@@ -180,25 +176,32 @@ def validate_performance_calculations():
         else:
             log_success("Não há valores negativos em performance")
             
+    except TempoEsgotado:
+        raise
     except Exception as e:
         log_error(f"Erro ao validar cálculos: {str(e)}")
 
 def validate_aggregation_consistency():
     """5️⃣ Valida consistência das agregações"""
-    print("\n" + "="*60)
-    print("🔢 VALIDAÇÃO 5: Consistência das Agregações")
-    print("="*60)
+    cabecalho("🔢 VALIDAÇÃO 5: Consistência das Agregações")
     
     try:
         # Verificar se total de quantidades em mais_vendidos bate com trusted
-        query = """
+        # (com corte top N, a soma de todos os produtos vem da base diária)
+        if top_n_publicado():
+            soma = "SUM(b.qtd_produto)"
+            origem = "refined.base_vendas_diaria b WHERE b.sgl_uf_entrega IS NOT NULL"
+        else:
+            soma, origem = "SUM(mv.total_qtd)", "refined.mais_vendidos_mensal_estado mv"
+        query = f"""
             SELECT 
-                SUM(mv.total_qtd) as refined_total,
+                {soma} as refined_total,
                 (SELECT SUM(qtd_produto) 
                  FROM trusted.pedido_item i
-                 JOIN trusted.pedido p ON i.id_pedido = p.id
-                 WHERE i.flg_cancelado = 'N') as trusted_total
-            FROM refined.mais_vendidos_mensal_estado mv
+                 JOIN trusted.pedido p ON i.id_pedido = p.id AND i.data_pedido = p.data
+                 WHERE i.flg_cancelado = 'N'
+                   AND p.sgl_uf_entrega IS NOT NULL) as trusted_total
+            FROM {origem}
         """
         result = execute_query(query)
         
@@ -231,14 +234,14 @@ def validate_aggregation_consistency():
             else:
                 log_success(f"Agregações de valores consistentes (diff: {diff_pct:.2f}%)")
                 
+    except TempoEsgotado:
+        raise
     except Exception as e:
         log_error(f"Erro ao validar agregações: {str(e)}")
 
 def validate_date_ranges():
     """6️⃣ Valida ranges de datas"""
-    print("\n" + "="*60)
-    print("📅 VALIDAÇÃO 6: Ranges de Datas Refined")
-    print("="*60)
+    cabecalho("📅 VALIDAÇÃO 6: Ranges de Datas Refined")
     
     try:
         # Verificar se há dados muito antigos ou futuros
@@ -261,14 +264,14 @@ def validate_date_ranges():
         else:
             log_warning("Não foi possível determinar range de datas")
             
+    except TempoEsgotado:
+        raise
     except Exception as e:
         log_error(f"Erro ao validar datas: {str(e)}")
 
 def validate_data_quality_metrics():
     """7️⃣ Valida métricas de qualidade dos dados"""
-    print("\n" + "="*60)
-    print("🎯 VALIDAÇÃO 7: Métricas de Qualidade")
-    print("="*60)
+    cabecalho("🎯 VALIDAÇÃO 7: Métricas de Qualidade")
     
     try:
         # Verificar completude dos dados (% de nulos)
@@ -310,6 +313,8 @@ def validate_data_quality_metrics():
         else:
             log_success("Todas as marcas possuem dados de performance")
             
+    except TempoEsgotado:
+        raise
     except Exception as e:
         log_error(f"Erro ao validar métricas de qualidade: {str(e)}")
 
@@ -324,30 +329,38 @@ def main():
     print(f"Iniciado em: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*60)
     
-    # Executar todas as validações
-    validate_table_existence()
-    validate_refined_counts()
-    validate_mais_vendidos_ranking()
-    validate_performance_calculations()
-    validate_aggregation_consistency()
-    validate_date_ranges()
-    validate_data_quality_metrics()
+    # Executar todas as validações (em paralelo, saída na ordem abaixo)
+    coletor = executar_validacoes([
+        validate_table_existence,
+        validate_refined_counts,
+        validate_mais_vendidos_ranking,
+        validate_performance_calculations,
+        validate_aggregation_consistency,
+        validate_date_ranges,
+        validate_data_quality_metrics,
+    ])
     
     # Resumo final
     print("\n" + "="*60)
     print("📋 RESUMO DAS VALIDAÇÕES")
     print("="*60)
     
-    success_count = sum(1 for r in validation_results if r["status"] == "SUCCESS")
-    warning_count = sum(1 for r in validation_results if r["status"] == "WARNING")
-    error_count = sum(1 for r in validation_results if r["status"] == "ERROR")
+    success_count = coletor.contar("SUCCESS")
+    warning_count = coletor.contar("WARNING")
+    error_count = coletor.contar("ERROR")
+    timeout_count = coletor.contar("TIMEOUT")
     
     print(f"✅ Sucessos: {success_count}")
     print(f"⚠️  Avisos:   {warning_count}")
     print(f"❌ Erros:    {error_count}")
+    print(f"⏱️  Timeouts: {timeout_count}")
     print("="*60)
     
-    if error_count == 0:
+    if timeout_count > 0:
+        print(f"\n⏱️  ATENÇÃO: {timeout_count} validação(ões) cancelada(s) por tempo (VALIDACAO_TIMEOUT_MS)!")
+        print("❌ Resultado incompleto: a camada não pôde ser totalmente verificada.")
+        return 1
+    elif error_count == 0:
         print("\n🎉 TODAS AS VALIDAÇÕES CRÍTICAS PASSARAM!")
         print("✅ Camada REFINED está íntegra e pronta para consumo analítico.")
         return 0
@@ -357,6 +370,9 @@ def main():
         return 1
 
 if __name__ == '__main__':
-    exit_code = main()
+    try:
+        exit_code = main()
+    finally:
+        fechar_conexao()
     exit(exit_code)
 
@@ -1,57 +1,448 @@
+import argparse
+import hashlib
 import os
-from sqlalchemy import create_engine, text
+import random
+import sys
+import threading
 from datetime import datetime
-from dotenv import load_dotenv
-from typing import Dict, List, Tuple
+from typing import List, Tuple
 
 # =====================================================
-# 1️⃣ Carregar variáveis de ambiente
+# 1️⃣ Conexão: engine compartilhado e criado sob demanda (script/conexao.py)
 # =====================================================
-load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conexao import fechar_conexao
+from executor_validacoes import (
+    TempoEsgotado, cabecalho, executar_consulta, executar_validacoes, intervalo_wilson, log_error, log_success,
+    log_timeout, log_warning, historico_verificacoes, registrar_execucao, ultima_execucao,
+)
 
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
+# =====================================================
+# 🛠️ Funções auxiliares
+# =====================================================
+# log_success/log_warning/log_error registram no coletor da execução
+# paralela (executor_validacoes.py)
+
+def execute_query(query: str, nome: str = None, medir: bool = False, timeout_ms: int = None,
+                  registrar_timeout: bool = True) -> List[Tuple]:
+    """
+    Executa query na conexão da etapa (com o statement_timeout dela, ou
+    `timeout_ms`) e retorna o resultado (com `medir`, também a duração em ms).
+    Com PLANOS_CAPTURA, o plano é capturado antes (EXPLAIN ANALYZE) com o nome
+    informado ou 'validate_trusted.<função>:<hash da query>'.
+    """
+    if nome is None:
+        chamador = sys._getframe(1).f_code.co_name
+        nome = f"validate_trusted.{chamador}:{hashlib.sha1(query.encode()).hexdigest()[:8]}"
+    return executar_consulta(query, nome, medir, timeout_ms, registrar_timeout)
 
 # =====================================================
-# 2️⃣ Criar engine de conexão
+# 🎲 Modo amostral (VALIDACAO_MODO=amostra)
 # =====================================================
-engine = create_engine(f'postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+# Para rodar de hora em hora sem varrer as tabelas grandes: as mesmas regras
+# rodam sobre uma amostra TABLESAMPLE (BERNOULLI ou SYSTEM) das tabelas com
+# mais de VALIDACAO_AMOSTRA_MIN_LINHAS linhas estimadas (pg_class.reltuples);
+# as menores continuam exatas. Cada regra informa a taxa de violação estimada
+# com intervalo de confiança de Wilson (VALIDACAO_AMOSTRA_CONFIANCA) e o total
+# extrapolado. Violação encontrada na amostra é real e mantém o status do
+# modo exato (ERROR/WARNING); sem violação, SUCCESS com o limite superior da
+# taxa. Duplicatas só aparecem se as duas linhas caírem na amostra.
+#
+# SYSTEM sorteia páginas inteiras (mais rápido, mas linhas da mesma página
+# vêm juntas e o intervalo fica otimista); BERNOULLI sorteia linha a linha.
+# Em tabelas particionadas a semente se repete em cada partição, o que também
+# aumenta a variância real da estimativa.
+# A semente (REPEATABLE) faz todas as consultas enxergarem a mesma amostra de
+# cada tabela; sem VALIDACAO_AMOSTRA_SEMENTE, uma é sorteada e impressa para
+# reprodução. O modo exato continua o padrão (execução noturna).
+VALIDACAO_MODO = os.getenv("VALIDACAO_MODO", "exata")
+VALIDACAO_AMOSTRA_METODO = os.getenv("VALIDACAO_AMOSTRA_METODO", "BERNOULLI")
+VALIDACAO_AMOSTRA_PCT = float(os.getenv("VALIDACAO_AMOSTRA_PCT", "1"))
+VALIDACAO_AMOSTRA_SEMENTE = os.getenv("VALIDACAO_AMOSTRA_SEMENTE", "")
+VALIDACAO_AMOSTRA_MIN_LINHAS = int(os.getenv("VALIDACAO_AMOSTRA_MIN_LINHAS", "100000"))
+VALIDACAO_AMOSTRA_CONFIANCA = float(os.getenv("VALIDACAO_AMOSTRA_CONFIANCA", "0.95"))
+
+# {'metodo', 'pct', 'semente'} no modo amostral; None no modo exato
+amostra = None
+_amostradas = {}
+
+def configurar_amostra(modo: str = VALIDACAO_MODO, metodo: str = VALIDACAO_AMOSTRA_METODO,
+                       pct: float = VALIDACAO_AMOSTRA_PCT, semente: str = VALIDACAO_AMOSTRA_SEMENTE):
+    """Define o modo das validações (chamar antes de main)"""
+    global amostra
+    if modo not in ('exata', 'amostra'):
+        raise ValueError(f"Modo de validação inválido: {modo} (use exata ou amostra)")
+    if metodo.upper() not in ('BERNOULLI', 'SYSTEM'):
+        raise ValueError(f"Método de amostragem inválido: {metodo} (use BERNOULLI ou SYSTEM)")
+    if not 0 < pct <= 100:
+        raise ValueError(f"Percentual de amostragem inválido: {pct} (use 0 < pct <= 100)")
+    _amostradas.clear()
+    amostra = None if modo == 'exata' else {
+        'metodo': metodo.upper(),
+        'pct': pct,
+        'semente': int(semente) if semente else random.randint(1, 2**31 - 1),
+    }
+
+def amostrada(tabela: str) -> bool:
+    """A tabela é lida por amostra (modo amostral e linhas estimadas acima do mínimo)"""
+    if amostra is None:
+        return False
+    if tabela not in _amostradas:
+        # Tabelas particionadas: a estimativa fica nas partições
+        linhas = execute_query(f"""
+            SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)
+            FROM pg_class c
+            WHERE c.oid = 'trusted.{tabela}'::regclass
+               OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'trusted.{tabela}'::regclass)
+        """, nome=f"validate_trusted.reltuples:{tabela}")[0][0]
+        _amostradas[tabela] = linhas >= VALIDACAO_AMOSTRA_MIN_LINHAS
+    return _amostradas[tabela]
 
 # =====================================================
-# 3️⃣ Variáveis globais para controle
+# 📦 Validação de um lote de ingestão (--lote / --desde)
 # =====================================================
-validation_results = []
-total_errors = 0
+# Só as linhas gravadas ou alteradas na janela do lote são checadas:
+#   - marca, produto, pedido, pedido_item e meta: GREATEST(criado_em,
+#     atualizado_em) na janela (itens órfãos ou de pedidos inalterados entram);
+#   - data (dimensão gerada, pequena): inteira.
+# A janela de um registro de trusted.log_ingestao vai da carga anterior da
+# mesma tabela até a data_ingestao dele e vale para todas as tabelas (as
+# cargas paralelas da mesma execução entram juntas). Duplicatas comparam as
+# chaves do lote com a tabela inteira. O resultado é consolidado com a
+# última validação completa gravada em trusted.qualidade_dados: problemas
+# já conhecidos continuam valendo junto com os do lote.
+TABELAS_LOTE = ['marca', 'produto', 'pedido', 'pedido_item', 'meta']
+
+# Verificações por linha, consolidadas com a última validação completa
+VERIFICACOES_POR_LINHA = ('fk:', 'nulo:', 'condicao:', 'duplicada:', 'regra:')
+
+# {'id_log', 'inicio', 'fim'} na validação de lote; None nos demais modos
+lote = None
+
+def configurar_lote(id_log: int = None, inicio: datetime = None, fim: datetime = None):
+    """Limita as validações à janela de um lote (registro de log_ingestao ou intervalo de criado_em)"""
+    global lote
+    if id_log is not None:
+        registro = execute_query(f"""
+            SELECT l.data_ingestao,
+                   (SELECT MAX(a.data_ingestao) FROM trusted.log_ingestao a
+                    WHERE a.tabela = l.tabela AND a.id < l.id)
+            FROM trusted.log_ingestao l
+            WHERE l.id = {int(id_log)}
+        """, nome="validate_trusted.lote")
+        if not registro:
+            raise ValueError(f"Lote {id_log} não encontrado em trusted.log_ingestao")
+        fim, inicio = registro[0]
+    lote = {'id_log': id_log, 'inicio': inicio, 'fim': fim}
+
+def _filtro_lote() -> str:
+    alterado_em = "GREATEST(criado_em, atualizado_em)"
+    filtros = []
+    if lote['inicio'] is not None:
+        filtros.append(f"{alterado_em} > TIMESTAMP '{lote['inicio'].isoformat(sep=' ')}'")
+    if lote['fim'] is not None:
+        filtros.append(f"{alterado_em} <= TIMESTAMP '{lote['fim'].isoformat(sep=' ')}'")
+    return " AND ".join(filtros) or "TRUE"
+
+def fonte(tabela: str, alias: str = "") -> str:
+    """
+    trusted.{tabela} [alias], com TABLESAMPLE se a tabela for amostrada ou
+    restrita às linhas do lote na validação de lote
+    """
+    if lote is not None and tabela in TABELAS_LOTE:
+        return f"(SELECT * FROM trusted.{tabela} WHERE {_filtro_lote()}) {alias or tabela}"
+    sql = f"trusted.{tabela}" + (f" {alias}" if alias else "")
+    if amostrada(tabela):
+        sql += f" TABLESAMPLE {amostra['metodo']} ({amostra['pct']}) REPEATABLE ({amostra['semente']})"
+    return sql
+
+def estimativa(violacoes: int, tabela: str) -> str:
+    """Sufixo da mensagem com taxa, intervalo e total estimados ('' se a tabela é lida inteira)"""
+    if not amostrada(tabela):
+        return ""
+    linhas = perfil(tabela)['total']
+    taxa, inferior, superior = intervalo_wilson(violacoes, linhas, VALIDACAO_AMOSTRA_CONFIANCA)
+    extrapolado = violacoes * 100 / amostra['pct']
+    return (f" [amostra de {linhas:,} linhas: taxa {taxa:.3%}, IC{VALIDACAO_AMOSTRA_CONFIANCA:.0%} "
+            f"{inferior:.3%}–{superior:.3%}, ~{extrapolado:,.0f} no total]")
 
 # =====================================================
-# 🛠️ Funções auxiliares
+# 📜 Registro de regras de qualidade
 # =====================================================
+# Cada regra declara tabela, tipo, expressão SQL e severidade (ERROR ou
+# WARNING); as etapas de validação só percorrem o registro. Tipos:
+#   nulo       expressao = coluna obrigatória
+#   condicao   expressao = condição de violação por linha
+#   duplicada  expressao = chave que não pode se repetir
+#   fk         expressao = condição do NOT EXISTS entre a linha (f) e a `referencia` (r)
+#   consulta   expressao = SELECT das linhas em violação ({fonte} = tabela da regra com alias f)
+# Opcionais: erro/sucesso (mensagens; {n} = violações), descricao, limite
+# (consulta: no modo exato para de contar em N), grupo e timeout_ms (ver
+# compilação) e ativa (False aposenta a regra sem apagar o histórico dela).
+
+TABELAS = ['marca', 'produto', 'data', 'pedido', 'pedido_item', 'meta']
 
-def log_success(message: str):
-    """Log de sucesso"""
-    print(f"✅ {message}")
-    validation_results.append({"status": "SUCCESS", "message": message, "timestamp": datetime.now()})
-
-def log_warning(message: str):
-    """Log de aviso"""
-    print(f"⚠️  {message}")
-    validation_results.append({"status": "WARNING", "message": message, "timestamp": datetime.now()})
-
-def log_error(message: str):
-    """Log de erro"""
-    global total_errors
-    total_errors += 1
-    print(f"❌ {message}")
-    validation_results.append({"status": "ERROR", "message": message, "timestamp": datetime.now()})
-
-def execute_query(query: str) -> List[Tuple]:
-    """Executa query e retorna resultado"""
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        return result.fetchall()
+REGRAS = [
+    # Integridade referencial
+    {'chave': 'fk:produto.id_marca', 'etapa': 'fks', 'tabela': 'produto', 'tipo': 'fk', 'severidade': 'ERROR',
+     'referencia': 'marca', 'expressao': "r.id = f.id_marca", 'descricao': "produto.id_marca → marca.id"},
+    {'chave': 'fk:pedido.data', 'etapa': 'fks', 'tabela': 'pedido', 'tipo': 'fk', 'severidade': 'ERROR',
+     'referencia': 'data', 'expressao': "r.data = f.data", 'descricao': "pedido.data → data.data"},
+    {'chave': 'fk:pedido_item.id_pedido', 'etapa': 'fks', 'tabela': 'pedido_item', 'tipo': 'fk', 'severidade': 'ERROR',
+     'referencia': 'pedido', 'expressao': "r.id = f.id_pedido AND r.data = f.data_pedido",
+     'descricao': "pedido_item.id_pedido → pedido.id"},
+    {'chave': 'fk:pedido_item.id_produto', 'etapa': 'fks', 'tabela': 'pedido_item', 'tipo': 'fk', 'severidade': 'ERROR',
+     'referencia': 'produto', 'expressao': "r.id = f.id_produto", 'descricao': "pedido_item.id_produto → produto.id"},
+    {'chave': 'fk:meta.id_marca', 'etapa': 'fks', 'tabela': 'meta', 'tipo': 'fk', 'severidade': 'ERROR',
+     'referencia': 'marca', 'expressao': "r.id = f.id_marca", 'descricao': "meta.id_marca → marca.id"},
+
+    # Campos obrigatórios
+    {'chave': 'nulo:marca.nome', 'etapa': 'nulos', 'tabela': 'marca', 'tipo': 'nulo', 'expressao': "nome",
+     'severidade': 'ERROR'},
+    {'chave': 'nulo:produto.nome', 'etapa': 'nulos', 'tabela': 'produto', 'tipo': 'nulo', 'expressao': "nome",
+     'severidade': 'ERROR'},
+    {'chave': 'nulo:produto.id_marca', 'etapa': 'nulos', 'tabela': 'produto', 'tipo': 'nulo', 'expressao': "id_marca",
+     'severidade': 'ERROR'},
+    {'chave': 'nulo:pedido.data', 'etapa': 'nulos', 'tabela': 'pedido', 'tipo': 'nulo', 'expressao': "data",
+     'severidade': 'ERROR'},
+    {'chave': 'nulo:pedido.vlr_total', 'etapa': 'nulos', 'tabela': 'pedido', 'tipo': 'nulo', 'expressao': "vlr_total",
+     'severidade': 'ERROR'},
+    {'chave': 'nulo:pedido_item.id_pedido', 'etapa': 'nulos', 'tabela': 'pedido_item', 'tipo': 'nulo',
+     'expressao': "id_pedido", 'severidade': 'ERROR'},
+    {'chave': 'nulo:pedido_item.id_produto', 'etapa': 'nulos', 'tabela': 'pedido_item', 'tipo': 'nulo',
+     'expressao': "id_produto", 'severidade': 'ERROR'},
+    {'chave': 'nulo:pedido_item.qtd_produto', 'etapa': 'nulos', 'tabela': 'pedido_item', 'tipo': 'nulo',
+     'expressao': "qtd_produto", 'severidade': 'ERROR'},
+    {'chave': 'nulo:data.ano', 'etapa': 'nulos', 'tabela': 'data', 'tipo': 'nulo', 'expressao': "ano",
+     'severidade': 'ERROR'},
+    {'chave': 'nulo:data.mes', 'etapa': 'nulos', 'tabela': 'data', 'tipo': 'nulo', 'expressao': "mes",
+     'severidade': 'ERROR'},
+
+    # Faixas de valores
+    {'chave': 'condicao:vlr_negativo', 'etapa': 'faixas', 'tabela': 'pedido', 'tipo': 'condicao',
+     'expressao': "vlr_total < 0", 'severidade': 'ERROR',
+     'erro': "Existem {n} pedidos com valor negativo!", 'sucesso': "Todos os pedidos têm valores positivos"},
+    {'chave': 'condicao:qtd_invalida', 'etapa': 'faixas', 'tabela': 'pedido_item', 'tipo': 'condicao',
+     'expressao': "qtd_produto <= 0", 'severidade': 'ERROR',
+     'erro': "Existem {n} itens com quantidade inválida!", 'sucesso': "Todas as quantidades são válidas"},
+    {'chave': 'condicao:uf_invalida', 'etapa': 'faixas', 'tabela': 'pedido', 'tipo': 'condicao',
+     'expressao': "sgl_uf_entrega IS NOT NULL AND sgl_uf_entrega !~ '^[A-Z]{2}$'", 'severidade': 'ERROR',
+     'erro': "Existem {n} UFs com formato inválido!", 'sucesso': "Todas as UFs estão no formato correto"},
+    {'chave': 'condicao:mes_invalido', 'etapa': 'faixas', 'tabela': 'data', 'tipo': 'condicao',
+     'expressao': "mes < 1 OR mes > 12", 'severidade': 'ERROR',
+     'erro': "Existem {n} datas com mês inválido!", 'sucesso': "Todos os meses são válidos (1-12)"},
+
+    # Duplicatas de chave primária
+    {'chave': 'duplicada:marca.id', 'etapa': 'duplicatas', 'tabela': 'marca', 'tipo': 'duplicada', 'expressao': "id",
+     'severidade': 'ERROR'},
+    {'chave': 'duplicada:produto.id', 'etapa': 'duplicatas', 'tabela': 'produto', 'tipo': 'duplicada',
+     'expressao': "id", 'severidade': 'ERROR'},
+    {'chave': 'duplicada:pedido.id', 'etapa': 'duplicatas', 'tabela': 'pedido', 'tipo': 'duplicada',
+     'expressao': "id", 'severidade': 'ERROR'},
+    {'chave': 'duplicada:pedido_item.id', 'etapa': 'duplicatas', 'tabela': 'pedido_item', 'tipo': 'duplicada',
+     'expressao': "id", 'severidade': 'ERROR'},
+    {'chave': 'duplicada:data.data', 'etapa': 'duplicatas', 'tabela': 'data', 'tipo': 'duplicada',
+     'expressao': "data", 'severidade': 'ERROR'},
+
+    # Regras de negócio
+    # Itens cancelados não contam no total do pedido (no modo exato, basta
+    # achar 10 divergentes; na amostra ou no lote, conta todos)
+    {'chave': 'regra:pedido_divergente', 'etapa': 'negocio', 'tabela': 'pedido', 'tipo': 'consulta',
+     'severidade': 'WARNING', 'limite': 10, 'expressao': """
+        SELECT f.id
+        FROM {fonte}
+        JOIN trusted.pedido_item i ON f.id = i.id_pedido AND f.data = i.data_pedido
+        GROUP BY f.id, f.vlr_total
+        HAVING ABS(f.vlr_total - SUM(CASE WHEN i.flg_cancelado = 'N'
+                                      THEN i.qtd_produto * i.vlr_unitario
+                                      ELSE 0 END)) > 0.01
+     """,
+     'erro': "Encontrados {n} pedidos com divergência de valores",
+     'sucesso': "Valores dos pedidos estão consistentes com seus itens"},
+    {'chave': 'regra:pedido_sem_itens', 'etapa': 'negocio', 'tabela': 'pedido', 'tipo': 'consulta',
+     'severidade': 'WARNING', 'expressao': """
+        SELECT f.id
+        FROM {fonte}
+        LEFT JOIN trusted.pedido_item i ON f.id = i.id_pedido AND f.data = i.data_pedido
+        WHERE i.id IS NULL
+     """,
+     'erro': "Existem {n} pedidos sem itens", 'sucesso': "Todos os pedidos possuem itens"},
+
+    # Consistência de datas
+    {'chave': 'condicao:data_inconsistente', 'etapa': 'datas', 'tabela': 'data', 'tipo': 'condicao',
+     'expressao': "EXTRACT(YEAR FROM data) != ano OR EXTRACT(MONTH FROM data) != mes OR EXTRACT(DAY FROM data) != dia",
+     'severidade': 'ERROR',
+     'erro': "Existem {n} datas inconsistentes!", 'sucesso': "Todas as datas estão consistentes (ano, mês, dia)"},
+]
+
+# Mensagens padrão por tipo ({alvo} = descricao ou o que vem depois de 'tipo:' na chave)
+MENSAGENS = {
+    'nulo': ("Campo obrigatório {alvo} tem {n} valores NULL!", "Campo {alvo} não possui valores NULL"),
+    'fk': ("FK violada: {alvo} - {n} registros órfãos!", "FK válida: {alvo}"),
+    'duplicada': ("PK {alvo} tem {n} valores duplicados{ressalva}!", "PK {alvo} não possui duplicatas{ressalva}"),
+    'condicao': ("Regra {alvo} violada por {n} registros!", "Regra {alvo} atendida"),
+    'consulta': ("Regra {alvo} violada por {n} registros!", "Regra {alvo} atendida"),
+}
+
+def regras_ativas(etapa: str = None) -> list:
+    """Regras ativas do registro (todas ou só as de `etapa`), na ordem declarada"""
+    return [r for r in REGRAS if r.get('ativa', True) and (etapa is None or r['etapa'] == etapa)]
+
+# =====================================================
+# 🧮 Compilação das regras em lotes de SQL
+# =====================================================
+# As regras ativas são agrupadas e cada grupo vira uma única consulta:
+#   - 'perfil:<tabela>' (padrão de nulo, condicao e duplicada): uma varredura
+#     da tabela com COUNT(*) FILTER (WHERE ...) por regra. A consulta agrupa
+#     primeiro pela chave da regra de duplicada (contando linhas e violações
+#     de cada valor) e soma os grupos; traz também o total de linhas;
+#   - os demais (cada fk sozinha, 'consultas' ou o `grupo` da regra): um
+#     SELECT com uma subconsulta escalar de contagem por regra.
+# Cada consulta roda uma vez e o resultado é compartilhado pelas etapas. O
+# tempo dela vai para trusted.qualidade_dados (duracao_ms) em todas as
+# regras do grupo: para medir uma regra cara sozinha, dê a ela um `grupo`
+# próprio; para aposentá-la, ativa=False.
+#
+# Timeout: a consulta do grupo roda com o statement_timeout da etapa ou,
+# se alguma regra do grupo declarar `timeout_ms`, com o menor deles. Um
+# grupo cancelado por tempo registra TIMEOUT em cada regra dele; os demais
+# grupos da etapa seguem normalmente. As fks ficam em grupos separados para
+# que uma fk lenta não cancele as outras.
+
+def grupo(regra: dict) -> str:
+    """Grupo (consulta) em que a regra é calculada"""
+    if regra.get('grupo'):
+        return regra['grupo']
+    if regra['tipo'] == 'duplicada' and lote is not None and regra['tabela'] in TABELAS_LOTE:
+        # No lote, as chaves do lote são procuradas na tabela inteira
+        return 'duplicadas'
+    if regra['tipo'] in ('nulo', 'condicao', 'duplicada'):
+        return f"perfil:{regra['tabela']}"
+    return regra['chave'] if regra['tipo'] == 'fk' else 'consultas'
+
+def timeout_grupo(nome: str):
+    """statement_timeout (ms) da consulta do grupo, ou None para o da etapa"""
+    limites = [r['timeout_ms'] for r in regras_ativas() if grupo(r) == nome and r.get('timeout_ms') is not None]
+    return min(limites, default=None)
+
+def _filtro(regra: dict) -> str:
+    """Condição de violação por linha de uma regra nulo/condicao"""
+    return f"{regra['expressao']} IS NULL" if regra['tipo'] == 'nulo' else regra['expressao']
+
+def sql_violacoes(regra: dict) -> str:
+    """SELECT escalar com a quantidade de violações da regra"""
+    tabela, expressao = regra['tabela'], regra['expressao']
+    if regra['tipo'] in ('nulo', 'condicao'):
+        return f"SELECT COUNT(*) FROM {fonte(tabela)} WHERE {_filtro(regra)}"
+    if regra['tipo'] == 'fk':
+        return f"""
+            SELECT COUNT(*) FROM {fonte(tabela, 'f')}
+            WHERE NOT EXISTS (SELECT 1 FROM trusted.{regra['referencia']} r WHERE {expressao})
+        """
+    if regra['tipo'] == 'duplicada':
+        if lote is not None and tabela in TABELAS_LOTE:
+            # Chaves do lote que aparecem mais de uma vez na tabela inteira
+            return f"""
+                SELECT COUNT(*) FROM (SELECT DISTINCT {expressao} FROM {fonte(tabela, 'l')}) n
+                WHERE (SELECT COUNT(*) FROM trusted.{tabela} t WHERE t.{expressao} = n.{expressao}) > 1
+            """
+        return f"SELECT COUNT(*) FROM (SELECT 1 FROM {fonte(tabela)} GROUP BY {expressao} HAVING COUNT(*) > 1) d"
+    consulta = expressao.format(fonte=fonte(tabela, 'f'))
+    if regra.get('limite') and lote is None and not amostrada(tabela):
+        consulta += f" LIMIT {int(regra['limite'])}"
+    return f"SELECT COUNT(*) FROM ({consulta}) q"
+
+def sql_perfil(tabela: str, regras: list) -> str:
+    """Consulta única com a contagem de `tabela` e as violações das regras por linha dela"""
+    filtros = {r['chave']: _filtro(r) for r in regras if r['tipo'] != 'duplicada'}
+    duplicada = next((r for r in regras if r['tipo'] == 'duplicada'), None)
+
+    if duplicada is None:
+        internos = [f'COUNT(*) FILTER (WHERE {condicao}) AS "{chave}"' for chave, condicao in filtros.items()]
+        return f"SELECT {', '.join(['COUNT(*) AS total'] + internos)} FROM {fonte(tabela)}"
+
+    internos = ["COUNT(*) AS total"] + [f'COUNT(*) FILTER (WHERE {condicao}) AS "{chave}"'
+                                        for chave, condicao in filtros.items()]
+    externos = ["COALESCE(SUM(total), 0)::BIGINT AS total",
+                f'COUNT(*) FILTER (WHERE total > 1) AS "{duplicada["chave"]}"']
+    externos += [f'COALESCE(SUM("{chave}"), 0)::BIGINT AS "{chave}"' for chave in filtros]
+    return f"""
+        SELECT {', '.join(externos)}
+        FROM (
+            SELECT {', '.join(internos)}
+            FROM {fonte(tabela)}
+            GROUP BY {duplicada['expressao']}
+        ) g
+    """
+
+def sql_grupo(nome: str) -> str:
+    """Consulta que calcula todas as regras ativas do grupo"""
+    regras = [r for r in regras_ativas() if grupo(r) == nome]
+    if nome.startswith('perfil:'):
+        return sql_perfil(nome.split(':', 1)[1], regras)
+    return "SELECT " + ",\n".join(f'({sql_violacoes(r).strip()}) AS "{r["chave"]}"' for r in regras)
+
+# Grupos já calculados; o lock por grupo evita que etapas paralelas
+# (contagem, nulos, faixas...) façam a mesma consulta ao mesmo tempo
+_grupos = {}
+_grupos_locks = {}
+_grupos_lock = threading.Lock()
+
+def resultado_grupo(nome: str) -> dict:
+    """
+    {'valores': {chave: violações, ...}, 'duracao_ms'} do grupo (consulta
+    executada uma vez e reaproveitada); TempoEsgotado se ela foi cancelada por tempo
+    """
+    with _grupos_lock:
+        lock = _grupos_locks.setdefault(nome, threading.Lock())
+    with lock:
+        if nome not in _grupos:
+            try:
+                linhas, duracao_ms = execute_query(sql_grupo(nome), nome=f"validate_trusted.{nome}", medir=True,
+                                                   timeout_ms=timeout_grupo(nome), registrar_timeout=False)
+                _grupos[nome] = {'valores': dict(linhas[0]._mapping), 'duracao_ms': round(duracao_ms, 2)}
+            except TempoEsgotado:
+                _grupos[nome] = None
+    if _grupos[nome] is None:
+        raise TempoEsgotado(nome)
+    return _grupos[nome]
+
+def perfil(tabela: str) -> dict:
+    """Contagem e violações por linha de `tabela`"""
+    return resultado_grupo(f"perfil:{tabela}")['valores']
+
+def _validar_regras(etapa: str):
+    """Registra o resultado de cada regra ativa da etapa, na ordem do registro"""
+    for regra in regras_ativas(etapa):
+        nome = grupo(regra)
+        try:
+            resultado = resultado_grupo(nome)
+        except TempoEsgotado:
+            log_timeout(f"{regra.get('descricao') or regra['chave']}: consulta do grupo {nome} "
+                        f"cancelada por tempo", chave=regra['chave'], grupo=nome)
+            continue
+        violacoes = resultado['valores'][regra['chave']]
+        tabela = regra['tabela']
+
+        if regra['tipo'] == 'duplicada':
+            # Na amostra, só aparecem duplicatas com as duas linhas sorteadas
+            ressalva = (" (chaves do lote)" if nome == 'duplicadas'
+                        else " (na amostra)" if amostrada(tabela) else "")
+            sufixo = ""
+        else:
+            ressalva, sufixo = "", estimativa(violacoes, tabela)
+        erro, sucesso = MENSAGENS[regra['tipo']]
+        campos = {'alvo': regra.get('descricao') or regra['chave'].split(':', 1)[1],
+                  'n': violacoes, 'ressalva': ressalva}
+        detalhes = {'chave': regra['chave'], 'violacoes': violacoes,
+                    'duracao_ms': resultado['duracao_ms'], 'grupo': nome}
+
+        if violacoes == 0:
+            log_success(regra.get('sucesso', sucesso).format(**campos) + sufixo, **detalhes)
+        elif regra['severidade'] == 'ERROR':
+            log_error(regra.get('erro', erro).format(**campos) + sufixo, **detalhes)
+        else:
+            log_warning(regra.get('erro', erro).format(**campos) + sufixo, **detalhes)
 
 # =====================================================
 # 🧪 VALIDAÇÕES DA CAMADA TRUSTED
@@ -59,229 +450,138 @@ def execute_query(query: str) -> List[Tuple]:
 
 def validate_table_counts():
     """1️⃣ Valida se as tabelas possuem dados"""
-    print("\n" + "="*60)
-    print("📊 VALIDAÇÃO 1: Contagem de Registros")
-    print("="*60)
+    cabecalho("📊 VALIDAÇÃO 1: Contagem de Registros")
     
-    tables = ['marca', 'produto', 'data', 'pedido', 'pedido_item', 'meta']
-    
-    for table in tables:
-        query = f"SELECT COUNT(*) FROM trusted.{table}"
-        result = execute_query(query)
-        count = result[0][0]
+    for table in TABELAS:
+        chave = f"contagem:{table}"
+        try:
+            count = perfil(table)['total']
+        except TempoEsgotado:
+            log_timeout(f"Tabela trusted.{table}: consulta do grupo perfil:{table} cancelada por tempo",
+                        chave=chave, grupo=f"perfil:{table}")
+            continue
+        
+        if lote is not None and table in TABELAS_LOTE and count > 0:
+            log_success(f"Tabela trusted.{table}: {count:,} registros no lote", chave=chave)
+            continue
+        if amostrada(table) and count > 0:
+            log_success(f"Tabela trusted.{table}: ~{count * 100 / amostra['pct']:,.0f} registros "
+                        f"(estimado por amostra de {count:,})", chave=chave)
+            continue
+        if amostrada(table) or (lote is not None and table in TABELAS_LOTE):
+            # Amostra ou lote sem linhas não prova tabela vazia
+            count = execute_query(f"SELECT COUNT(*) FROM (SELECT 1 FROM trusted.{table} LIMIT 10) t")[0][0]
+            if count > 0 and lote is not None:
+                log_success(f"Tabela trusted.{table}: nenhum registro no lote", chave=chave)
+                continue
         
         if count == 0:
-            log_error(f"Tabela trusted.{table} está VAZIA!")
+            log_error(f"Tabela trusted.{table} está VAZIA!", chave=chave)
         elif count < 10:
-            log_warning(f"Tabela trusted.{table} tem apenas {count} registros")
+            log_warning(f"Tabela trusted.{table} tem apenas {count} registros", chave=chave)
         else:
-            log_success(f"Tabela trusted.{table}: {count:,} registros")
+            log_success(f"Tabela trusted.{table}: {count:,} registros", chave=chave)
 
 def validate_foreign_keys():
     """2️⃣ Valida integridade referencial (FKs)"""
-    print("\n" + "="*60)
-    print("🔗 VALIDAÇÃO 2: Integridade Referencial")
-    print("="*60)
-    
-    fk_checks = {
-        "produto.id_marca → marca.id": """
-            SELECT COUNT(*) FROM trusted.produto p
-            LEFT JOIN trusted.marca m ON p.id_marca = m.id
-            WHERE m.id IS NULL
-        """,
-        "pedido.data → data.data": """
-            SELECT COUNT(*) FROM trusted.pedido p
-            LEFT JOIN trusted.data d ON p.data = d.data
-            WHERE d.data IS NULL
-        """,
-        "pedido_item.id_pedido → pedido.id": """
-            SELECT COUNT(*) FROM trusted.pedido_item i
-            LEFT JOIN trusted.pedido p ON i.id_pedido = p.id
-            WHERE p.id IS NULL
-        """,
-        "pedido_item.id_produto → produto.id": """
-            SELECT COUNT(*) FROM trusted.pedido_item i
-            LEFT JOIN trusted.produto pr ON i.id_produto = pr.id
-            WHERE pr.id IS NULL
-        """,
-        "meta.id_marca → marca.id": """
-            SELECT COUNT(*) FROM trusted.meta m
-            LEFT JOIN trusted.marca ma ON m.id_marca = ma.id
-            WHERE ma.id IS NULL
-        """
-    }
-    
-    for desc, query in fk_checks.items():
-        result = execute_query(query)
-        orphans = result[0][0]
-        
-        if orphans > 0:
-            log_error(f"FK violada: {desc} - {orphans} registros órfãos!")
-        else:
-            log_success(f"FK válida: {desc}")
+    cabecalho("🔗 VALIDAÇÃO 2: Integridade Referencial")
+    _validar_regras('fks')
 
 def validate_null_constraints():
     """3️⃣ Valida campos obrigatórios (NOT NULL)"""
-    print("\n" + "="*60)
-    print("🚫 VALIDAÇÃO 3: Campos Nulos em Colunas Obrigatórias")
-    print("="*60)
-    
-    null_checks = {
-        "marca.nome": "SELECT COUNT(*) FROM trusted.marca WHERE nome IS NULL",
-        "produto.nome": "SELECT COUNT(*) FROM trusted.produto WHERE nome IS NULL",
-        "produto.id_marca": "SELECT COUNT(*) FROM trusted.produto WHERE id_marca IS NULL",
-        "pedido.data": "SELECT COUNT(*) FROM trusted.pedido WHERE data IS NULL",
-        "pedido.vlr_total": "SELECT COUNT(*) FROM trusted.pedido WHERE vlr_total IS NULL",
-        "pedido_item.id_pedido": "SELECT COUNT(*) FROM trusted.pedido_item WHERE id_pedido IS NULL",
-        "pedido_item.id_produto": "SELECT COUNT(*) FROM trusted.pedido_item WHERE id_produto IS NULL",
-        "pedido_item.qtd_produto": "SELECT COUNT(*) FROM trusted.pedido_item WHERE qtd_produto IS NULL",
-        "data.ano": "SELECT COUNT(*) FROM trusted.data WHERE ano IS NULL",
-        "data.mes": "SELECT COUNT(*) FROM trusted.data WHERE mes IS NULL",
-    }
-    
-    for field, query in null_checks.items():
-        result = execute_query(query)
-        null_count = result[0][0]
-        
-        if null_count > 0:
-            log_error(f"Campo obrigatório {field} tem {null_count} valores NULL!")
-        else:
-            log_success(f"Campo {field} não possui valores NULL")
+    cabecalho("🚫 VALIDAÇÃO 3: Campos Nulos em Colunas Obrigatórias")
+    _validar_regras('nulos')
 
 def validate_data_ranges():
     """4️⃣ Valida ranges de valores"""
-    print("\n" + "="*60)
-    print("📏 VALIDAÇÃO 4: Ranges de Valores")
-    print("="*60)
-    
-    # Validar valores negativos
-    query = "SELECT COUNT(*) FROM trusted.pedido WHERE vlr_total < 0"
-    result = execute_query(query)
-    if result[0][0] > 0:
-        log_error(f"Existem {result[0][0]} pedidos com valor negativo!")
-    else:
-        log_success("Todos os pedidos têm valores positivos")
-    
-    # Validar quantidades
-    query = "SELECT COUNT(*) FROM trusted.pedido_item WHERE qtd_produto <= 0"
-    result = execute_query(query)
-    if result[0][0] > 0:
-        log_error(f"Existem {result[0][0]} itens com quantidade inválida!")
-    else:
-        log_success("Todas as quantidades são válidas")
-    
-    # Validar UFs
-    query = """
-        SELECT COUNT(*) FROM trusted.pedido 
-        WHERE sgl_uf_entrega IS NOT NULL 
-        AND sgl_uf_entrega !~ '^[A-Z]{2}$'
-    """
-    result = execute_query(query)
-    if result[0][0] > 0:
-        log_error(f"Existem {result[0][0]} UFs com formato inválido!")
-    else:
-        log_success("Todas as UFs estão no formato correto")
-    
-    # Validar mês
-    query = "SELECT COUNT(*) FROM trusted.data WHERE mes < 1 OR mes > 12"
-    result = execute_query(query)
-    if result[0][0] > 0:
-        log_error(f"Existem {result[0][0]} datas com mês inválido!")
-    else:
-        log_success("Todos os meses são válidos (1-12)")
+    cabecalho("📏 VALIDAÇÃO 4: Ranges de Valores")
+    _validar_regras('faixas')
 
 def validate_duplicates():
     """5️⃣ Valida duplicatas em PKs"""
-    print("\n" + "="*60)
-    print("🔍 VALIDAÇÃO 5: Duplicatas em Chaves Primárias")
-    print("="*60)
-    
-    duplicate_checks = {
-        "marca.id": """
-            SELECT id, COUNT(*) as cnt FROM trusted.marca 
-            GROUP BY id HAVING COUNT(*) > 1
-        """,
-        "produto.id": """
-            SELECT id, COUNT(*) as cnt FROM trusted.produto 
-            GROUP BY id HAVING COUNT(*) > 1
-        """,
-        "pedido.id": """
-            SELECT id, COUNT(*) as cnt FROM trusted.pedido 
-            GROUP BY id HAVING COUNT(*) > 1
-        """,
-        "pedido_item.id": """
-            SELECT id, COUNT(*) as cnt FROM trusted.pedido_item 
-            GROUP BY id HAVING COUNT(*) > 1
-        """,
-        "data.data": """
-            SELECT data, COUNT(*) as cnt FROM trusted.data 
-            GROUP BY data HAVING COUNT(*) > 1
-        """
-    }
-    
-    for field, query in duplicate_checks.items():
-        result = execute_query(query)
-        if len(result) > 0:
-            log_error(f"PK {field} tem {len(result)} valores duplicados!")
-        else:
-            log_success(f"PK {field} não possui duplicatas")
+    cabecalho("🔍 VALIDAÇÃO 5: Duplicatas em Chaves Primárias")
+    _validar_regras('duplicatas')
 
 def validate_business_rules():
     """6️⃣ Valida regras de negócio"""
-    print("\n" + "="*60)
-    print("💼 VALIDAÇÃO 6: Regras de Negócio")
-    print("="*60)
-    
-    # Validar se itens cancelados não contam no total do pedido
-    query = """
-        SELECT p.id, p.vlr_total,
-               SUM(CASE WHEN i.flg_cancelado = 'N' 
-                   THEN i.qtd_produto * i.vlr_unitario 
-                   ELSE 0 END) as calc_total
-        FROM trusted.pedido p
-        JOIN trusted.pedido_item i ON p.id = i.id_pedido
-        GROUP BY p.id, p.vlr_total
-        HAVING ABS(p.vlr_total - SUM(CASE WHEN i.flg_cancelado = 'N' 
-                                      THEN i.qtd_produto * i.vlr_unitario 
-                                      ELSE 0 END)) > 0.01
-        LIMIT 10
-    """
-    result = execute_query(query)
-    if len(result) > 0:
-        log_warning(f"Encontrados {len(result)} pedidos com divergência de valores")
-    else:
-        log_success("Valores dos pedidos estão consistentes com seus itens")
-    
-    # Validar se existem pedidos sem itens
-    query = """
-        SELECT COUNT(*) FROM trusted.pedido p
-        LEFT JOIN trusted.pedido_item i ON p.id = i.id_pedido
-        WHERE i.id IS NULL
-    """
-    result = execute_query(query)
-    if result[0][0] > 0:
-        log_warning(f"Existem {result[0][0]} pedidos sem itens")
-    else:
-        log_success("Todos os pedidos possuem itens")
+    cabecalho("💼 VALIDAÇÃO 6: Regras de Negócio")
+    _validar_regras('negocio')
 
 def validate_date_consistency():
     """7️⃣ Valida consistência de datas"""
+    cabecalho("📅 VALIDAÇÃO 7: Consistência de Datas")
+    _validar_regras('datas')
+
+# =====================================================
+# 🧩 Consolidação do lote com a última validação completa
+# =====================================================
+_SEVERIDADE = {"SUCCESS": 0, "WARNING": 1, "ERROR": 2}
+
+def consolidar_com_completa(coletor) -> int:
+    """
+    Junta as verificações por linha do lote às da última validação completa
+    (o pior status de cada uma). As violações aparecem separadas: o lote pode
+    conter linhas já contadas na última completa. Imprime as pendentes e
+    retorna a quantidade de erros consolidados.
+    """
     print("\n" + "="*60)
-    print("📅 VALIDAÇÃO 7: Consistência de Datas")
+    print("🧩 CONSOLIDADO: LOTE + ÚLTIMA VALIDAÇÃO COMPLETA")
     print("="*60)
-    
-    # Validar se ano, mes, dia batem com a data
-    query = """
-        SELECT COUNT(*) FROM trusted.data
-        WHERE EXTRACT(YEAR FROM data) != ano
-           OR EXTRACT(MONTH FROM data) != mes
-           OR EXTRACT(DAY FROM data) != dia
-    """
-    result = execute_query(query)
-    if result[0][0] > 0:
-        log_error(f"Existem {result[0][0]} datas inconsistentes!")
+
+    ultima = ultima_execucao('trusted')
+    if ultima is None:
+        print("⚠️  Nenhuma validação completa registrada: o consolidado considera só o lote.")
+        anteriores = {}
     else:
-        log_success("Todas as datas estão consistentes (ano, mês, dia)")
+        executado_em, anteriores = ultima
+        print(f"Última validação completa: {executado_em:%Y-%m-%d %H:%M:%S}")
+
+    atuais = {r["chave"]: r for r in coletor.resultados if r["chave"]}
+    erros = pendentes = 0
+    for chave in list(atuais) + [c for c in anteriores if c not in atuais]:
+        if not chave.startswith(VERIFICACOES_POR_LINHA):
+            continue
+        atual = atuais.get(chave, {"status": "SUCCESS", "violacoes": 0})
+        anterior = anteriores.get(chave, {"status": "SUCCESS", "violacoes": 0})
+        status = max(atual["status"], anterior["status"], key=lambda st: _SEVERIDADE.get(st, 0))
+        if status == "SUCCESS":
+            continue
+        pendentes += 1
+        erros += status == "ERROR"
+        simbolo = "❌" if status == "ERROR" else "⚠️ "
+        print(f"{simbolo} {chave}: lote {atual['violacoes'] or 0:,} | "
+              f"última completa {anterior['violacoes'] or 0:,} violação(ões)")
+
+    if pendentes == 0:
+        print("✅ Nenhum problema no lote nem pendente da última validação completa")
+    return erros
+
+# =====================================================
+# 📜 Registro de regras com custo e falhas (--regras)
+# =====================================================
+
+def listar_regras(execucoes: int = 30):
+    """Imprime as regras por grupo com o tempo e as falhas nas últimas validações completas"""
+    historico = historico_verificacoes('trusted', execucoes)
+    print("\n" + "="*60)
+    print(f"📜 REGRAS DA CAMADA TRUSTED (últimas {execucoes} validações completas)")
+    print("="*60)
+
+    grupos = {}
+    for regra in REGRAS:
+        grupos.setdefault(grupo(regra), []).append(regra)
+    for nome, regras in grupos.items():
+        print(f"\n📦 {nome}")
+        for regra in regras:
+            h = historico.get(regra['chave'])
+            if regra.get('ativa', True) is False:
+                situacao = "inativa"
+            elif h is None:
+                situacao = "sem histórico"
+            else:
+                situacao = (f"{h['duracao_media_ms'] or 0:,.0f} ms em média (máx. {h['duracao_max_ms'] or 0:,.0f}), "
+                            f"falhou em {h['falhas']} de {h['execucoes']}")
+            print(f"   {regra['chave']:<36} {regra['tipo']:<10} {regra['severidade']:<8} {situacao}")
 
 # =====================================================
 # 🏁 Execução principal
@@ -292,32 +592,58 @@ def main():
     print("🔬 VALIDAÇÕES DA CAMADA TRUSTED")
     print("="*60)
     print(f"Iniciado em: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    if amostra:
+        print(f"Modo: amostra {amostra['metodo']} {amostra['pct']}% (semente {amostra['semente']}) "
+              f"nas tabelas com ≥ {VALIDACAO_AMOSTRA_MIN_LINHAS:,} linhas")
+    if lote:
+        origem = f"lote {lote['id_log']} de log_ingestao, " if lote['id_log'] is not None else ""
+        print(f"Modo: lote ({origem}alterações de {lote['inicio'] or 'início'} até {lote['fim'] or 'agora'})")
     print("="*60)
     
-    # Executar todas as validações
-    validate_table_counts()
-    validate_foreign_keys()
-    validate_null_constraints()
-    validate_data_ranges()
-    validate_duplicates()
-    validate_business_rules()
-    validate_date_consistency()
+    # Executar todas as validações (em paralelo, saída na ordem abaixo)
+    coletor = executar_validacoes([
+        validate_table_counts,
+        validate_foreign_keys,
+        validate_null_constraints,
+        validate_data_ranges,
+        validate_duplicates,
+        validate_business_rules,
+        validate_date_consistency,
+    ])
     
     # Resumo final
     print("\n" + "="*60)
     print("📋 RESUMO DAS VALIDAÇÕES")
     print("="*60)
     
-    success_count = sum(1 for r in validation_results if r["status"] == "SUCCESS")
-    warning_count = sum(1 for r in validation_results if r["status"] == "WARNING")
-    error_count = sum(1 for r in validation_results if r["status"] == "ERROR")
+    success_count = coletor.contar("SUCCESS")
+    warning_count = coletor.contar("WARNING")
+    error_count = coletor.contar("ERROR")
+    timeout_count = coletor.contar("TIMEOUT")
     
     print(f"✅ Sucessos: {success_count}")
     print(f"⚠️  Avisos:   {warning_count}")
     print(f"❌ Erros:    {error_count}")
+    print(f"⏱️  Timeouts: {timeout_count}")
     print("="*60)
     
-    if error_count == 0:
+    escopo = 'lote' if lote else 'amostra' if amostra else 'completa'
+    try:
+        registrar_execucao(coletor, 'trusted', escopo, **({
+            'id_log_ingestao': lote['id_log'], 'janela_inicio': lote['inicio'], 'janela_fim': lote['fim']
+        } if lote else {}))
+    except Exception as e:
+        print(f"⚠️  Resultado não gravado em trusted.qualidade_dados: {str(e).splitlines()[0]}")
+    
+    if lote:
+        # Erros do lote ou ainda pendentes da última validação completa
+        error_count = consolidar_com_completa(coletor)
+    
+    if timeout_count > 0:
+        print(f"\n⏱️  ATENÇÃO: {timeout_count} validação(ões) cancelada(s) por tempo (VALIDACAO_TIMEOUT_MS ou timeout_ms das regras)!")
+        print("❌ Resultado incompleto: a camada não pôde ser totalmente verificada.")
+        return 1
+    elif error_count == 0:
         print("\n🎉 TODAS AS VALIDAÇÕES CRÍTICAS PASSARAM!")
         print("✅ Camada TRUSTED está íntegra e consistente.")
         return 0
@@ -327,6 +653,31 @@ def main():
         return 1
 
 if __name__ == '__main__':
-    exit_code = main()
+    parser = argparse.ArgumentParser(description='Validações da camada trusted')
+    parser.add_argument('--modo', choices=['exata', 'amostra'], default=VALIDACAO_MODO,
+                        help='exata (varre tudo) ou amostra (TABLESAMPLE nas tabelas grandes)')
+    parser.add_argument('--metodo', default=VALIDACAO_AMOSTRA_METODO, help='BERNOULLI ou SYSTEM')
+    parser.add_argument('--pct', type=float, default=VALIDACAO_AMOSTRA_PCT, help='Percentual amostrado')
+    parser.add_argument('--semente', default=VALIDACAO_AMOSTRA_SEMENTE, help='Semente do REPEATABLE')
+    parser.add_argument('--lote', type=int, help='Valida só as linhas do lote (id de trusted.log_ingestao)')
+    parser.add_argument('--desde', type=datetime.fromisoformat,
+                        help='Valida só as linhas alteradas depois de (AAAA-MM-DD[ HH:MM:SS])')
+    parser.add_argument('--ate', type=datetime.fromisoformat, help='Fim da janela de --desde (padrão: agora)')
+    parser.add_argument('--regras', action='store_true',
+                        help='Lista as regras com tempo e falhas das últimas validações completas e sai')
+    args = parser.parse_args()
+    if args.regras:
+        listar_regras()
+        exit(0)
+    if (args.lote is not None or args.desde) and args.modo == 'amostra':
+        parser.error("--lote/--desde não se combinam com --modo amostra")
+    configurar_amostra(args.modo, args.metodo, args.pct, args.semente)
+    if args.lote is not None or args.desde:
+        configurar_lote(args.lote, args.desde, args.ate)
+
+    try:
+        exit_code = main()
+    finally:
+        fechar_conexao()
     exit(exit_code)
 